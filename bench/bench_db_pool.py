@@ -0,0 +1,84 @@
+"""
+Benchmark: pool de conexões de db_access vs. uma conexão nova por query.
+
+Uso (a partir da raiz do projeto):
+    python bench/bench_db_pool.py [--rows 10000] [--queries 2000] [--threads 1 8]
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from model.db_access import close_pools, init_db, open_schema, query_run  # noqa: E402
+import config  # noqa: E402
+
+QUERIES = (
+    "SELECT quantity FROM products WHERE name = 'Product 42';",
+    "SELECT name, quantity FROM products WHERE quantity < 5 LIMIT 20;",
+    "SELECT COUNT(*) FROM products;",
+)
+
+
+def connect_per_call(db_name: str, query: str):
+    """Caminho antigo de query_run: abre e descarta uma conexão a cada query."""
+    with sqlite3.connect(db_name) as conn:
+        cursor = conn.cursor()
+        cursor.execute(query)
+        return cursor.fetchall()
+
+
+def build_database(db_name: str, rows: int):
+    init_db(db_name, open_schema(config.DB_SCHEMA_FILE))
+    with sqlite3.connect(db_name) as conn:
+        conn.executemany(
+            "INSERT OR IGNORE INTO products (name, quantity) VALUES (?, ?);",
+            ((f"Product {i}", i % 100) for i in range(rows)))
+        conn.commit()
+    conn.close()
+
+
+def run(func, db_name: str, total: int, threads: int) -> dict:
+    def timed(i: int) -> float:
+        start = time.perf_counter()
+        func(db_name, QUERIES[i % len(QUERIES)])
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        latencies = sorted(executor.map(timed, range(total)))
+    elapsed = time.perf_counter() - start
+    return {
+        "qps": total / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--queries", type=int, default=2_000)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 8])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        db_name = os.path.join(temp_dir, "bench.db")
+        build_database(db_name, args.rows)
+
+        print(f"{'mode':<18}{'threads':>8}{'qps':>12}{'p50 ms':>10}{'p95 ms':>10}")
+        for threads in args.threads:
+            for label, func in (("connect-per-call", connect_per_call), ("pool", query_run)):
+                result = run(func, db_name, args.queries, threads)
+                print(f"{label:<18}{threads:>8}{result['qps']:>12.0f}"
+                      f"{result['p50_ms']:>10.3f}{result['p95_ms']:>10.3f}")
+        close_pools()
+
+
+if __name__ == "__main__":
+    main()
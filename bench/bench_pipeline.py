@@ -0,0 +1,526 @@
+"""
+Benchmark de ponta a ponta do pipeline do bot, com catálogos sintéticos e
+bot/LLM falsos.
+
+Para cada tamanho de catálogo um banco `products` sintético é gerado e, em um
+processo separado (para isolar o pico de memória), são medidos:
+
+  - handle_ai_interaction completo e cada etapa dele (contexto de produtos,
+    ação da IA, query, formatação local, resumo, feedback/streaming);
+  - query_run direto, sem o LLM;
+  - opcionalmente, o caminho de voz: download, fila e transcrição reais do
+    Whisper sobre arquivos de áudio de teste, seguidos da interação com a IA.
+
+O LLM é substituído por um provedor falso no roteador (controller.router) e o
+Telegram por um bot falso, ambos com latência configurável. Com --ollama-host,
+o roteador usa o OllamaProvider de verdade contra servidores como o
+bench/stub_ollama.py. O resultado (p50/p95/p99 por etapa, vazão e pico de RSS)
+é impresso em JSON. Todas as mensagens do benchmark pedem dados do banco: se
+alguma não chegar à query, a execução falha em vez de medir outro caminho.
+
+Uso (a partir da raiz do projeto):
+    python bench/bench_pipeline.py [--sizes 10 1000 100000 1000000] [--messages 200]
+        [--concurrency 4] [--llm-latency 0.3] [--bot-latency 0.02] [--combined-answer]
+        [--ollama-host http://localhost:11500]
+        [--voice] [--whisper-model tiny] [--audio-dir pasta/] [--output resultado.json]
+
+Sem --audio-dir, os áudios são gerados na hora (tons sintéticos em WAV): eles
+medem a decodificação, a fila e o VAD, mas não a decodificação de fala; use
+gravações reais (OGG/WAV) em --audio-dir para medir a transcrição de fato.
+"""
+import argparse
+import functools
+import json
+import math
+import os
+import random
+import re
+import resource
+import shutil
+import sqlite3
+import struct
+import sys
+import tempfile
+import threading
+import time
+import wave
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_context
+from types import SimpleNamespace
+from typing import Dict, Iterator, List
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+sys.path.insert(0, SRC_DIR)
+
+ADJECTIVES = ("Red", "Blue", "Green", "Large", "Small", "Organic", "Fresh", "Frozen",
+              "Wireless", "Steel", "Wooden", "Premium", "Classic", "Mini", "Ultra")
+NOUNS = ("Apple", "Banana", "Mouse", "Keyboard", "Chair", "Table", "Milk", "Bread",
+         "Cheese", "Lamp", "Cable", "Bottle", "Notebook", "Pencil", "Onion", "Monitor")
+
+_UNITS_RE = re.compile(r"units of (.+) are in stock", re.IGNORECASE)
+
+
+# --- Dados sintéticos ---
+
+def product_name(number: int) -> str:
+    adjective = ADJECTIVES[number % len(ADJECTIVES)]
+    noun = NOUNS[(number // len(ADJECTIVES)) % len(NOUNS)]
+    return f"{adjective} {noun} {number}"
+
+
+def build_catalog(db_name: str, rows: int):
+    """Cria um banco com o schema do projeto e `rows` produtos sintéticos."""
+    from model.db_access import init_db, open_schema
+    import config
+
+    init_db(db_name, open_schema(config.DB_SCHEMA_FILE))
+    rng = random.Random(rows)
+    with sqlite3.connect(db_name) as conn:
+        # O schema já insere alguns produtos de exemplo
+        conn.execute("DELETE FROM products;")
+        conn.executemany(
+            "INSERT INTO products (name, quantity) VALUES (?, ?);",
+            ((product_name(i), rng.randint(0, 200)) for i in range(rows)))
+
+
+def request_mix(rows: int, count: int, seed: int = 42) -> List[str]:
+    """Pedidos de teste: na maioria sobre um produto, alguns agregados e listas."""
+    rng = random.Random(seed)
+    requests = []
+    for _ in range(count):
+        kind = rng.random()
+        if kind < 0.7:
+            requests.append(
+                f"How many units of {product_name(rng.randrange(rows))} are in stock?")
+        elif kind < 0.85:
+            requests.append("How many products are there?")
+        else:
+            requests.append("Which products have fewer than 5 units?")
+    return requests
+
+
+def write_tone(path: str, seconds: float, sample_rate: int = 16000):
+    """Grava um WAV mono com um sinal harmônico modulado (semelhante a voz)."""
+    with wave.open(path, "wb") as audio:
+        audio.setnchannels(1)
+        audio.setsampwidth(2)
+        audio.setframerate(sample_rate)
+        frames = bytearray()
+        for i in range(int(seconds * sample_rate)):
+            t = i / sample_rate
+            envelope = 0.5 + 0.5 * math.sin(2 * math.pi * 3 * t)
+            sample = envelope * (0.5 * math.sin(2 * math.pi * 140 * t)
+                                 + 0.3 * math.sin(2 * math.pi * 280 * t)
+                                 + 0.2 * math.sin(2 * math.pi * 420 * t))
+            frames += struct.pack("<h", int(sample * 12000))
+        audio.writeframes(bytes(frames))
+
+
+def audio_fixtures(audio_dir: str, workdir: str) -> List[SimpleNamespace]:
+    """Arquivos de áudio de --audio-dir ou, sem ele, tons de 3, 15 e 45 segundos."""
+    fixtures = []
+    if audio_dir:
+        for name in sorted(os.listdir(audio_dir)):
+            path = os.path.join(audio_dir, name)
+            if os.path.isfile(path):
+                with open(path, "rb") as f:
+                    data = f.read()
+                fixtures.append(SimpleNamespace(name=name, data=data, duration=0))
+        return fixtures
+
+    for seconds in (3, 15, 45):
+        path = os.path.join(workdir, f"tone_{seconds}s.wav")
+        write_tone(path, seconds)
+        with open(path, "rb") as f:
+            fixtures.append(SimpleNamespace(name=os.path.basename(path), data=f.read(),
+                                            duration=seconds))
+    return fixtures
+
+
+# --- Medição ---
+
+class Recorder:
+    """Guarda as durações por etapa (thread-safe)."""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float):
+        with self._lock:
+            self.samples[stage].append(seconds)
+
+    def wrap(self, module, attribute: str, stage: str = None):
+        """Substitui `module.attribute` por uma versão que mede cada chamada."""
+        function = getattr(module, attribute)
+        stage = stage or attribute
+
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.add(stage, time.perf_counter() - start)
+
+        setattr(module, attribute, timed)
+
+    def wrap_generator(self, module, attribute: str, stage: str = None):
+        """Como wrap, mas mede até o gerador ser consumido por completo."""
+        function = getattr(module, attribute)
+        stage = stage or attribute
+
+        @functools.wraps(function)
+        def timed(*args, **kwargs) -> Iterator:
+            start = time.perf_counter()
+            try:
+                yield from function(*args, **kwargs)
+            finally:
+                self.add(stage, time.perf_counter() - start)
+
+        setattr(module, attribute, timed)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        return {stage: summarize(values) for stage, values in sorted(self.samples.items())}
+
+
+def percentile(values: List[float], p: float) -> float:
+    ordered = sorted(values)
+    index = max(0, math.ceil(len(ordered) * p / 100) - 1)
+    return ordered[index]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(values),
+        "mean_ms": 1000 * sum(values) / len(values),
+        "p50_ms": 1000 * percentile(values, 50),
+        "p95_ms": 1000 * percentile(values, 95),
+        "p99_ms": 1000 * percentile(values, 99),
+        "max_ms": 1000 * max(values),
+    }
+
+
+def peak_rss_bytes() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss é em KiB no Linux e em bytes no macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+# --- Bot e LLM falsos ---
+
+class FakeBot:
+    """Implementa a parte da API do TeleBot usada por app.py, com latência fixa."""
+
+    def __init__(self, latency: float, audio: Dict[str, bytes] = None):
+        self.latency = latency
+        self.audio = audio or {}
+        self.calls: Dict[str, int] = defaultdict(int)
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def _call(self, method: str):
+        with self._lock:
+            self.calls[method] += 1
+            self._next_id += 1
+            message_id = self._next_id
+        if self.latency:
+            time.sleep(self.latency)
+        return message_id
+
+    def send_message(self, chat_id, text, **kwargs):
+        return SimpleNamespace(message_id=self._call("send_message"), chat=SimpleNamespace(id=chat_id),
+                               text=text)
+
+    def edit_message_text(self, text, chat_id, message_id, **kwargs):
+        self._call("edit_message_text")
+        return True
+
+    def get_file(self, file_id):
+        self._call("get_file")
+        return SimpleNamespace(file_id=file_id, file_path=file_id)
+
+    def download_file(self, file_path):
+        self._call("download_file")
+        return self.audio[file_path]
+
+
+class FakeProvider:
+    """
+    Provedor de IA falso para o roteador: responde com SQL plausível para os
+    pedidos de request_mix, após uma latência configurável (com variação).
+    Com `combined`, as perguntas de contagem e de estoque baixo recebem a ação
+    "database_answer", com o template da resposta.
+    """
+
+    def __init__(self, latency: float, jitter: float, chunk_interval: float,
+                 combined: bool = False, seed: int = 7):
+        self.name = "fake"
+        self.latency = latency
+        self.jitter = jitter
+        self.chunk_interval = chunk_interval
+        self.combined = combined
+        self.calls = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _sleep(self):
+        with self._lock:
+            self.calls += 1
+            delay = self.latency * self._rng.lognormvariate(0, self.jitter) if self.jitter else self.latency
+        if delay:
+            time.sleep(delay)
+
+    def generate_action(self, user_request: str, product_context: str) -> dict:
+        self._sleep()
+        match = _UNITS_RE.search(user_request)
+        if match:
+            name = match.group(1).replace("'", "''")
+            sql = f"SELECT quantity FROM products WHERE name = '{name}';"
+        elif "fewer than" in user_request:
+            sql = "SELECT name, quantity FROM products WHERE quantity < 5;"
+            if self.combined:
+                return {"action": "database_answer", "payload": sql,
+                        "template": "These products have fewer than 5 units: [[rows]]."}
+        elif "How many products" in user_request:
+            if self.combined:
+                return {"action": "database_answer",
+                        "payload": "SELECT COUNT(*) AS total FROM products;",
+                        "template": "There are [[total]] products in the catalog."}
+            sql = "SELECT COUNT(*) FROM products;"
+        else:
+            return {"action": "user_message", "payload": "I can only answer stock questions."}
+        return {"action": "database_query", "payload": sql}
+
+    def generate_feedback(self, original_query: str, db_result) -> str:
+        self._sleep()
+        return "Here is a summary of the products you asked about."
+
+    def stream_feedback(self, original_query: str, db_result) -> Iterator[str]:
+        self._sleep()
+        for word in "Here is a summary of the products you asked about.".split(" "):
+            if self.chunk_interval:
+                time.sleep(self.chunk_interval)
+            yield word + " "
+
+
+# --- Execução ---
+
+def run_size(rows: int, args: argparse.Namespace) -> dict:
+    """Executa o benchmark de um tamanho de catálogo (em um processo próprio)."""
+    import logging
+    logging.basicConfig(level=logging.WARNING)
+
+    import app
+    import config
+    from controller import router
+    from controller.action_cache import action_cache
+    from controller.result_formatter import path_counts
+    from model import db_access
+    from model.catalog import CatalogSnapshot
+
+    workdir = tempfile.mkdtemp(prefix="bench_pipeline_")
+    db_name = os.path.join(workdir, f"products_{rows}.db")
+
+    start = time.perf_counter()
+    build_catalog(db_name, rows)
+    build_seconds = time.perf_counter() - start
+
+    config.DB_NAME = db_name
+    config.FEEDBACK_STREAMING = args.streaming
+    config.FAST_PATH_ENABLED = not args.no_fast_path
+    app.application.catalog = CatalogSnapshot(db_name)
+    provider = FakeProvider(args.llm_latency, args.llm_jitter, args.chunk_interval,
+                            combined=args.combined_answer)
+    if args.ollama_host:
+        router.router.backends = [
+            router.Backend(router.create_provider("ollama", host), config.ROUTER_WINDOW_SIZE)
+            for host in args.ollama_host]
+    else:
+        router.router.backends = [router.Backend(provider, config.ROUTER_WINDOW_SIZE)]
+    action_cache.clear()
+
+    recorder = Recorder()
+    for attribute in ("get_product_context", "get_query_action", "query_stream",
+                      "quick_response", "digest_result", "feedback", "stream_to_message"):
+        recorder.wrap(app, attribute)
+    recorder.wrap_generator(app, "feedback_stream")
+
+    # O primeiro contexto constrói o snapshot e o índice do catálogo
+    start = time.perf_counter()
+    app.application.catalog.refresh()
+    catalog_seconds = time.perf_counter() - start
+
+    bot = FakeBot(args.bot_latency)
+    requests = request_mix(rows, args.messages)
+
+    def interact(item):
+        number, prompt = item
+        message = SimpleNamespace(chat=SimpleNamespace(id=number % args.chats))
+        start = time.perf_counter()
+        app.handle_ai_interaction(bot, message, prompt)
+        recorder.add("handle_ai_interaction", time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(interact, enumerate(requests)))
+    interaction_seconds = time.perf_counter() - start
+
+    # Uma ação inválida (ou um backend fora do ar) termina antes da query
+    queries = len(recorder.samples["query_stream"])
+    if queries != len(requests):
+        raise RuntimeError(
+            f"Only {queries} of {len(requests)} messages reached the database query; "
+            f"check the AI backends: {router.router.stats()}")
+
+    # Consultas diretas, como no comando /sql
+    direct_queries = [
+        f"SELECT quantity FROM products WHERE name = '{product_name(i % rows)}';"
+        for i in range(args.messages)
+    ] + ["SELECT COUNT(*) FROM products;", "SELECT name FROM products WHERE quantity < 5 LIMIT 20;"]
+    start = time.perf_counter()
+    for query in direct_queries:
+        query_start = time.perf_counter()
+        db_access.query_run(db_name, query)
+        recorder.add("query_run", time.perf_counter() - query_start)
+    query_run_seconds = time.perf_counter() - start
+
+    result = {
+        "rows": rows,
+        "db_bytes": os.path.getsize(db_name),
+        "build_seconds": build_seconds,
+        "catalog_refresh_seconds": catalog_seconds,
+        "throughput": {
+            "messages_per_second": len(requests) / interaction_seconds,
+            "query_run_per_second": len(direct_queries) / query_run_seconds,
+        },
+        "bot_calls": dict(bot.calls),
+        "llm_calls_per_message": None if args.ollama_host else provider.calls / len(requests),
+        "answer_paths": path_counts(),
+        "router": router.router.stats(),
+    }
+
+    if args.voice:
+        result["voice"] = run_voice(args, app, bot, recorder, workdir, rows)
+
+    result["stages"] = recorder.summary()
+    result["peak_rss_bytes"] = peak_rss_bytes()
+    db_access.close_pools()
+    shutil.rmtree(workdir, ignore_errors=True)
+    return result
+
+
+def run_voice(args, app, bot: FakeBot, recorder: Recorder, workdir: str, rows: int) -> dict:
+    """Caminho das mensagens de voz: download, fila, transcrição e interação."""
+    import config
+    from controller.transcription import TranscriptionService
+
+    fixtures = audio_fixtures(args.audio_dir, workdir)
+    bot.audio.update({fixture.name: fixture.data for fixture in fixtures})
+
+    service = TranscriptionService(
+        args.whisper_model, workers=config.TRANSCRIPTION_WORKERS,
+        cpu_threads=config.TRANSCRIPTION_CPU_THREADS,
+        queue_size=args.voice_messages, language=config.WHISPER_LANGUAGE,
+        beam_size=config.WHISPER_BEAM_SIZE, batch_size=config.WHISPER_BATCH_SIZE,
+        batched_min_duration=config.WHISPER_BATCHED_MIN_DURATION)
+    start = time.perf_counter()
+    service.start()
+    service.wait_ready()
+    load_seconds = time.perf_counter() - start
+
+    fallback_prompts = request_mix(rows, args.voice_messages, seed=99)
+
+    def voice_message(number: int):
+        fixture = fixtures[number % len(fixtures)]
+        message = SimpleNamespace(chat=SimpleNamespace(id=number % args.chats),
+                                  voice=SimpleNamespace(file_id=fixture.name,
+                                                        duration=fixture.duration))
+        start = time.perf_counter()
+        file_info = bot.get_file(message.voice.file_id)
+        audio = bot.download_file(file_info.file_path)
+        job, _ = service.submit(audio, duration=message.voice.duration)
+        transcription = job.result(timeout=config.TRANSCRIPTION_TIMEOUT)
+        recorder.add("voice.transcription_wait", time.perf_counter() - start)
+        recorder.add("voice.queue", transcription.queued_seconds)
+        recorder.add("voice.asr", transcription.transcribe_seconds)
+        # Os tons sintéticos não têm fala: usa um pedido de texto para seguir o pipeline
+        app.handle_ai_interaction(bot, message, transcription.text or fallback_prompts[number])
+        recorder.add("voice.end_to_end", time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(voice_message, range(args.voice_messages)))
+    voice_seconds = time.perf_counter() - start
+    service.stop()
+
+    return {
+        "fixtures": [{"name": f.name, "bytes": len(f.data), "duration": f.duration}
+                     for f in fixtures],
+        "model": args.whisper_model,
+        "model_load_seconds": load_seconds,
+        "messages_per_second": args.voice_messages / voice_seconds,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 100000, 1000000],
+                        help="Tamanhos do catálogo sintético (linhas em products)")
+    parser.add_argument("--messages", type=int, default=200,
+                        help="Mensagens de texto por tamanho de catálogo")
+    parser.add_argument("--concurrency", type=int, default=4,
+                        help="Mensagens processadas em paralelo (threads)")
+    parser.add_argument("--chats", type=int, default=50, help="Chats distintos simulados")
+    parser.add_argument("--llm-latency", type=float, default=0.3,
+                        help="Latência mediana do LLM falso, em segundos")
+    parser.add_argument("--llm-jitter", type=float, default=0.3,
+                        help="Desvio (lognormal) da latência do LLM falso")
+    parser.add_argument("--chunk-interval", type=float, default=0.01,
+                        help="Segundos entre os trechos do feedback em streaming")
+    parser.add_argument("--bot-latency", type=float, default=0.02,
+                        help="Latência de cada chamada à API do Telegram falsa")
+    parser.add_argument("--streaming", action=argparse.BooleanOptionalAction, default=True,
+                        help="Usa o feedback em streaming (config.FEEDBACK_STREAMING)")
+    parser.add_argument("--no-fast-path", action="store_true",
+                        help="Desativa a formatação local de resultados simples")
+    parser.add_argument("--combined-answer", action="store_true",
+                        help="O LLM falso responde com a ação database_answer (SQL + template)")
+    parser.add_argument("--ollama-host", nargs="+",
+                        help="Servidores Ollama (ex.: bench/stub_ollama.py) no lugar do LLM falso")
+    parser.add_argument("--voice", action="store_true", help="Mede também o caminho de voz")
+    parser.add_argument("--voice-messages", type=int, default=12)
+    parser.add_argument("--whisper-model", default="tiny")
+    parser.add_argument("--audio-dir", help="Pasta com gravações reais (OGG/WAV)")
+    parser.add_argument("--output", help="Arquivo JSON de saída (padrão: stdout)")
+    args = parser.parse_args()
+
+    results = {
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "python": sys.version.split()[0],
+        "cpu_count": os.cpu_count(),
+        "runs": [],
+    }
+    # Um processo por tamanho, para que o pico de RSS de um não contamine o outro
+    for rows in args.sizes:
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+            run = executor.submit(run_size, rows, args).result()
+        results["runs"].append(run)
+        e2e = run["stages"]["handle_ai_interaction"]
+        print(f"{rows:>9} rows: {run['throughput']['messages_per_second']:7.1f} msg/s, "
+              f"p50 {e2e['p50_ms']:7.1f} ms, p95 {e2e['p95_ms']:7.1f} ms, "
+              f"p99 {e2e['p99_ms']:7.1f} ms, peak RSS {run['peak_rss_bytes'] / 2**20:6.1f} MiB",
+              file=sys.stderr)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
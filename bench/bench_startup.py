@@ -0,0 +1,183 @@
+"""
+Benchmark da inicialização a frio do bot: tempo até o primeiro polling.
+
+Cada execução inicia um processo novo com `python -X importtime`, importa o
+app.py e chama app.main() com o polling do TeleBot substituído por um marcador
+que registra o instante e encerra o processo. São medidos:
+
+  - o tempo de parede desde o início do processo até o primeiro polling;
+  - quanto disso é o `import app` e quanto é a inicialização (main);
+  - os módulos mais caros segundo o -X importtime (tempo próprio e acumulado).
+
+O banco de dados é um arquivo temporário e o processo roda em uma pasta
+temporária, então o banco e o log de produção não são tocados. O resultado é
+impresso em JSON e o processo termina com código 1 se a mediana do tempo até
+o primeiro polling passar do orçamento (--budget).
+
+Uso (a partir da raiz do projeto):
+    python bench/bench_startup.py [--runs 5] [--budget 2.0] [--top 15]
+        [--preload | --no-preload] [--output resultado.json]
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+# Executado no processo medido; os marcadores vão para o stdout
+CHILD = r"""
+import sys
+import time
+
+import telebot
+
+
+def first_poll(self, *args, **kwargs):
+    print(f"FIRST_POLL {time.time()!r}", flush=True)
+    raise SystemExit(0)
+
+
+telebot.TeleBot.polling = first_poll
+telebot.TeleBot.infinity_polling = first_poll
+
+import config
+
+config.DB_NAME = sys.argv[1]
+config.TRANSCRIPTION_PRELOAD = sys.argv[2] == "1"
+
+start = time.perf_counter()
+import app
+
+print(f"IMPORT_APP {time.perf_counter() - start!r}", flush=True)
+start = time.perf_counter()
+try:
+    app.main()
+finally:
+    print(f"MAIN {time.perf_counter() - start!r}", flush=True)
+"""
+
+
+def parse_importtime(stderr: str) -> List[Dict]:
+    """Converte as linhas `import time: self | cumulative | módulo` em dicionários."""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+            entries.append({
+                "module": name.strip(),
+                # Cada nível de importação aninhada acrescenta dois espaços
+                "depth": (len(name) - len(name.lstrip()) - 1) // 2,
+                "self_ms": int(self_us) / 1000,
+                "cumulative_ms": int(cumulative_us) / 1000,
+            })
+        except ValueError:
+            continue
+    return entries
+
+
+def run_once(preload: bool, timeout: float) -> Dict:
+    """Inicia o bot em um processo novo e mede o tempo até o primeiro polling."""
+    workdir = tempfile.mkdtemp(prefix="bench_startup_")
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [SRC_DIR, env.get("PYTHONPATH")]))
+    env.setdefault("BOT_KEY", "bench-startup")
+    try:
+        started_at = time.time()
+        process = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", CHILD,
+             os.path.join(workdir, "products.db"), "1" if preload else "0"],
+            cwd=workdir, env=env, capture_output=True, text=True, timeout=timeout)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    markers = {}
+    for line in process.stdout.splitlines():
+        name, _, value = line.partition(" ")
+        if name in ("FIRST_POLL", "IMPORT_APP", "MAIN"):
+            markers[name] = float(value)
+    if "FIRST_POLL" not in markers:
+        errors = [line for line in process.stderr.splitlines()
+                  if not line.startswith("import time:")]
+        raise RuntimeError("The bot did not reach the first poll:\n" + "\n".join(errors[-20:]))
+
+    return {
+        "first_poll_ms": (markers["FIRST_POLL"] - started_at) * 1000,
+        "import_app_ms": markers["IMPORT_APP"] * 1000,
+        "main_ms": markers["MAIN"] * 1000,
+        "imports": parse_importtime(process.stderr),
+    }
+
+
+def top_modules(entries: List[Dict], key: str, count: int) -> List[Dict]:
+    ranked = sorted(entries, key=lambda entry: entry[key], reverse=True)[:count]
+    return [{"module": e["module"], "self_ms": e["self_ms"], "cumulative_ms": e["cumulative_ms"]}
+            for e in ranked]
+
+
+def main():
+    import config
+
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Inicializações medidas")
+    parser.add_argument("--budget", type=float, default=2.0,
+                        help="Orçamento, em segundos, para a mediana até o primeiro polling")
+    parser.add_argument("--top", type=int, default=15, help="Módulos listados no relatório")
+    parser.add_argument("--preload", action=argparse.BooleanOptionalAction,
+                        default=config.TRANSCRIPTION_PRELOAD,
+                        help="Carrega o Whisper em segundo plano (config.TRANSCRIPTION_PRELOAD)")
+    parser.add_argument("--timeout", type=float, default=120,
+                        help="Segundos antes de desistir de uma inicialização")
+    parser.add_argument("--output", help="Arquivo JSON de saída (padrão: stdout)")
+    args = parser.parse_args()
+
+    runs = [run_once(args.preload, args.timeout) for _ in range(args.runs)]
+    # O relatório de imports vem da execução mediana
+    median_run = sorted(runs, key=lambda run: run["first_poll_ms"])[len(runs) // 2]
+    first_poll = statistics.median(run["first_poll_ms"] for run in runs)
+
+    results = {
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "python": sys.version.split()[0],
+        "first_poll_ms": {
+            "median": first_poll,
+            "min": min(run["first_poll_ms"] for run in runs),
+            "max": max(run["first_poll_ms"] for run in runs),
+        },
+        "import_app_ms": statistics.median(run["import_app_ms"] for run in runs),
+        "main_ms": statistics.median(run["main_ms"] for run in runs),
+        "imports_total_ms": sum(
+            entry["cumulative_ms"] for entry in median_run["imports"] if entry["depth"] == 0),
+        "top_self": top_modules(median_run["imports"], "self_ms", args.top),
+        "top_cumulative": top_modules(median_run["imports"], "cumulative_ms", args.top),
+        "within_budget": first_poll <= args.budget * 1000,
+    }
+
+    print(f"first poll: median {first_poll:.0f} ms (budget {args.budget * 1000:.0f} ms), "
+          f"import app {results['import_app_ms']:.0f} ms, main {results['main_ms']:.0f} ms",
+          file=sys.stderr)
+    for entry in results["top_cumulative"]:
+        print(f"  {entry['cumulative_ms']:8.1f} ms  {entry['module']}", file=sys.stderr)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+    if not results["within_budget"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, SRC_DIR)
+    main()
@@ -0,0 +1,175 @@
+"""
+Reenvia atualizações do Telegram gravadas em JSON para o webhook local.
+
+Sem --url, o script sobe o próprio servidor do webhook (WebhookServer e
+ChatDispatcher) com um bot falso, que apenas registra as atualizações
+recebidas, sem enviar nada ao Telegram; ao final, confere que as atualizações
+de cada chat foram processadas na ordem enviada.
+
+Com --url, as atualizações vão para um bot de verdade: inicie-o com
+BOT_MODE=webhook e WEBHOOK_SECRET definidos (sem WEBHOOK_URL, para não
+registrar o webhook) e rode este script com o mesmo segredo. As respostas do
+bot vão então para a API real do Telegram, então os chats das atualizações
+gravadas precisam existir para que elas sejam entregues.
+
+Cada arquivo pode conter uma atualização ou uma lista delas. Os update_id são
+renumerados a cada repetição, como o Telegram faria com mensagens novas.
+
+Uso (a partir da raiz do projeto):
+    python bench/replay_updates.py bench/updates/sample_updates.json
+        [--repeat 10] [--concurrency 8] [--workers 4] [--handler-latency 0.05]
+    WEBHOOK_SECRET=segredo python bench/replay_updates.py bench/updates/sample_updates.json
+        --url http://127.0.0.1:8443/telegram
+"""
+import argparse
+import json
+import os
+import secrets
+import statistics
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def load_updates(paths: List[str]) -> List[Dict]:
+    updates = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        updates.extend(data if isinstance(data, list) else [data])
+    return updates
+
+
+def post(url: str, secret: str, update: Dict, timeout: float) -> Tuple[int, float]:
+    """Envia uma atualização e retorna o status HTTP e a latência em segundos."""
+    request = urllib.request.Request(
+        url, data=json.dumps(update).encode("utf-8"), method="POST",
+        headers={"Content-Type": "application/json", SECRET_HEADER: secret})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    return status, time.perf_counter() - start
+
+
+class StubBot:
+    """Bot falso: registra as atualizações processadas, por chat, sem enviar nada."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.processed: Dict[Any, List[int]] = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def process(self, update: Dict):
+        from controller.webhook import chat_key
+
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.processed[chat_key(update)].append(update["update_id"])
+
+
+def start_stub_server(bot: StubBot, secret: str, workers: int, queue_size: int):
+    """Sobe WebhookServer + ChatDispatcher com o bot falso, em uma porta livre."""
+    from controller.webhook import ChatDispatcher, WebhookServer
+
+    dispatcher = ChatDispatcher(bot.process, workers, queue_size)
+    dispatcher.start()
+    server = WebhookServer(("127.0.0.1", 0), "/telegram", secret, dispatcher)
+    threading.Thread(target=server.serve_forever, name="webhook-stub", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/telegram"
+
+
+def check_order(sent: List[Dict], results: List[Tuple[int, float]],
+                processed: Dict[Any, List[int]]) -> List[str]:
+    """Chats cujas atualizações aceitas (200) não foram processadas na ordem de envio."""
+    from controller.webhook import chat_key
+
+    expected: Dict[Any, List[int]] = defaultdict(list)
+    for update, (status, _) in zip(sent, results):
+        if status == 200:
+            expected[chat_key(update)].append(update["update_id"])
+    return [str(key) for key, ids in expected.items() if processed.get(key) != ids]
+
+
+def main():
+    import config
+
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="+", help="Arquivos JSON com as atualizações gravadas")
+    parser.add_argument("--url", help="Webhook de um bot em execução "
+                        f"(ex.: http://127.0.0.1:{config.WEBHOOK_PORT}{config.WEBHOOK_PATH}); "
+                        "sem ele, usa um servidor local com um bot falso")
+    parser.add_argument("--secret", default=config.WEBHOOK_SECRET,
+                        help="Token secreto (padrão: WEBHOOK_SECRET)")
+    parser.add_argument("--workers", type=int, default=config.WEBHOOK_WORKERS,
+                        help="Workers do servidor local")
+    parser.add_argument("--queue-size", type=int, default=config.WEBHOOK_QUEUE_SIZE,
+                        help="Fila do servidor local")
+    parser.add_argument("--handler-latency", type=float, default=0.0,
+                        help="Segundos que o bot falso leva em cada atualização")
+    parser.add_argument("--repeat", type=int, default=1, help="Vezes que as atualizações são enviadas")
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="POSTs simultâneos (a ordem por chat só é garantida com 1)")
+    parser.add_argument("--timeout", type=float, default=10)
+    args = parser.parse_args()
+
+    server = bot = None
+    if args.url is None:
+        args.secret = args.secret or secrets.token_urlsafe(16)
+        bot = StubBot(args.handler_latency)
+        server, args.url = start_stub_server(bot, args.secret, args.workers, args.queue_size)
+    elif not args.secret:
+        parser.error("informe o segredo com --secret ou WEBHOOK_SECRET")
+
+    recorded = load_updates(args.files)
+    base_id = int(time.time() * 1000)
+    updates = [dict(update, update_id=base_id + number)
+               for number, update in enumerate(recorded * args.repeat)]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(
+            lambda update: post(args.url, args.secret, update, args.timeout), updates))
+    elapsed = time.perf_counter() - start
+
+    report: Dict[str, Any] = {}
+    if server is not None:
+        server.shutdown()
+        server.server_close()
+        server.dispatcher.stop()
+        report["processed"] = sum(len(ids) for ids in bot.processed.values())
+        # Com POSTs simultâneos, a ordem de envio de um chat não é definida
+        if args.concurrency == 1:
+            report["out_of_order_chats"] = check_order(updates, results, bot.processed)
+
+    latencies = sorted(latency for _, latency in results)
+    report.update({
+        "updates": len(updates),
+        "status": dict(Counter(status for status, _ in results)),
+        "updates_per_second": len(updates) / elapsed,
+        "latency_ms": {
+            "p50": statistics.median(latencies) * 1000,
+            "p95": latencies[int(0.95 * (len(latencies) - 1))] * 1000,
+            "max": latencies[-1] * 1000,
+        },
+    })
+    print(json.dumps(report, indent=2))
+    if report.get("out_of_order_chats"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
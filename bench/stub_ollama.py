@@ -0,0 +1,104 @@
+"""
+Servidor HTTP que imita o endpoint /api/generate do Ollama, para testar o
+roteador de provedores (hedge e failover) sem um modelo de verdade.
+
+Uso (a partir da raiz do projeto):
+    python bench/stub_ollama.py --port 11500 --latency 0.2 --slow-rate 0.1 --slow-latency 3
+    python bench/stub_ollama.py --port 11501 --error-rate 0.3
+
+Depois aponte config.LLM_BACKENDS para os stubs, por exemplo:
+    [("ollama", "http://localhost:11500"), ("ollama", "http://localhost:11501")]
+"""
+import argparse
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ACTION_RESPONSE = json.dumps({
+    "action": "database_query",
+    "payload": "SELECT quantity FROM products WHERE name = 'Mouse';"
+})
+FEEDBACK_RESPONSE = "There are 42 units of Mouse in stock."
+
+
+def make_handler(args):
+    class StubHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *log_args):
+            if args.verbose:
+                super().log_message(format, *log_args)
+
+        def _send_json(self, status: int, body: dict):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            if self.path != "/api/generate":
+                self._send_json(404, {"error": "not found"})
+                return
+
+            latency = args.latency
+            if random.random() < args.slow_rate:
+                latency = args.slow_latency
+            time.sleep(latency)
+
+            if random.random() < args.error_rate:
+                self._send_json(500, {"error": "stub failure"})
+                return
+
+            # O prompt de ações tem instrução de sistema; o de feedback, não
+            text = ACTION_RESPONSE if request.get("system") else FEEDBACK_RESPONSE
+            model = request.get("model", "stub")
+            if not request.get("stream", True):
+                self._send_json(200, {"model": model, "response": text, "done": True})
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.end_headers()
+            for word in text.split(" "):
+                line = {"model": model, "response": word + " ", "done": False}
+                self.wfile.write((json.dumps(line) + "\n").encode())
+                self.wfile.flush()
+                time.sleep(args.chunk_interval)
+            done = {"model": model, "response": "", "done": True}
+            self.wfile.write((json.dumps(done) + "\n").encode())
+
+    return StubHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--latency", type=float, default=0.1,
+                        help="Segundos antes de responder")
+    parser.add_argument("--slow-rate", type=float, default=0.0,
+                        help="Fração das requisições que usam --slow-latency")
+    parser.add_argument("--slow-latency", type=float, default=3.0)
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="Fração das requisições que respondem HTTP 500")
+    parser.add_argument("--chunk-interval", type=float, default=0.02,
+                        help="Segundos entre os trechos em streaming")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(args))
+    print(f"Stub Ollama listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,106 +1,257 @@
-import os
+import atexit
+import functools
+import io
 import logging
-import tempfile
+import threading
 import telebot
 import config
 
 from config import BOT_KEY
-from typing import Dict, Any, List, Tuple, Union
-from faster_whisper import WhisperModel
+from typing import Callable, Dict, Any, Optional, Union
 
 try:
-    from controller.ai_ollama import get_query_action, feedback
-    from model.db_access import init_db, open_schema, query_run
+    from controller.router import get_query_action, feedback, feedback_stream, warm_up
+    from controller.action_schema import DATABASE_ANSWER, DATABASE_QUERY
+    from controller.result_formatter import fill_template, format_result
+    from controller.scheduler import (RequestScheduler, Superseded, check_superseded,
+                                      guard_stream)
+    from controller.transcription import QueueFullError, TranscriptionService
+    from controller.webhook import serve_webhook
+    from model.db_access import (init_db, open_schema, query_stream,
+                                 QueryError, QueryResult)
+    from model.result_digest import digest_result
+    from view.result_pages import (CSV_ACTION, first_page, parse_callback, result_csv,
+                                   result_pages, turn_page)
+    from view.streaming import stream_to_message
+    from model.catalog import CatalogSnapshot
+    from logging_setup import preview, setup_logging
+    from instrumentation import (dump_metrics, record_query_rows, record_scheduler_event,
+                                 record_stage, span, start_metrics_server, traced)
 except ImportError as e:
     print(f"Erro Crítico: Não foi possível importar um módulo necessário: {e}")
     exit()
 
 # --- Inicialização & Configuração ---
-
-# Configuração do logging
-logging.basicConfig(
-    level=logging.ERROR,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    datefmt='%d/%m/%Y %H:%M:%S',
-    handlers=[
-        logging.FileHandler('database_assistant.log', encoding='utf-8'),
-        logging.StreamHandler()  # ## MELHORIA: Adiciona log no console também
-    ]
-)
 logger = logging.getLogger(__name__)
 
-# Configuração do Modelo Whisper
-WHISPER_MODEL_SIZE = "small"
-WHISPER_PROCESSOR = None
-try:
-    logger.info(
-        f"Carregando Modelo Faster-Whisper ({WHISPER_MODEL_SIZE}) para CPU...")
-    # 'int8' é crucial para otimizar velocidade e RAM na CPU
-    WHISPER_PROCESSOR = WhisperModel(
-        WHISPER_MODEL_SIZE, device="cpu", compute_type="int8")
-except Exception as e:
-    logger.critical(f"Falha ao carregar o modelo Faster-Whisper: {e}")
-    exit()
 
-# Configuração do Banco de Dados
-logger.info("Iniciando o Assistente de Banco de Dados...")
-try:
-    schema_content = open_schema(config.DB_SCHEMA_FILE)
-    init_db(config.DB_NAME, schema_content)
-    logger.info("Banco de dados inicializado com sucesso.")
-except Exception as e:
-    logger.critical(f"Falha ao inicializar o banco de dados: {e}")
-    exit()
+class Application:
+    """
+    Estado do bot, criado sob demanda.
+
+    Importar este módulo não carrega modelos nem abre o banco de dados.
+    initialize() faz apenas o necessário para começar a receber mensagens
+    (logging, schema do banco, métricas); os modelos do Whisper são
+    carregados em segundo plano (config.TRANSCRIPTION_PRELOAD) ou na
+    primeira mensagem de voz, e os clientes das IAs na primeira chamada.
+    """
+
+    def __init__(self):
+        self.initialized = False
+        self._lock = threading.Lock()
+
+    @functools.cached_property
+    def transcription(self) -> TranscriptionService:
+        """Serviço de Transcrição (Whisper); os modelos são carregados em start()."""
+        return TranscriptionService(
+            config.WHISPER_MODEL_SIZE,
+            workers=config.TRANSCRIPTION_WORKERS,
+            cpu_threads=config.TRANSCRIPTION_CPU_THREADS,
+            queue_size=config.TRANSCRIPTION_QUEUE_SIZE,
+            language=config.WHISPER_LANGUAGE,
+            beam_size=config.WHISPER_BEAM_SIZE,
+            batch_size=config.WHISPER_BATCH_SIZE,
+            batched_min_duration=config.WHISPER_BATCHED_MIN_DURATION,
+            load_retry=config.TRANSCRIPTION_LOAD_RETRY,
+        )
+
+    @functools.cached_property
+    def catalog(self) -> CatalogSnapshot:
+        return CatalogSnapshot(config.DB_NAME)
+
+    @functools.cached_property
+    def scheduler(self) -> RequestScheduler:
+        """Limite por chat e substituição de solicitações obsoletas."""
+        return RequestScheduler(
+            config.SUPERSEDE_WINDOW, config.CHAT_RATE_LIMIT, config.CHAT_RATE_BURST)
+
+    def initialize(self):
+        """Prepara o bot para receber mensagens. Chamadas repetidas não têm efeito."""
+        with self._lock:
+            if self.initialized:
+                return
+            self.initialized = True
+
+        # Configuração do logging: gravado por uma thread própria, fora do caminho das mensagens
+        setup_logging()
+
+        # Configuração do Banco de Dados
+        logger.info("Iniciando o Assistente de Banco de Dados...")
+        try:
+            schema_content = open_schema(config.DB_SCHEMA_FILE)
+            init_db(config.DB_NAME, schema_content)
+            logger.info("Banco de dados inicializado com sucesso.")
+        except Exception as e:
+            logger.critical("Falha ao inicializar o banco de dados: %s", e)
+            exit()
+
+        # Carrega os modelos do Whisper sem atrasar o início do polling
+        if config.TRANSCRIPTION_PRELOAD:
+            logger.info(
+                "Carregando %s modelo(s) Faster-Whisper (%s) para CPU em segundo plano...",
+                config.TRANSCRIPTION_WORKERS, config.WHISPER_MODEL_SIZE)
+            self.transcription.start()
+
+        # Pré-aquece o modelo da IA em segundo plano, sem atrasar a inicialização
+        if config.OLLAMA_WARM_UP:
+            threading.Thread(target=warm_up, name="ollama-warm-up", daemon=True).start()
+
+        # Métricas: endpoint Prometheus local e, opcionalmente, dump em JSON ao sair
+        if config.METRICS_ENABLED:
+            try:
+                start_metrics_server(config.METRICS_HOST, config.METRICS_PORT)
+            except OSError as e:
+                logger.error("Não foi possível iniciar o endpoint de métricas: %s", e)
+        if config.METRICS_DUMP_FILE:
+            atexit.register(dump_metrics, config.METRICS_DUMP_FILE)
+
+
+application = Application()
 
 
 # --- Funções Auxiliares ---
-def get_product_context() -> str:
-    """Busca nomes de produtos no banco de dados para usar como contexto"""
+def get_product_context(user_request: str) -> str:
+    """Busca nomes de produtos relevantes no catálogo para usar como contexto"""
     try:
-        product_list_tuples: Union[List[Tuple[str]], str] = query_run(
-            config.DB_NAME, "SELECT name FROM products;")
-
-        if isinstance(product_list_tuples, list):
-            # Filtra itens vazios ou malformados com mais segurança
-            product_names = [
-                item[0] for item in product_list_tuples if item and isinstance(item[0], str)]
-            product_context = ", ".join(
-                product_names) if product_names else "Nenhum produto encontrado."
-        else:
-            product_context = "Nenhum produto encontrado."
-            logger.warning(
-                f"Não foi possível recuperar o contexto de produtos: {product_list_tuples}")
-
-        return product_context
+        product_context = application.catalog.context(user_request, config.PRODUCT_CONTEXT_TOP_K)
+        if product_context:
+            return product_context
+        if application.catalog.names:
+            return "Nenhum produto corresponde à solicitação."
+        return "Nenhum produto encontrado."
     except Exception as e:
-        logger.error(f"Erro ao buscar o contexto de produtos: {e}")
+        logger.error("Erro ao buscar o contexto de produtos: %s", e)
         return "Nenhum produto encontrado."
 
 
+def quick_response(sql_query: str, db_result: Union[QueryResult, str],
+                   template: Optional[str] = None) -> Optional[str]:
+    """
+    Formata localmente a resposta, dispensando a segunda chamada à IA: com o
+    template da ação "database_answer", se houver, ou com os formatos simples
+    de result_formatter.
+    """
+    if isinstance(db_result, str):
+        return None
+    if template:
+        answer = fill_template(template, db_result)
+        if answer is not None:
+            return answer
+    if not config.FAST_PATH_ENABLED:
+        return None
+    return format_result(sql_query, db_result, config.FAST_PATH_MAX_ROWS)
+
+
+RATE_LIMITED_MESSAGE = (
+    "🚦 Você está enviando mensagens rápido demais. "
+    "Aguarde alguns segundos e tente novamente.")
+
+
+def scheduled(bot: telebot.TeleBot) -> Callable:
+    """
+    Decorador dos handlers que chegam à IA: registra a mensagem no
+    escalonador, aplica o limite do chat e pula a mensagem se uma mais nova
+    já a substituiu. Os pontos de verificação do pipeline (check_superseded)
+    interrompem a mensagem se ela for substituída depois de começar.
+    """
+    def decorator(handler: Callable) -> Callable:
+        @functools.wraps(handler)
+        def wrapper(message):
+            scheduler = application.scheduler
+            ticket = scheduler.arrive(message.chat.id, message.message_id)
+            with scheduler.running(ticket):
+                if ticket.rate_limited:
+                    logger.info(
+                        "Mensagem do chat %s recusada pelo limite do chat.", message.chat.id)
+                    if ticket.notify:
+                        bot.send_message(message.chat.id, RATE_LIMITED_MESSAGE)
+                    return
+                if ticket.superseded:
+                    logger.info(
+                        "Mensagem %s do chat %s substituída por uma mais nova antes de começar; "
+                        "ignorada.", message.message_id, message.chat.id)
+                    record_scheduler_event("skipped")
+                    return
+                return handler(message)
+        return wrapper
+    return decorator
+
+
+def register_arrival(update: Dict[str, Any]):
+    """
+    No modo webhook, registra as mensagens no escalonador assim que entram na
+    fila do dispatcher: uma mensagem ainda na fila pode então ser substituída
+    por uma mais nova do mesmo chat. Atualizações recusadas com 503 (que o
+    Telegram reenvia) não são registradas.
+    """
+    message = update.get("message") or {}
+    text = message.get("text")
+    if "voice" in message or (text is not None and not text.startswith('/')):
+        application.scheduler.arrive(message["chat"]["id"], message["message_id"])
+
+
+PAGE_EXPIRED_MESSAGE = "⌛ Este resultado expirou. Execute a query novamente."
+
+
+def csv_caption(result: QueryResult) -> str:
+    caption = f"{len(result.rows)} linhas"
+    if result.truncated:
+        caption += f" (as primeiras de {result.total_rows})"
+    return caption
+
+
+QUEUE_FULL_MESSAGE = (
+    "🚦 Muitas mensagens de voz estão sendo transcritas agora. "
+    "Tente novamente em instantes.")
+
+
+def transcription_status(position: int, loading: bool = False) -> str:
+    """Mensagem de status da transcrição conforme a posição na fila."""
+    if loading:
+        return "⏳ Carregando o modelo de transcrição... A primeira mensagem de voz demora mais."
+    if position:
+        return f"⏳ Todos os transcritores estão ocupados. Sua mensagem é a {position}ª da fila."
+    return "🧠 Transcrevendo com Whisper (CPU)... Pode levar um momento."
+
+
+@traced("handle_ai_interaction")
 def handle_ai_interaction(bot: telebot.TeleBot, message, user_prompt: str):
     """
     Função principal para processar prompts do usuário (texto ou voz transcrita)
     e executar a ação correspondente da IA (query no BD ou mensagem direta).
     """
     chat_id = message.chat.id
-    logger.info(
-        f"Processando prompt: '{user_prompt}' para o chat ID {chat_id}")
+    logger.info("Processando prompt: '%s' para o chat ID %s", preview(user_prompt), chat_id)
 
     try:
+        check_superseded()
         bot.send_message(
             chat_id, "🧠 Entendi. Consultando a IA para determinar a melhor ação...")
 
         # 1. Injetar Contexto
-        product_context = get_product_context()
-        logger.info(f"Injetando contexto: [{product_context}]")
+        with span("product_context"):
+            product_context = get_product_context(user_prompt)
+        logger.info("Injetando contexto: [%s]", preview(product_context))
 
         # 2. Chamar a IA para determinar a ação
-        ia_action: Dict[str, Any] = get_query_action(
-            user_prompt, product_context)
+        with span("query_action"):
+            ia_action: Dict[str, Any] = get_query_action(
+                user_prompt, product_context)
+        check_superseded()
 
         # Validação robusta da resposta da IA
         if not isinstance(ia_action, dict) or "action" not in ia_action or "payload" not in ia_action:
-            logger.error(f"A resposta da IA está mal formatada: {ia_action}")
+            logger.error("A resposta da IA está mal formatada: %s", preview(ia_action))
             bot.send_message(
                 chat_id, "AI: Desculpe, não consegui processar a estrutura da resposta da IA. Tente novamente.")
             return
@@ -108,45 +259,75 @@ def handle_ai_interaction(bot: telebot.TeleBot, message, user_prompt: str):
         action_type = ia_action.get("action")
         payload = ia_action.get("payload")
 
-        if action_type == "database_query":
+        if action_type in (DATABASE_QUERY, DATABASE_ANSWER):
             sql_query = payload
 
             if not sql_query or not isinstance(sql_query, str):
                 logger.warning(
-                    f"A IA retornou uma ação de query com um payload inválido: {sql_query}")
+                    "A IA retornou uma ação de query com um payload inválido: %s", preview(sql_query))
                 bot.send_message(
                     chat_id, "AI: Desculpe, não consegui gerar uma consulta SQL válida.")
                 return
 
             # 3. Executar a Query
-            logger.info(f"Ação da IA: Executar Query -> {sql_query}")
+            logger.info("Ação da IA: Executar Query -> %s", sql_query)
             bot.send_message(
                 chat_id, f"🔍 Query gerada:\n`{sql_query}`", parse_mode='Markdown')
 
-            db_result = query_run(config.DB_NAME, sql_query)
-            logger.info(f"Resultado do BD: {db_result}")
+            with span("query"):
+                db_result = query_stream(config.DB_NAME, sql_query)
+            if not isinstance(db_result, str):
+                record_query_rows(db_result.total_rows)
+            check_superseded()
+
+            # Resultados simples são descritos localmente, sem chamar a IA
+            with span("quick_response"):
+                quick_answer = quick_response(sql_query, db_result, ia_action.get("template"))
+            if quick_answer:
+                logger.info("Resposta formatada localmente: %s", preview(quick_answer))
+                bot.send_message(chat_id, f"AI: {quick_answer}")
+                return
 
-            bot.send_message(
-                chat_id, "📝 Gerando a resposta final com base nos resultados...")
+            if isinstance(db_result, str):
+                result_summary = db_result
+            else:
+                # Resume o resultado dentro do orçamento de tokens do prompt
+                with span("digest"):
+                    result_summary = digest_result(
+                        db_result, config.FEEDBACK_TOKEN_BUDGET, config.FEEDBACK_PREVIEW_ROWS)
+            logger.info("Resultado do BD: %s", preview(result_summary))
 
             # 4. Obter a Resposta Final
-            final_response = feedback(sql_query, db_result)
-            bot.send_message(
-                chat_id, f"AI: {final_response}")
+            if config.FEEDBACK_STREAMING:
+                # A mensagem de status é editada à medida que a IA gera o texto
+                with span("feedback"):
+                    stream_to_message(
+                        bot, chat_id, guard_stream(feedback_stream(sql_query, result_summary)),
+                        placeholder="📝 Gerando a resposta final com base nos resultados...")
+            else:
+                bot.send_message(
+                    chat_id, "📝 Gerando a resposta final com base nos resultados...")
+                with span("feedback"):
+                    final_response = feedback(sql_query, result_summary)
+                bot.send_message(
+                    chat_id, f"AI: {final_response}")
 
         elif action_type == "user_message":
-            logger.info(f"Ação da IA: Mensagem para o usuário -> {payload}")
+            logger.info("Ação da IA: Mensagem para o usuário -> %s", preview(payload))
             bot.send_message(chat_id, f"AI: {payload}")
 
         else:
             logger.warning(
-                f"Ação desconhecida recebida da IA: {action_type}. Payload: {payload}")
+                "Ação desconhecida recebida da IA: %s. Payload: %s", action_type, preview(payload))
             bot.send_message(
                 chat_id, "AI: Desculpe, não entendi a ação que preciso executar.")
 
+    except Superseded:
+        # Uma mensagem mais nova do mesmo chat está sendo respondida
+        logger.info("Interação do chat %s interrompida: substituída por uma mais nova.", chat_id)
+        record_scheduler_event("cancelled")
     except Exception as e:
-        logger.exception(
-            f"Ocorreu um erro inesperado durante a interação com a IA: {e}")
+        logger.exception("Ocorreu um erro inesperado durante a interação com a IA: %s", e)
         bot.send_message(
             chat_id, "Ocorreu um erro crítico ao processar sua solicitação. Verifique os logs.")
 
@@ -157,12 +338,24 @@ def main():
         logger.critical("A chave do bot (BOT_KEY) não está definida. Encerrando.")
         return
 
-    bot = telebot.TeleBot(BOT_KEY)
+    webhook = config.BOT_MODE == "webhook"
+    if config.BOT_MODE not in ("polling", "webhook"):
+        logger.critical("BOT_MODE inválido: '%s'. Use 'polling' ou 'webhook'.", config.BOT_MODE)
+        return
+    if webhook and not config.WEBHOOK_SECRET:
+        logger.critical("O modo webhook exige o WEBHOOK_SECRET. Encerrando.")
+        return
+
+    application.initialize()
+
+    # No modo webhook os handlers rodam nos workers do dispatcher, que
+    # garantem a ordem das mensagens de cada chat
+    bot = telebot.TeleBot(BOT_KEY, threaded=not webhook)
 
     @bot.message_handler(commands=['start', 'help'])
     def send_welcome(message):
         """Lida com os comandos /start e /help."""
-        logger.info(f'Recebido comando help/start do usuário {message.chat.id}')
+        logger.info("Recebido comando help/start do usuário %s", message.chat.id)
         bot.send_message(
             message.chat.id,
             "Olá! Eu sou o Assistente de Banco de Dados. Envie sua pergunta "
@@ -181,85 +374,132 @@ def main():
 
             sql_command = parts[1].strip()
 
-            logger.info(f"Recebido comando SQL direto: {sql_command}")
-            db_result = query_run(config.DB_NAME, sql_command)
+            logger.info("Recebido comando SQL direto: %s", preview(sql_command))
+            db_result = query_stream(config.DB_NAME, sql_command, config.SQL_RESULT_MAX_ROWS)
 
-            # Formata a resposta para ser mais legível
-            if db_result:
-                response_text = f'Resultado da query:\n```\n{db_result}\n```'
+            if isinstance(db_result, QueryError):
+                bot.send_message(message.chat.id, f'Query recusada (`{db_result.code}`):\n```\n{db_result}\n```',
+                                 parse_mode='Markdown')
+            elif db_result.total_rows:
+                # Tabela paginada; as outras páginas vêm do cache, sem repetir a query
+                text, markup = first_page(message.chat.id, sql_command, db_result)
+                bot.send_message(message.chat.id, text, parse_mode='HTML', reply_markup=markup)
             else:
-                response_text = 'Query executada com sucesso, mas não retornou resultados.'
-
-            # Limita o tamanho da mensagem para evitar erros do Telegram
-            if len(response_text) > 4096:
-                response_text = response_text[:4090] + "\n...`"
-
-            bot.send_message(message.chat.id, response_text,
-                             parse_mode='Markdown')
+                bot.send_message(message.chat.id,
+                                 'Query executada com sucesso, mas não retornou resultados.')
 
         except Exception as e:
-            logger.error(f"Erro ao executar SQL direto: {e}")
+            logger.error("Erro ao executar SQL direto: %s", e)
             bot.send_message(message.chat.id, f'Erro ao executar a query: `{e}`', parse_mode='Markdown')
 
+    @bot.callback_query_handler(func=lambda call: parse_callback(call.data) is not None)
+    def sql_result_page(call):
+        """Botões de página e de CSV dos resultados do /sql."""
+        token, action = parse_callback(call.data)
+        chat_id = call.message.chat.id
+        entry = result_pages.get(chat_id, token)
+        if entry is None:
+            bot.answer_callback_query(call.id, PAGE_EXPIRED_MESSAGE, show_alert=True)
+            return
+        try:
+            if action == CSV_ACTION:
+                bot.send_document(chat_id, io.BytesIO(result_csv(entry.result)),
+                                  visible_file_name="resultado.csv",
+                                  caption=csv_caption(entry.result))
+            else:
+                text, markup = turn_page(entry, token, int(action))
+                bot.edit_message_text(text, chat_id, call.message.message_id,
+                                      parse_mode='HTML', reply_markup=markup)
+        except Exception as e:
+            logger.error("Erro ao exibir a página do resultado: %s", e)
+        finally:
+            bot.answer_callback_query(call.id)
+
     @bot.message_handler(content_types=['voice'])
+    @scheduled(bot)
+    @traced("handle_voice_prompts")
     def handle_voice_prompts(message):
         """Lida com mensagens de voz, transcrevendo-as antes de processar."""
         chat_id = message.chat.id
 
-        # Garante que o modelo de ASR foi carregado
-        if WHISPER_PROCESSOR is None:
-            logger.error("O modelo Whisper não está disponível.")
-            bot.send_message(chat_id, "Desculpe, o serviço de transcrição de áudio não está operacional.")
-            return
-
         try:
             bot.send_message(chat_id, "🎙️ Mensagem de voz recebida! Iniciando a transcrição local...")
 
-            with tempfile.TemporaryDirectory() as temp_dir:
+            with span("voice.download"):
                 file_info = bot.get_file(message.voice.file_id)
 
                 if not file_info.file_path:
                     raise FileNotFoundError('Caminho do arquivo não disponível para download.')
 
+                # O áudio é decodificado em memória, sem arquivos temporários
                 downloaded_file = bot.download_file(file_info.file_path)
-                ogg_path = os.path.join(
-                    temp_dir, f"{message.voice.file_unique_id}.ogg")
-
-                with open(ogg_path, 'wb') as new_file:
-                    new_file.write(downloaded_file)
-
-                logger.info(f"Áudio baixado para: {ogg_path}")
-
-                bot.send_message(chat_id, "🧠 Transcrevendo com Whisper (CPU)... Pode levar um momento.")
+            logger.info(
+                "Áudio baixado: %s bytes, %ss", len(downloaded_file), message.voice.duration)
+
+            try:
+                job, position = application.transcription.submit(
+                    downloaded_file, duration=message.voice.duration or 0)
+            except QueueFullError as e:
+                logger.warning("Mensagem de voz rejeitada: %s", e)
+                bot.send_message(chat_id, QUEUE_FULL_MESSAGE)
+                return
 
-                segments, _ = WHISPER_PROCESSOR.transcribe(ogg_path, language="en", vad_filter=True)
+            bot.send_message(chat_id, transcription_status(
+                position, loading=not application.transcription.ready))
 
-                transcription = " ".join([segment.text for segment in segments]).strip()
+            with span("voice.transcription"):
+                result = job.result(timeout=config.TRANSCRIPTION_TIMEOUT)
+            record_stage("voice.queue", result.queued_seconds)
+            record_stage("voice.asr", result.transcribe_seconds)
+            transcription = result.text
 
-                if transcription:
-                    bot.send_message(
-                        chat_id, f"✅ **Transcrição:**\n_{transcription}_",
-                        parse_mode='Markdown'
-                    )
-                    # 3. Processar com a IA (lógica unificada)
-                    handle_ai_interaction(bot, message, transcription)
-                else:
-                    bot.send_message(chat_id, "Desculpe, não consegui extrair texto do áudio. Tente falar mais claramente.")
+            if transcription:
+                bot.send_message(
+                    chat_id, f"✅ **Transcrição:**\n_{transcription}_",
+                    parse_mode='Markdown'
+                )
+                # 3. Processar com a IA (lógica unificada)
+                handle_ai_interaction(bot, message, transcription)
+            else:
+                bot.send_message(chat_id, "Desculpe, não consegui extrair texto do áudio. Tente falar mais claramente.")
 
         except Exception as e:
-            logger.exception(f"Erro ao processar a mensagem de voz: {e}")
+            logger.exception("Erro ao processar a mensagem de voz: %s", e)
             bot.send_message(
                 chat_id, "Ocorreu um erro ao processar sua mensagem de voz. Verifique os logs."
             )
 
     @bot.message_handler(func=lambda message: message.text is not None and not message.text.startswith('/'))
+    @scheduled(bot)
     def handle_all_text_prompts(message):
         """Lida com todas as mensagens de texto que não são comandos."""
         handle_ai_interaction(bot, message, message.text)
 
+    if webhook:
+        run_webhook(bot)
+        return
+
     logger.info('Bot iniciado com sucesso, aguardando mensagens...')
     bot.polling(non_stop=True) # Reiniciar automaticamente em caso de erros.
 
 
+def run_webhook(bot: telebot.TeleBot):
+    """Registra o webhook (se WEBHOOK_URL estiver definida) e recebe as atualizações."""
+    if config.WEBHOOK_URL:
+        bot.set_webhook(url=config.WEBHOOK_URL, secret_token=config.WEBHOOK_SECRET)
+        logger.info("Webhook registrado no Telegram: %s", config.WEBHOOK_URL)
+    else:
+        logger.info("WEBHOOK_URL não definida: o webhook não foi registrado no Telegram.")
+
+    logger.info('Bot iniciado com sucesso (webhook), aguardando mensagens...')
+    try:
+        serve_webhook(
+            bot, config.WEBHOOK_HOST, config.WEBHOOK_PORT, config.WEBHOOK_PATH,
+            config.WEBHOOK_SECRET, config.WEBHOOK_WORKERS, config.WEBHOOK_QUEUE_SIZE,
+            on_update=register_arrival)
+    except KeyboardInterrupt:
+        logger.info("Servidor do webhook encerrado.")
+
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,372 @@
+"""
+Runtime assíncrono do bot (AsyncTeleBot + clientes assíncronos de LLM).
+
+Alternativa ao `app.py` para muitas conversas simultâneas: uma geração lenta
+do LLM não bloqueia os outros usuários. O número de interações em andamento é
+limitado por config.ASYNC_MAX_CONCURRENT_REQUESTS e as mensagens de um mesmo
+chat são processadas na ordem em que chegaram. O trabalho com o SQLite roda em
+threads separadas e a transcrição no serviço de transcrição.
+
+Uso: python src/app_async.py
+"""
+import asyncio
+import functools
+import io
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict
+
+from telebot.async_telebot import AsyncTeleBot
+
+import config
+from app import (logger, application, get_product_context, quick_response,
+                 PAGE_EXPIRED_MESSAGE, QUEUE_FULL_MESSAGE, RATE_LIMITED_MESSAGE,
+                 csv_caption, transcription_status)
+from controller.action_schema import DATABASE_ANSWER, DATABASE_QUERY
+from controller.transcription import QueueFullError
+from controller.router import (get_query_action_async, feedback_async,
+                               feedback_stream_async)
+from controller.scheduler import Superseded, check_superseded, guard_stream_async
+from instrumentation import (record_query_rows, record_scheduler_event, record_stage, span,
+                             traced)
+from logging_setup import preview
+from model.db_access import QueryError, query_stream
+from model.result_digest import digest_result
+from view.result_pages import (CSV_ACTION, first_page, parse_callback, result_csv,
+                               result_pages, turn_page)
+from view.streaming import stream_to_message_async
+
+# Threads dedicadas ao SQLite, para não bloquear o event loop
+db_executor = ThreadPoolExecutor(
+    max_workers=config.ASYNC_DB_THREADS, thread_name_prefix="sqlite")
+
+
+class ChatScheduler:
+    """
+    Limita a concorrência global e garante a ordem das mensagens por chat.
+
+    Cada chat tem um asyncio.Lock (FIFO), então as mensagens de um chat
+    são processadas uma de cada vez e na ordem de chegada, enquanto chats
+    diferentes avançam em paralelo até o limite global.
+    """
+
+    def __init__(self, max_concurrent: int):
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._users: Dict[int, int] = defaultdict(int)
+
+    @asynccontextmanager
+    async def slot(self, chat_id: int) -> AsyncIterator[None]:
+        lock = self._locks.setdefault(chat_id, asyncio.Lock())
+        self._users[chat_id] += 1
+        try:
+            async with lock:
+                async with self._semaphore:
+                    yield
+        finally:
+            self._users[chat_id] -= 1
+            # Descarta o lock quando o chat não tem mais mensagens pendentes
+            if not self._users[chat_id]:
+                del self._users[chat_id]
+                self._locks.pop(chat_id, None)
+
+
+def scheduled_async(bot: AsyncTeleBot) -> Callable:
+    """
+    Versão assíncrona de app.scheduled. A mensagem é registrada antes de
+    esperar pelo ChatScheduler, então uma mensagem ainda na fila do chat é
+    pulada quando outra mais nova chega.
+    """
+    def decorator(handler: Callable) -> Callable:
+        @functools.wraps(handler)
+        async def wrapper(message):
+            scheduler = application.scheduler
+            ticket = scheduler.arrive(message.chat.id, message.message_id)
+            with scheduler.running(ticket):
+                if ticket.rate_limited:
+                    logger.info(
+                        "Mensagem do chat %s recusada pelo limite do chat.", message.chat.id)
+                    if ticket.notify:
+                        await bot.send_message(message.chat.id, RATE_LIMITED_MESSAGE)
+                    return
+                try:
+                    check_superseded()
+                    return await handler(message)
+                except Superseded:
+                    # O handler verifica de novo ao sair da fila do chat (ChatScheduler),
+                    # antes de começar; depois disso a interrupção conta como "cancelled"
+                    logger.info(
+                        "Mensagem %s do chat %s substituída por uma mais nova antes de começar; "
+                        "ignorada.", message.message_id, message.chat.id)
+                    record_scheduler_event("skipped")
+        return wrapper
+    return decorator
+
+
+async def run_db(func, *args):
+    """Executa uma função de acesso ao banco no pool de threads do SQLite."""
+    return await asyncio.get_running_loop().run_in_executor(db_executor, func, *args)
+
+
+@traced("handle_ai_interaction")
+async def handle_ai_interaction(bot: AsyncTeleBot, message, user_prompt: str):
+    """Versão assíncrona de app.handle_ai_interaction."""
+    chat_id = message.chat.id
+    logger.info("Processando prompt: '%s' para o chat ID %s", preview(user_prompt), chat_id)
+
+    try:
+        check_superseded()
+        await bot.send_message(
+            chat_id, "🧠 Entendi. Consultando a IA para determinar a melhor ação...")
+
+        # 1. Injetar Contexto
+        with span("product_context"):
+            product_context = await run_db(get_product_context, user_prompt)
+        logger.info("Injetando contexto: [%s]", preview(product_context))
+
+        # 2. Chamar a IA para determinar a ação
+        with span("query_action"):
+            ia_action: Dict[str, Any] = await get_query_action_async(
+                user_prompt, product_context)
+        check_superseded()
+
+        # Validação robusta da resposta da IA
+        if not isinstance(ia_action, dict) or "action" not in ia_action or "payload" not in ia_action:
+            logger.error("A resposta da IA está mal formatada: %s", preview(ia_action))
+            await bot.send_message(
+                chat_id, "AI: Desculpe, não consegui processar a estrutura da resposta da IA. Tente novamente.")
+            return
+
+        action_type = ia_action.get("action")
+        payload = ia_action.get("payload")
+
+        if action_type in (DATABASE_QUERY, DATABASE_ANSWER):
+            sql_query = payload
+
+            if not sql_query or not isinstance(sql_query, str):
+                logger.warning(
+                    "A IA retornou uma ação de query com um payload inválido: %s", preview(sql_query))
+                await bot.send_message(
+                    chat_id, "AI: Desculpe, não consegui gerar uma consulta SQL válida.")
+                return
+
+            # 3. Executar a Query
+            logger.info("Ação da IA: Executar Query -> %s", sql_query)
+            await bot.send_message(
+                chat_id, f"🔍 Query gerada:\n`{sql_query}`", parse_mode='Markdown')
+
+            with span("query"):
+                db_result = await run_db(query_stream, config.DB_NAME, sql_query)
+            if not isinstance(db_result, str):
+                record_query_rows(db_result.total_rows)
+            check_superseded()
+
+            # Resultados simples são descritos localmente, sem chamar a IA
+            with span("quick_response"):
+                quick_answer = quick_response(sql_query, db_result, ia_action.get("template"))
+            if quick_answer:
+                logger.info("Resposta formatada localmente: %s", preview(quick_answer))
+                await bot.send_message(chat_id, f"AI: {quick_answer}")
+                return
+
+            if isinstance(db_result, str):
+                result_summary = db_result
+            else:
+                with span("digest"):
+                    result_summary = digest_result(
+                        db_result, config.FEEDBACK_TOKEN_BUDGET, config.FEEDBACK_PREVIEW_ROWS)
+            logger.info("Resultado do BD: %s", preview(result_summary))
+
+            # 4. Obter a Resposta Final
+            if config.FEEDBACK_STREAMING:
+                # A mensagem de status é editada à medida que a IA gera o texto
+                with span("feedback"):
+                    await stream_to_message_async(
+                        bot, chat_id,
+                        guard_stream_async(feedback_stream_async(sql_query, result_summary)),
+                        placeholder="📝 Gerando a resposta final com base nos resultados...")
+            else:
+                await bot.send_message(
+                    chat_id, "📝 Gerando a resposta final com base nos resultados...")
+                with span("feedback"):
+                    final_response = await feedback_async(sql_query, result_summary)
+                await bot.send_message(
+                    chat_id, f"AI: {final_response}")
+
+        elif action_type == "user_message":
+            logger.info("Ação da IA: Mensagem para o usuário -> %s", preview(payload))
+            await bot.send_message(chat_id, f"AI: {payload}")
+
+        else:
+            logger.warning(
+                "Ação desconhecida recebida da IA: %s. Payload: %s", action_type, preview(payload))
+            await bot.send_message(
+                chat_id, "AI: Desculpe, não entendi a ação que preciso executar.")
+
+    except Superseded:
+        # Uma mensagem mais nova do mesmo chat está sendo respondida
+        logger.info("Interação do chat %s interrompida: substituída por uma mais nova.", chat_id)
+        record_scheduler_event("cancelled")
+    except Exception as e:
+        logger.exception("Ocorreu um erro inesperado durante a interação com a IA: %s", e)
+        await bot.send_message(
+            chat_id, "Ocorreu um erro crítico ao processar sua solicitação. Verifique os logs.")
+
+
+# --- Handlers do Telegram ---
+def create_bot() -> AsyncTeleBot:
+    bot = AsyncTeleBot(config.BOT_KEY)
+    scheduler = ChatScheduler(config.ASYNC_MAX_CONCURRENT_REQUESTS)
+
+    @bot.message_handler(commands=['start', 'help'])
+    async def send_welcome(message):
+        """Lida com os comandos /start e /help."""
+        logger.info("Recebido comando help/start do usuário %s", message.chat.id)
+        await bot.send_message(
+            message.chat.id,
+            "Olá! Eu sou o Assistente de Banco de Dados. Envie sua pergunta "
+            "sobre os produtos por texto ou mensagem de voz. "
+            "Use /sql seguido de um comando para executar SQL diretamente."
+        )
+
+    @bot.message_handler(commands=['sql'])
+    async def direct_sql(message):
+        """Lida com a execução direta de comandos SQL."""
+        try:
+            parts = message.text.split(maxsplit=1)
+            if len(parts) < 2 or not parts[1].strip():
+                await bot.send_message(message.chat.id, "Por favor, forneça um comando SQL após /sql. Ex: `/sql SELECT * FROM products`", parse_mode='Markdown')
+                return
+
+            sql_command = parts[1].strip()
+
+            logger.info("Recebido comando SQL direto: %s", preview(sql_command))
+            async with scheduler.slot(message.chat.id):
+                db_result = await run_db(
+                    query_stream, config.DB_NAME, sql_command, config.SQL_RESULT_MAX_ROWS)
+
+            if isinstance(db_result, QueryError):
+                await bot.send_message(
+                    message.chat.id, f'Query recusada (`{db_result.code}`):\n```\n{db_result}\n```',
+                    parse_mode='Markdown')
+            elif db_result.total_rows:
+                text, markup = first_page(message.chat.id, sql_command, db_result)
+                await bot.send_message(message.chat.id, text, parse_mode='HTML', reply_markup=markup)
+            else:
+                await bot.send_message(
+                    message.chat.id, 'Query executada com sucesso, mas não retornou resultados.')
+
+        except Exception as e:
+            logger.error("Erro ao executar SQL direto: %s", e)
+            await bot.send_message(message.chat.id, f'Erro ao executar a query: `{e}`', parse_mode='Markdown')
+
+    @bot.callback_query_handler(func=lambda call: parse_callback(call.data) is not None)
+    async def sql_result_page(call):
+        """Botões de página e de CSV dos resultados do /sql."""
+        token, action = parse_callback(call.data)
+        chat_id = call.message.chat.id
+        entry = result_pages.get(chat_id, token)
+        if entry is None:
+            await bot.answer_callback_query(call.id, PAGE_EXPIRED_MESSAGE, show_alert=True)
+            return
+        try:
+            if action == CSV_ACTION:
+                await bot.send_document(chat_id, io.BytesIO(result_csv(entry.result)),
+                                        visible_file_name="resultado.csv",
+                                        caption=csv_caption(entry.result))
+            else:
+                text, markup = turn_page(entry, token, int(action))
+                await bot.edit_message_text(text, chat_id, call.message.message_id,
+                                            parse_mode='HTML', reply_markup=markup)
+        except Exception as e:
+            logger.error("Erro ao exibir a página do resultado: %s", e)
+        finally:
+            await bot.answer_callback_query(call.id)
+
+    @bot.message_handler(content_types=['voice'])
+    @scheduled_async(bot)
+    @traced("handle_voice_prompts")
+    async def handle_voice_prompts(message):
+        """Lida com mensagens de voz, transcrevendo-as antes de processar."""
+        chat_id = message.chat.id
+
+        async with scheduler.slot(chat_id):
+            check_superseded()
+            try:
+                await bot.send_message(chat_id, "🎙️ Mensagem de voz recebida! Iniciando a transcrição local...")
+
+                with span("voice.download"):
+                    file_info = await bot.get_file(message.voice.file_id)
+
+                    if not file_info.file_path:
+                        raise FileNotFoundError('Caminho do arquivo não disponível para download.')
+
+                    # O áudio é decodificado em memória, sem arquivos temporários
+                    downloaded_file = await bot.download_file(file_info.file_path)
+                logger.info(
+                    "Áudio baixado: %s bytes, %ss", len(downloaded_file), message.voice.duration)
+
+                try:
+                    job, position = application.transcription.submit(
+                        downloaded_file, duration=message.voice.duration or 0)
+                except QueueFullError as e:
+                    logger.warning("Mensagem de voz rejeitada: %s", e)
+                    await bot.send_message(chat_id, QUEUE_FULL_MESSAGE)
+                    return
+
+                await bot.send_message(chat_id, transcription_status(
+                    position, loading=not application.transcription.ready))
+
+                with span("voice.transcription"):
+                    result = await asyncio.wait_for(
+                        asyncio.wrap_future(job), config.TRANSCRIPTION_TIMEOUT)
+                record_stage("voice.queue", result.queued_seconds)
+                record_stage("voice.asr", result.transcribe_seconds)
+                transcription = result.text
+
+                if transcription:
+                    await bot.send_message(
+                        chat_id, f"✅ **Transcrição:**\n_{transcription}_",
+                        parse_mode='Markdown'
+                    )
+                    # 3. Processar com a IA (lógica unificada)
+                    await handle_ai_interaction(bot, message, transcription)
+                else:
+                    await bot.send_message(chat_id, "Desculpe, não consegui extrair texto do áudio. Tente falar mais claramente.")
+
+            except Exception as e:
+                logger.exception("Erro ao processar a mensagem de voz: %s", e)
+                await bot.send_message(
+                    chat_id, "Ocorreu um erro ao processar sua mensagem de voz. Verifique os logs."
+                )
+
+    @bot.message_handler(func=lambda message: message.text is not None and not message.text.startswith('/'))
+    @scheduled_async(bot)
+    async def handle_all_text_prompts(message):
+        """Lida com todas as mensagens de texto que não são comandos."""
+        async with scheduler.slot(message.chat.id):
+            # Substituída enquanto esperava a vez do chat: pulada sem começar
+            check_superseded()
+            await handle_ai_interaction(bot, message, message.text)
+
+    return bot
+
+
+async def main():
+    if not config.BOT_KEY:
+        logger.critical("A chave do bot (BOT_KEY) não está definida. Encerrando.")
+        return
+
+    application.initialize()
+    bot = create_bot()
+    logger.info('Bot assíncrono iniciado com sucesso, aguardando mensagens...')
+    try:
+        await bot.infinity_polling()
+    finally:
+        await bot.close_session()
+        db_executor.shutdown(wait=False)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
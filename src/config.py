@@ -13,19 +13,153 @@ load_dotenv(os.path.join(BASE_DIR, '.env'))
 # --- Configurações do Banco de Dados ---
 DB_NAME = os.path.join(BASE_DIR, "products.db")
 DB_SCHEMA_FILE = os.path.join(BASE_DIR, "src", "model", "schema.sql")
+DB_POOL_SIZE = 4  # Conexões de leitura mantidas abertas
+DB_STATEMENT_CACHE_SIZE = 128  # Prepared statements reaproveitados por conexão
+DB_MMAP_SIZE = 64 * 1024 * 1024  # Bytes mapeados em memória por conexão
+DB_CACHE_SIZE = -16 * 1024  # Cache de páginas por conexão (negativo = KiB)
+QUERY_MAX_ROWS = 50  # Linhas mantidas em memória por resultado de query da IA
+QUERY_FETCH_BATCH = 500  # Linhas lidas por fetchmany ao contar o restante
 
 
+# --- Configurações da Ação Gerada pela IA (controller/action_schema.py) ---
+AI_STRUCTURED_OUTPUT = True  # Restringe a resposta ao JSON Schema da ação (format / response_schema)
+AI_COMBINED_ANSWER = False  # Permite a ação "database_answer": SQL + template da resposta, em uma chamada
+
 # --- Configurações da IA (Google Gemini) ---
 API_KEY = os.getenv("API_KEY")
 BOT_KEY = os.getenv("BOT_KEY")
 MODEL_NAME = "gemini-2.5-flash"
 PROMPT_QUERY_GENERATION_FILE = os.path.join(
     BASE_DIR, "prompts", "generate_query.prompt")
+# Seção acrescentada ao prompt acima com AI_COMBINED_ANSWER: regras e exemplos do template
+PROMPT_COMBINED_ANSWER_FILE = os.path.join(
+    BASE_DIR, "prompts", "database_answer.prompt")
 PROMPT_FEEDBACK_ANALYSIS_FILE = os.path.join(
     BASE_DIR, "prompts", "analyse_result.prompt")
+PROMPT_RELOAD_INTERVAL = 2.0  # Segundos entre verificações de alteração dos prompts
 
 # --- Configurações da IA (Ollama) ---
 OLLAMA_MODEL = "gemma3:4b"
+OLLAMA_KEEP_ALIVE = "30m"  # Mantém o modelo (e o cache do prefixo) carregado
+OLLAMA_WARM_UP = True  # Pré-processa a parte estática do prompt na inicialização
+OLLAMA_HOST = os.getenv("OLLAMA_HOST")  # None usa o servidor local padrão
+
+# --- Configurações do Roteador de Provedores de IA ---
+# Backends em ordem de preferência: ("ollama", host) ou ("google", None).
+# Ex.: [("ollama", "http://localhost:11434"), ("ollama", "http://gpu2:11434"), ("google", None)]
+LLM_BACKENDS = [("ollama", OLLAMA_HOST)]
+ROUTER_WINDOW_SIZE = 100  # Chamadas recentes consideradas em latência e taxa de erro
+ROUTER_HEDGE_PERCENTILE = 95  # Dispara o próximo backend após este percentil de latência
+ROUTER_HEDGE_MIN_DELAY = 0.5  # Segundos mínimos antes de um hedge
+ROUTER_HEDGE_DEFAULT_DELAY = 5.0  # Atraso do hedge enquanto não há amostras
+ROUTER_ERROR_RATE_THRESHOLD = 0.5  # Acima disso o backend vai para o fim da fila
+
+# --- Configurações do Resumo de Resultados ---
+# Orçamento aproximado de tokens do resultado enviado ao feedback() da IA
+FEEDBACK_TOKEN_BUDGET = 600
+FEEDBACK_PREVIEW_ROWS = 20  # Linhas exibidas no resumo, no máximo
+
+# Resultados simples (vazio, um valor, listas curtas) são descritos localmente,
+# sem a segunda chamada à IA
+FAST_PATH_ENABLED = True
+FAST_PATH_MAX_ROWS = 10
+
+# --- Configurações do Streaming de Respostas ---
+FEEDBACK_STREAMING = True  # Edita a mensagem à medida que a IA gera o texto
+STREAM_EDIT_INTERVAL = 1.0  # Segundos mínimos entre edições da mensagem
+STREAM_EDIT_MIN_CHARS = 24  # Caracteres novos mínimos para uma nova edição
+
+# --- Configurações do Contexto de Produtos ---
+# Número máximo de produtos injetados no prompt. Catálogos maiores passam por
+# uma busca que seleciona apenas os produtos relevantes para a solicitação.
+PRODUCT_CONTEXT_TOP_K = 20
+
+# --- Configurações do Cache de Ações da IA ---
+ACTION_CACHE_SIZE = 512  # Número máximo de ações em memória
+ACTION_CACHE_TTL = 6 * 60 * 60  # Segundos até uma ação expirar
+ACTION_CACHE_PERSIST = False  # Persiste o cache em um arquivo SQLite auxiliar
+ACTION_CACHE_FILE = os.path.join(BASE_DIR, "action_cache.db")
+
+# --- Configurações da Transcrição (Whisper) ---
+WHISPER_MODEL_SIZE = "small"  # tiny, base, small, medium, large-v3...
+WHISPER_LANGUAGE = "en"  # None para detectar o idioma automaticamente
+WHISPER_BEAM_SIZE = 5
+# Notas de voz com pelo menos esta duração (segundos) usam a transcrição em
+# lote (BatchedInferencePipeline). None desativa o modo em lote.
+WHISPER_BATCHED_MIN_DURATION = 30
+WHISPER_BATCH_SIZE = 8
+TRANSCRIPTION_WORKERS = 2  # Workers, cada um com o seu modelo carregado
+TRANSCRIPTION_CPU_THREADS = 2  # Threads do CTranslate2 por worker
+TRANSCRIPTION_QUEUE_SIZE = 8  # Mensagens aguardando além das em processamento
+TRANSCRIPTION_TIMEOUT = 300  # Segundos de espera por uma transcrição
+# Carrega os modelos em segundo plano ao iniciar; False: na primeira mensagem de voz
+TRANSCRIPTION_PRELOAD = True
+TRANSCRIPTION_LOAD_RETRY = 60  # Segundos até tentar carregar de novo os modelos após uma falha
+
+# --- Configurações do Comando /sql (view/result_pages.py) ---
+SQL_RESULT_MAX_ROWS = 1000  # Linhas mantidas por resultado, navegáveis e incluídas no CSV
+SQL_PAGE_ROWS = 20  # Linhas por página
+SQL_CELL_MAX_WIDTH = 24  # Caracteres por célula da tabela antes de cortar
+SQL_PAGE_CACHE_TTL = 15 * 60  # Segundos em que os botões de página continuam funcionando
+SQL_PAGE_CACHE_MAX_BYTES = 16 * 1024 * 1024  # Tamanho total estimado dos resultados navegáveis
+SQL_PAGE_CACHE_PER_CHAT = 5  # Resultados navegáveis por chat
+
+# --- Configurações do Escalonador de Solicitações (controller/scheduler.py) ---
+SUPERSEDE_WINDOW = 10.0  # Segundos em que uma nova mensagem do chat substitui a anterior; 0 desativa
+CHAT_RATE_LIMIT = 0.2  # Fichas por segundo repostas no balde de cada chat
+CHAT_RATE_BURST = 5  # Solicitações seguidas permitidas a cada chat
+
+# --- Configurações do Recebimento de Mensagens (app.py) ---
+BOT_MODE = os.getenv("BOT_MODE", "polling")  # "polling" ou "webhook"
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # URL pública registrada no Telegram; None não registra
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")  # Obrigatório no modo webhook
+WEBHOOK_HOST = "127.0.0.1"  # Endereço local do servidor (atrás de um proxy HTTPS)
+WEBHOOK_PORT = 8443
+WEBHOOK_PATH = "/telegram"
+WEBHOOK_WORKERS = 8  # Threads que processam as atualizações
+WEBHOOK_QUEUE_SIZE = 256  # Atualizações aguardando antes de responder 503 ao Telegram
+
+# --- Configurações do Runtime Assíncrono (app_async.py) ---
+ASYNC_MAX_CONCURRENT_REQUESTS = 16  # Interações processadas ao mesmo tempo
+ASYNC_DB_THREADS = 4  # Threads dedicadas às consultas no SQLite
+
+# --- Configurações do Logging (logging_setup.py) ---
+LOG_LEVEL = "ERROR"  # Nível do logger raiz
+LOG_LEVELS = {}  # Níveis por logger, ex.: {"model.db_access": "DEBUG", "controller.router": "INFO"}
+LOG_FILE = "database_assistant.log"  # None desativa o arquivo
+LOG_CONSOLE = True
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+LOG_DATEFMT = '%d/%m/%Y %H:%M:%S'
+LOG_QUEUE_SIZE = 10_000  # Registros aguardando gravação antes de descartar novos
+LOG_PREVIEW_CHARS = 500  # Tamanho máximo do texto de resultados, contextos e respostas nos logs
+LOG_DEBUG_SAMPLING = {}  # Fração dos registros DEBUG mantida por logger, ex.: {"model.db_access": 0.01}
+
+# --- Configurações de Métricas (instrumentation.py) ---
+METRICS_ENABLED = True  # Serve as métricas em formato Prometheus em /metrics
+METRICS_HOST = "127.0.0.1"  # Apenas local; use "0.0.0.0" para coleta externa
+METRICS_PORT = 9464
+METRICS_DUMP_FILE = None  # Ex.: "metrics.json" para gravar as métricas ao encerrar
 
 # --- Configurações de Segurança ---
 ALLOWED_QUERY_STARTERS = ("select",)
+
+# --- Configurações do Limite de Custo das Queries (db_access) ---
+QUERY_GUARD_ENABLED = True  # Inspeciona o plano e limita a execução das queries
+QUERY_TIMEOUT = 3.0  # Segundos de execução antes de interromper a query
+QUERY_MAX_VM_STEPS = 50_000_000  # Instruções da VM do SQLite por query
+QUERY_PROGRESS_STEPS = 1000  # Instruções entre as verificações de orçamento e tempo
+QUERY_MAX_OUTPUT_ROWS = 100_000  # Linhas que uma query pode produzir
+QUERY_FULL_SCAN_MAX_ROWS = 1_000_000  # Tabelas maiores não podem ser varridas inteiras
+QUERY_CARTESIAN_MAX_ROWS = 1_000_000  # Limite do produto das tabelas varridas em um join
+
+# --- Configurações do Registro de Queries e do Consultor de Índices ---
+QUERY_LOG_ENABLED = True  # Registra as queries executadas (texto, duração e plano)
+QUERY_LOG_FILE = os.path.join(BASE_DIR, "query_log.db")
+QUERY_LOG_MAX_ENTRIES = 50_000  # Entradas mantidas; as mais antigas são apagadas
+QUERY_LOG_QUEUE_SIZE = 1000  # Entradas aguardando gravação antes de descartar novas
+INDEX_ADVISOR_MIN_QUERIES = 3  # Execuções de um formato de query antes de sugerir índice
+
+# --- Configurações do Cache de Resultados das Queries (db_access) ---
+QUERY_CACHE_ENABLED = True  # Reaproveita resultados enquanto o banco não mudar
+QUERY_CACHE_MAX_BYTES = 32 * 1024 * 1024  # Tamanho total estimado dos resultados em cache
+QUERY_CACHE_MAX_ENTRY_BYTES = 1024 * 1024  # Resultados maiores não são guardados
@@ -0,0 +1,296 @@
+"""
+Cache das ações geradas pela IA em get_query_action.
+
+Perguntas repetidas ("how many apples do you have?") são respondidas sem uma
+nova chamada ao LLM, independentemente do usuário que perguntou. A chave
+combina a solicitação normalizada com a versão do catálogo usada no prompt,
+então uma mudança nos produtos invalida naturalmente as entradas antigas.
+
+Os acertos, falhas e descartes são contados em bot_action_cache_total. A
+persistência opcional em SQLite é gravada por uma thread própria, em lotes,
+fora do caminho das mensagens.
+"""
+import functools
+import hashlib
+import inspect
+import json
+import logging
+import queue
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import config
+from controller.scheduler import SingleFlight
+from instrumentation import record_action_cache
+from logging_setup import preview
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_TRAILING_PUNCTUATION = " ?!.;,"
+
+
+def normalize_request(user_request: str) -> str:
+    """Normaliza a solicitação para que variações triviais usem a mesma chave."""
+    text = unicodedata.normalize("NFKC", user_request).casefold()
+    text = _WHITESPACE_RE.sub(" ", text)
+    return text.strip(_TRAILING_PUNCTUATION)
+
+
+def catalog_version(product_context: str) -> str:
+    """
+    Gera um identificador curto e estável para o contexto de produtos.
+
+    O catálogo completo (model.catalog.ProductContext) já traz a versão do
+    snapshot; só os contextos curtos (resultado da busca e mensagens de
+    fallback) passam pelo hash.
+    """
+    version = getattr(product_context, "version", None)
+    if version:
+        return version
+    return hashlib.sha1(product_context.encode("utf-8")).hexdigest()[:16]
+
+
+class ActionCache:
+    """
+    Cache LRU com expiração (TTL) para as ações retornadas pela IA.
+
+    Opcionalmente persiste as entradas em um arquivo SQLite auxiliar, para
+    que reinicializações do bot não percam o cache. As gravações vão para uma
+    fila e são confirmadas em lote por uma thread própria.
+    """
+
+    def __init__(self, max_size: int, ttl: float, persist_file: Optional[str] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._writes: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        if persist_file:
+            self._open_sidecar(persist_file)
+
+    @staticmethod
+    def make_key(user_request: str, version: str) -> str:
+        return f"{version}:{normalize_request(user_request)}"
+
+    def get(self, user_request: str, version: str) -> Optional[Dict[str, Any]]:
+        """Retorna uma cópia da ação em cache ou None se não houver."""
+        key = self.make_key(user_request, version)
+        with self._lock:
+            entry = self._entries.get(key)
+            expired = entry is not None and time.time() - entry[0] > self.ttl
+            if expired:
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                action = dict(entry[1])
+        if expired:
+            record_action_cache("expired")
+        if entry is None:
+            record_action_cache("miss")
+            return None
+        record_action_cache("hit")
+        return action
+
+    def put(self, user_request: str, version: str, action: Dict[str, Any]):
+        """Armazena a ação, descartando as entradas menos usadas se necessário."""
+        key = self.make_key(user_request, version)
+        created_at = time.time()
+        evicted = 0
+        with self._lock:
+            self._entries[key] = (created_at, dict(action))
+            self._entries.move_to_end(key)
+            self._write("put", key, created_at, dict(action))
+            while len(self._entries) > self.max_size:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                evicted += 1
+        for _ in range(evicted):
+            record_action_cache("eviction")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._write("clear")
+
+    def flush(self):
+        """Aguarda a gravação das alterações já enfileiradas no arquivo auxiliar."""
+        if self._writer is not None:
+            self._writes.join()
+
+    def close(self):
+        if self._writer is not None:
+            self._writes.put(None)
+            self._writer.join()
+            self._writer = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores de acertos e falhas do cache."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+    # --- Persistência (SQLite auxiliar) ---
+
+    def _open_sidecar(self, persist_file: str):
+        try:
+            self._conn = sqlite3.connect(persist_file, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS action_cache ("
+                "key TEXT PRIMARY KEY, action TEXT NOT NULL, created_at REAL NOT NULL);")
+            self._conn.execute(
+                "DELETE FROM action_cache WHERE created_at < ?;",
+                (time.time() - self.ttl,))
+            self._conn.commit()
+            rows = self._conn.execute(
+                "SELECT key, action, created_at FROM action_cache "
+                "ORDER BY created_at DESC LIMIT ?;", (self.max_size,)).fetchall()
+            # Mais antigas primeiro, para manter a ordem LRU
+            for key, action, created_at in reversed(rows):
+                self._entries[key] = (created_at, json.loads(action))
+            logger.info(
+                "Action cache loaded %s entries from '%s'.", len(self._entries), persist_file)
+        except (sqlite3.Error, ValueError) as e:
+            logger.error("Could not open the action cache file '%s': %s", persist_file, e)
+            self._conn = None
+            return
+        self._writer = threading.Thread(
+            target=self._run_writer, name="action-cache-writer", daemon=True)
+        self._writer.start()
+
+    def _write(self, *operation: Any):
+        if self._conn is not None:
+            self._writes.put(operation)
+
+    def _run_writer(self):
+        while True:
+            operation = self._writes.get()
+            batch = [operation]
+            # Agrupa o que já estiver na fila em uma única transação
+            while operation is not None and not self._writes.empty():
+                operation = self._writes.get_nowait()
+                batch.append(operation)
+            try:
+                with self._conn:
+                    for operation in batch:
+                        if operation is None:
+                            break
+                        self._apply(*operation)
+            except (sqlite3.Error, TypeError, ValueError) as e:
+                logger.error("Could not persist the action cache: %s", e)
+            for _ in batch:
+                self._writes.task_done()
+            if None in batch:
+                self._conn.close()
+                self._conn = None
+                return
+
+    def _apply(self, kind: str, key: Optional[str] = None, created_at: float = 0.0,
+               action: Optional[Dict[str, Any]] = None):
+        if kind == "put":
+            self._conn.execute(
+                "INSERT OR REPLACE INTO action_cache (key, action, created_at) VALUES (?, ?, ?);",
+                (key, json.dumps(action), created_at))
+        elif kind == "delete":
+            self._conn.execute("DELETE FROM action_cache WHERE key = ?;", (key,))
+        elif kind == "clear":
+            self._conn.execute("DELETE FROM action_cache;")
+
+    def _remove(self, key: str):
+        self._entries.pop(key, None)
+        self._write("delete", key)
+
+
+action_cache = ActionCache(
+    config.ACTION_CACHE_SIZE,
+    config.ACTION_CACHE_TTL,
+    config.ACTION_CACHE_FILE if config.ACTION_CACHE_PERSIST else None,
+)
+
+
+def _is_cacheable(action: Any) -> bool:
+    """Somente respostas válidas da IA são armazenadas, nunca erros."""
+    return (
+        isinstance(action, dict)
+        and "action" in action
+        and "payload" in action
+        and not action.get("error")
+    )
+
+
+def cached_action(func: Callable[[str, str], Any]) -> Callable[[str, str], Any]:
+    """
+    Decorador aplicado ao get_query_action de cada provedor de IA.
+
+    Consulta o cache antes de chamar o LLM e armazena o resultado em caso
+    de falha no cache. Solicitações idênticas que chegam enquanto a primeira
+    ainda aguarda o LLM esperam por ela (single-flight) em vez de repetir a
+    chamada. Funciona com as versões síncronas e assíncronas.
+    """
+    flight = SingleFlight("action")
+
+    def lookup(user_request: str, product_context: str) -> Tuple[str, Optional[dict]]:
+        version = catalog_version(product_context)
+        cached = action_cache.get(user_request, version)
+        if cached is not None:
+            logger.info("Action cache hit for request: '%s'", preview(user_request))
+        return version, cached
+
+    def store(user_request: str, version: str, action: Any):
+        if _is_cacheable(action):
+            action_cache.put(user_request, version, action)
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(user_request: str, product_context: str) -> dict:
+            if not user_request:
+                return await func(user_request, product_context)
+            version, cached = lookup(user_request, product_context)
+            if cached is not None:
+                return cached
+
+            async def generate() -> dict:
+                action = await func(user_request, product_context)
+                store(user_request, version, action)
+                return action
+
+            action = await flight.do_async(ActionCache.make_key(user_request, version), generate)
+            return dict(action) if isinstance(action, dict) else action
+
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(user_request: str, product_context: str) -> dict:
+        if not user_request:
+            return func(user_request, product_context)
+        version, cached = lookup(user_request, product_context)
+        if cached is not None:
+            return cached
+
+        def generate() -> dict:
+            action = func(user_request, product_context)
+            store(user_request, version, action)
+            return action
+
+        action = flight.do(ActionCache.make_key(user_request, version), generate)
+        return dict(action) if isinstance(action, dict) else action
+
+    return wrapper
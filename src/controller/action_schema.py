@@ -0,0 +1,100 @@
+"""
+Formato da ação retornada pela IA e validação da resposta.
+
+Com config.AI_STRUCTURED_OUTPUT, o JSON Schema de action_schema() é enviado
+ao provedor (`format` do Ollama, `response_schema` do Gemini) e a geração é
+restrita a um objeto válido: a resposta não precisa mais ser limpa de blocos
+```json nem gera novas tentativas por JSON malformado.
+
+Com config.AI_COMBINED_ANSWER, a IA também pode responder com a ação
+"database_answer": a query em `payload` e, em `template`, a resposta ao
+usuário com placeholders preenchidos localmente com o resultado
+(result_formatter.fill_template), dispensando a segunda chamada ao LLM.
+"""
+import json
+import logging
+from typing import Any, Dict, Optional
+
+import config
+from logging_setup import preview
+
+logger = logging.getLogger(__name__)
+
+DATABASE_QUERY = "database_query"
+DATABASE_ANSWER = "database_answer"
+USER_MESSAGE = "user_message"
+
+
+def action_types() -> tuple:
+    """As ações que a IA pode retornar na configuração atual."""
+    if config.AI_COMBINED_ANSWER:
+        return DATABASE_QUERY, DATABASE_ANSWER, USER_MESSAGE
+    return DATABASE_QUERY, USER_MESSAGE
+
+
+def action_schema() -> Dict[str, Any]:
+    """JSON Schema do objeto {action, payload[, template]}."""
+    properties: Dict[str, Any] = {
+        "action": {"type": "string", "enum": list(action_types())},
+        "payload": {"type": "string"},
+    }
+    if config.AI_COMBINED_ANSWER:
+        properties["template"] = {"type": "string"}
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": ["action", "payload"],
+    }
+
+
+def normalize_action(action: Any) -> Optional[Dict[str, Any]]:
+    """
+    Confere o objeto retornado pela IA.
+
+    Uma "database_answer" sem template vira uma "database_query" comum (a
+    resposta final é gerada pelo LLM), em vez de ser descartada.
+
+    Returns:
+        dict: A ação com as chaves 'action' e 'payload' (e 'template').
+        None: Se o objeto não for uma ação válida.
+    """
+    if not isinstance(action, dict):
+        return None
+    kind, payload = action.get("action"), action.get("payload")
+    if kind not in (DATABASE_QUERY, DATABASE_ANSWER, USER_MESSAGE) or not isinstance(payload, str):
+        return None
+    normalized = {"action": kind, "payload": payload}
+    if kind == DATABASE_ANSWER:
+        template = action.get("template")
+        if isinstance(template, str) and template.strip():
+            normalized["template"] = template
+        else:
+            normalized["action"] = DATABASE_QUERY
+    return normalized
+
+
+def parse_action(raw_text: str) -> Optional[Dict[str, Any]]:
+    """
+    Converte o texto da resposta da IA na ação.
+
+    Sem saída estruturada, o modelo pode envolver o JSON em blocos ```json,
+    que são removidos antes da conversão.
+
+    Returns:
+        dict: A ação validada por normalize_action.
+        None: Se o texto estiver vazio, não for JSON ou não for uma ação válida.
+    """
+    text = (raw_text or "").strip()
+    if not config.AI_STRUCTURED_OUTPUT:
+        text = text.replace("```json", "").replace("```", "").strip()
+    if not text:
+        logger.warning("The AI returned an empty response.")
+        return None
+    try:
+        action = normalize_action(json.loads(text))
+    except json.JSONDecodeError:
+        logger.error("Failed to decode JSON from AI: %s", preview(text))
+        return None
+    if action is None:
+        logger.error("The AI returned an invalid action: %s", preview(text))
+    return action
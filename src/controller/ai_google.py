@@ -1,27 +1,166 @@
-import json
+import functools
 import logging
-from google import genai
+from typing import AsyncIterator, Iterator, Optional
 import config
+from controller.action_cache import cached_action
+from controller.action_schema import action_schema, parse_action
+from controller.prompts import registry
+from instrumentation import record_llm_call
+from logging_setup import preview
 
 logger = logging.getLogger(__name__)
 
-if not config.API_KEY:
-    logger.critical("API_KEY não encontrada nas variáveis de ambiente.")
-    raise ValueError("API_KEY não foi encontrada. Verifique o arquivo .env.")
+def _error_response() -> dict:
+    return {
+        "action": "user_message",
+        "payload": "Sorry, an error occurred while communicating with the AI. Please try again.",
+        "error": True
+    }
 
-client = genai.Client(api_key=config.API_KEY)
 
+def _prompt_missing_response() -> dict:
+    return {
+        "action": "user_message",
+        "payload": "Critical Error: Prompt configuration file not found.",
+        "error": True
+    }
+
+
+def _action_contents(user_request: str, product_context: str) -> str:
+    """Monta o conteúdo enviado ao modelo para determinar a ação."""
+    # A lista de produtos vem depois da parte estática do prompt, mantendo um
+    # prefixo idêntico entre as chamadas (aproveitado pelo cache do Gemini)
+    prompt_with_context = registry.get("generate_query").render(
+        product_list=product_context)
+
+    return prompt_with_context + "\n\nRequest: " + user_request + "\nResponse:"
+
+
+def _action_config() -> Optional[dict]:
+    """Configuração da geração da ação: JSON restrito ao schema, se ativado."""
+    if not config.AI_STRUCTURED_OUTPUT:
+        return None
+    return {
+        "response_mime_type": "application/json",
+        "response_schema": action_schema(),
+    }
+
+
+def _parse_action(response) -> dict:
+    """Converte a resposta do Gemini no dicionário de ação."""
+    logger.debug("JSON received from AI: %s", preview(response.text))
+    action = parse_action(response.text or "")
+    return action if action is not None else _error_response()
+
+
+def _feedback_contents(original_query: str, db_result) -> str:
+    """Monta o conteúdo enviado ao modelo para resumir o resultado."""
+    context = (
+        f"The original SQL query was: '{original_query}'.\n"
+        f"The database result was: '{str(db_result)}'."
+    )
+    return registry.get("analyse_result").render(query_and_result_context=context)
+
+
+class GoogleProvider:
+    """
+    Acesso à API do Google Gemini.
+
+    Os métodos lançam exceções em falhas de comunicação; o tratamento fica a
+    cargo de quem chama (as funções deste módulo ou o roteador de provedores).
+    O SDK só é importado e o cliente só é criado na primeira chamada.
+    """
+
+    def __init__(self, api_key: Optional[str]):
+        self.name = f"google:{config.MODEL_NAME}"
+        self.api_key = api_key
+
+    @functools.cached_property
+    def client(self):
+        """
+        Raises:
+            ValueError: Se a API_KEY não estiver configurada.
+        """
+        if not self.api_key:
+            logger.critical("API_KEY não encontrada nas variáveis de ambiente.")
+            raise ValueError("API_KEY não foi encontrada. Verifique o arquivo .env.")
+        from google import genai
+
+        return genai.Client(api_key=self.api_key)
+
+    def _record_usage(self, operation: str, contents: str, response):
+        """Registra o tamanho do prompt e os tokens informados pelo Gemini."""
+        usage = getattr(response, "usage_metadata", None)
+        record_llm_call(
+            self.name, operation, len(contents),
+            getattr(usage, "prompt_token_count", None),
+            getattr(usage, "candidates_token_count", None))
+
+    def generate_action(self, user_request: str, product_context: str) -> dict:
+        contents = _action_contents(user_request, product_context)
+        response = self.client.models.generate_content(
+            model=config.MODEL_NAME,
+            contents=contents,
+            config=_action_config()
+        )
+        self._record_usage("action", contents, response)
+        return _parse_action(response)
+
+    async def generate_action_async(self, user_request: str, product_context: str) -> dict:
+        contents = _action_contents(user_request, product_context)
+        response = await self.client.aio.models.generate_content(
+            model=config.MODEL_NAME,
+            contents=contents,
+            config=_action_config()
+        )
+        self._record_usage("action", contents, response)
+        return _parse_action(response)
+
+    def generate_feedback(self, original_query: str, db_result) -> str:
+        contents = _feedback_contents(original_query, db_result)
+        response = self.client.models.generate_content(
+            model=config.MODEL_NAME,
+            contents=contents
+        )
+        self._record_usage("feedback", contents, response)
+        return response.text
+
+    async def generate_feedback_async(self, original_query: str, db_result) -> str:
+        contents = _feedback_contents(original_query, db_result)
+        response = await self.client.aio.models.generate_content(
+            model=config.MODEL_NAME,
+            contents=contents
+        )
+        self._record_usage("feedback", contents, response)
+        return response.text
+
+    def stream_feedback(self, original_query: str, db_result) -> Iterator[str]:
+        contents = _feedback_contents(original_query, db_result)
+        chunk = None
+        for chunk in self.client.models.generate_content_stream(
+            model=config.MODEL_NAME,
+            contents=contents
+        ):
+            yield chunk.text or ""
+        # O último trecho traz a contagem de tokens da chamada
+        self._record_usage("feedback", contents, chunk)
+
+    async def stream_feedback_async(self, original_query: str, db_result) -> AsyncIterator[str]:
+        contents = _feedback_contents(original_query, db_result)
+        chunk = None
+        async for chunk in await self.client.aio.models.generate_content_stream(
+            model=config.MODEL_NAME,
+            contents=contents
+        ):
+            yield chunk.text or ""
+        self._record_usage("feedback", contents, chunk)
 
-def _get_prompt(file_name: str) -> str:
-    """Lê um arquivo de prompt."""
-    try:
-        with open(file_name, 'r', encoding='utf-8') as f:
-            return f.read().strip()
-    except FileNotFoundError:
-        logger.error(f"Arquivo de prompt '{file_name}' não foi encontrado.")
-        raise
 
+# O cliente é criado na primeira chamada; sem API_KEY, as chamadas falham
+provider = GoogleProvider(config.API_KEY)
 
+
+@cached_action
 def get_query_action(user_request: str, product_context: str) -> dict:
     """
     Analisa a solicitação do usuário, usando um contexto fornecido,
@@ -34,49 +173,31 @@ def get_query_action(user_request: str, product_context: str) -> dict:
     Returns:
         dict: Um dicionário com as chaves 'action' e 'payload'.
     """
-    error_response = {
-        "action": "user_message",
-        "payload": "Sorry, an error occurred while communicating with the AI. Please try again."
-    }
-
     if not user_request:
         return {"action": "user_message", "payload": ""}
 
-    clean_json_string = ""
     try:
-        prompt_template = _get_prompt(config.PROMPT_QUERY_GENERATION_FILE)
-
-        # Injeta a lista de produtos no placeholder {product_list} do prompt
-        prompt_with_context = prompt_template.replace(
-            '{product_list}', product_context)
-
-        # Mantendo sua implementação da API intacta
-        response = client.models.generate_content(
-            model=config.MODEL_NAME,
-            contents=prompt_with_context + "\n\nRequest: " + user_request + "\nResponse:"
-        )
-
-        raw_text = response.text or ""
-        clean_json_string = raw_text.strip().replace("```json", "").replace("```", "")
-        logger.debug(f"JSON received from AI: {clean_json_string}")
+        return provider.generate_action(user_request, product_context)
+    except FileNotFoundError:
+        return _prompt_missing_response()
+    except Exception as e:
+        logger.exception("Unexpected error while generating action: %s", e)
+        return _error_response()
 
-        if not clean_json_string:
-            logger.warning("The AI returned an empty response.")
-            return error_response
 
-        return json.loads(clean_json_string)
+@cached_action
+async def get_query_action_async(user_request: str, product_context: str) -> dict:
+    """Versão assíncrona de get_query_action, usada pelo runtime asyncio."""
+    if not user_request:
+        return {"action": "user_message", "payload": ""}
 
-    except json.JSONDecodeError:
-        logger.error(f"Failed to decode JSON from AI: {clean_json_string}")
-        return error_response
+    try:
+        return await provider.generate_action_async(user_request, product_context)
     except FileNotFoundError:
-        return {
-            "action": "user_message",
-            "payload": "Critical Error: Prompt configuration file not found."
-        }
+        return _prompt_missing_response()
     except Exception as e:
-        logger.exception(f"Unexpected error while generating action: {e}")
-        return error_response
+        logger.exception("Unexpected error while generating action: %s", e)
+        return _error_response()
 
 
 def feedback(original_query: str, db_result) -> str | None:
@@ -85,17 +206,37 @@ def feedback(original_query: str, db_result) -> str | None:
     (Esta função permanece a mesma)
     """
     try:
-        prompt_template = _get_prompt(config.PROMPT_FEEDBACK_ANALYSIS_FILE)
-        context = (
-            f"\nThe original SQL query was: '{original_query}'.\n"
-            f"The database result was: '{str(db_result)}'."
-        )
+        return provider.generate_feedback(original_query, db_result)
+    except Exception as e:
+        logger.exception("Erro ao gerar feedback da IA: %s", e)
+        return "Não foi possível gerar um feedback para o resultado."
 
-        response = client.models.generate_content(
-            model=config.MODEL_NAME,
-            contents=prompt_template + context
-        )
-        return response.text
+
+async def feedback_async(original_query: str, db_result) -> str | None:
+    """Versão assíncrona de feedback, usada pelo runtime asyncio."""
+    try:
+        return await provider.generate_feedback_async(original_query, db_result)
     except Exception as e:
-        logger.exception(f"Erro ao gerar feedback da IA: {e}")
+        logger.exception("Erro ao gerar feedback da IA: %s", e)
         return "Não foi possível gerar um feedback para o resultado."
+
+
+def feedback_stream(original_query: str, db_result) -> Iterator[str]:
+    """
+    Versão em streaming de feedback: produz o texto à medida que é gerado.
+    """
+    try:
+        yield from provider.stream_feedback(original_query, db_result)
+    except Exception as e:
+        logger.exception("Erro ao gerar feedback da IA em streaming: %s", e)
+        yield "Não foi possível gerar um feedback para o resultado."
+
+
+async def feedback_stream_async(original_query: str, db_result) -> AsyncIterator[str]:
+    """Versão assíncrona de feedback_stream, usada pelo runtime asyncio."""
+    try:
+        async for chunk in provider.stream_feedback_async(original_query, db_result):
+            yield chunk
+    except Exception as e:
+        logger.exception("Erro ao gerar feedback da IA em streaming: %s", e)
+        yield "Não foi possível gerar um feedback para o resultado."
@@ -1,76 +1,217 @@
-import json
+import functools
 import logging
-from ollama import Client
+from typing import AsyncIterator, Iterator, Optional
 import config
+from controller.action_cache import cached_action
+from controller.action_schema import action_schema, parse_action
+from controller.prompts import registry
+from instrumentation import record_llm_call
 
 logger = logging.getLogger(__name__)
 
-# Inicializa o cliente Ollama.
-client = Client()
+
+def _error_response() -> dict:
+    return {
+        "action": "user_message",
+        "payload": "Sorry, an error occurred while communicating with the AI. Please try again.",
+        "error": True
+    }
+
+
+def _prompt_missing_response() -> dict:
+    return {
+        "action": "user_message",
+        "payload": "Critical Error: Prompt configuration file not found.",
+        "error": True
+    }
+
+
+def _action_request(user_request: str, product_context: str) -> dict:
+    """Monta os argumentos da chamada generate que determina a ação."""
+    # As instruções, o schema e os exemplos formam um prefixo invariável,
+    # usado como "instrução de sistema": o Ollama reaproveita o seu
+    # processamento entre as chamadas. A lista de produtos vem depois.
+    static_prefix, product_section = registry.get("generate_query").render_split(
+        product_list=product_context)
+
+    request = {
+        "model": config.OLLAMA_MODEL,
+        "system": static_prefix,
+        "prompt": f"{product_section}\n\nRequest: {user_request}\nResponse:",
+        "options": {'temperature': 0.0},
+        "keep_alive": config.OLLAMA_KEEP_ALIVE,
+        "stream": False  # Garante que a resposta venha de uma só vez
+    }
+    if config.AI_STRUCTURED_OUTPUT:
+        # A geração fica restrita a um JSON válido para o schema da ação
+        request["format"] = action_schema()
+    return request
+
+
+def _parse_action(response) -> dict:
+    """Converte a resposta do Ollama no dicionário de ação."""
+    # A resposta do Ollama está na chave 'response'
+    action = parse_action(response.get('response', ""))
+    return action if action is not None else _error_response()
+
+
+def _feedback_request(original_query: str, db_result) -> dict:
+    """Monta os argumentos da chamada generate que resume o resultado."""
+    # Cria o contexto que será injetado no prompt
+    context = (
+        f"The SQL query was: '{original_query}'.\n"
+        f"The database result was: '{str(db_result)}'."
+    )
+
+    # Injeta o contexto no placeholder do prompt, após a parte estática
+    final_prompt = registry.get("analyse_result").render(
+        query_and_result_context=context)
+
+    return {
+        "model": config.OLLAMA_MODEL,
+        "prompt": final_prompt,  # Usa o prompt completo com os dados já inseridos
+        "options": {'temperature': 0.2},
+        "keep_alive": config.OLLAMA_KEEP_ALIVE,
+        "stream": False
+    }
 
 
-def _get_prompt(file_name: str) -> str:
-    """Lê um arquivo de prompt."""
+def _parse_feedback(response) -> str:
+    # Limpa a resposta para garantir que não venha com texto extra
+    return response.get('response', "Could not generate feedback.").strip()
+
+
+class OllamaProvider:
+    """
+    Acesso a um servidor Ollama.
+
+    Os métodos lançam exceções em falhas de comunicação; o tratamento fica a
+    cargo de quem chama (as funções deste módulo ou o roteador de provedores).
+    A biblioteca só é importada e os clientes só são criados no primeiro uso.
+
+    Args:
+        host (str, optional): URL do servidor. None usa o padrão do cliente
+            (variável OLLAMA_HOST ou localhost).
+    """
+
+    def __init__(self, host: Optional[str] = None):
+        self.name = f"ollama:{host or 'default'}"
+        self.host = host
+
+    @functools.cached_property
+    def client(self):
+        from ollama import Client
+
+        return Client(host=self.host)
+
+    @functools.cached_property
+    def async_client(self):
+        from ollama import AsyncClient
+
+        return AsyncClient(host=self.host)
+
+    def _record_usage(self, operation: str, request: dict, response):
+        """Registra o tamanho do prompt e os tokens informados pelo Ollama."""
+        record_llm_call(
+            self.name, operation,
+            len(request.get("system", "")) + len(request["prompt"]),
+            response.get('prompt_eval_count'), response.get('eval_count'))
+
+    def generate_action(self, user_request: str, product_context: str) -> dict:
+        request = _action_request(user_request, product_context)
+        response = self.client.generate(**request)
+        self._record_usage("action", request, response)
+        return _parse_action(response)
+
+    async def generate_action_async(self, user_request: str, product_context: str) -> dict:
+        request = _action_request(user_request, product_context)
+        response = await self.async_client.generate(**request)
+        self._record_usage("action", request, response)
+        return _parse_action(response)
+
+    def generate_feedback(self, original_query: str, db_result) -> str:
+        request = _feedback_request(original_query, db_result)
+        response = self.client.generate(**request)
+        self._record_usage("feedback", request, response)
+        return _parse_feedback(response)
+
+    async def generate_feedback_async(self, original_query: str, db_result) -> str:
+        request = _feedback_request(original_query, db_result)
+        response = await self.async_client.generate(**request)
+        self._record_usage("feedback", request, response)
+        return _parse_feedback(response)
+
+    def stream_feedback(self, original_query: str, db_result) -> Iterator[str]:
+        request = _feedback_request(original_query, db_result)
+        request["stream"] = True
+        for chunk in self.client.generate(**request):
+            if chunk.get('done'):
+                # O último trecho traz a contagem de tokens da chamada
+                self._record_usage("feedback", request, chunk)
+            yield chunk.get('response', "")
+
+    async def stream_feedback_async(self, original_query: str, db_result) -> AsyncIterator[str]:
+        request = _feedback_request(original_query, db_result)
+        request["stream"] = True
+        async for chunk in await self.async_client.generate(**request):
+            if chunk.get('done'):
+                self._record_usage("feedback", request, chunk)
+            yield chunk.get('response', "")
+
+    def warm_up(self):
+        """
+        Carrega o modelo e pré-processa o prefixo estático do prompt de ações,
+        para que a primeira mensagem não pague esse custo.
+        """
+        request = _action_request("", "")
+        request["options"] = {'temperature': 0.0, 'num_predict': 1}
+        self.client.generate(**request)
+        logger.info("%s warmed up with the static prompt prefix.", self.name)
+
+
+# Provedor padrão; os clientes síncrono e assíncrono são criados no primeiro uso
+provider = OllamaProvider(config.OLLAMA_HOST)
+
+
+def warm_up():
+    """Pré-aquece o modelo do provedor padrão, sem interromper a aplicação."""
     try:
-        with open(file_name, 'r', encoding='utf-8') as f:
-            return f.read().strip()
-    except FileNotFoundError:
-        logger.error(f"The prompt file '{file_name}' could not be found.")
-        raise
+        provider.warm_up()
+    except Exception as e:
+        logger.warning("Could not warm up the Ollama model: %s", e)
 
 
+@cached_action
 def get_query_action(user_request: str, product_context: str) -> dict:
     """
     Analisa a solicitação do usuário usando Ollama, com contexto, e retorna uma ação.
     Esta função é um substituto direto para a versão do ai_google.py.
     """
-    error_response = {
-        "action": "user_message",
-        "payload": "Sorry, an error occurred while communicating with the AI. Please try again."
-    }
+    if not user_request:
+        return {"action": "user_message", "payload": ""}
+
+    try:
+        return provider.generate_action(user_request, product_context)
+    except FileNotFoundError:
+        return _prompt_missing_response()
+    except Exception as e:
+        logger.exception("Unexpected error while generating action with Ollama: %s", e)
+        return _error_response()
 
+
+@cached_action
+async def get_query_action_async(user_request: str, product_context: str) -> dict:
+    """Versão assíncrona de get_query_action, usada pelo runtime asyncio."""
     if not user_request:
         return {"action": "user_message", "payload": ""}
 
-    clean_json_string = ""
     try:
-        prompt_template = _get_prompt(config.PROMPT_QUERY_GENERATION_FILE)
-
-        # Injeta a lista de produtos no placeholder {product_list} do prompt
-        prompt_with_context = prompt_template.replace(
-            '{product_list}', product_context)
-
-        # Usamos o prompt com contexto como a "instrução de sistema" para o modelo
-        response = client.generate(
-            model=config.OLLAMA_MODEL,
-            system=prompt_with_context,
-            prompt=f"\n\nRequest: {user_request}\nResponse:",
-            options={'temperature': 0.0},
-            stream=False  # Garante que a resposta venha de uma só vez
-        )
-
-        # A resposta do Ollama está na chave 'response'
-        raw_text = response.get('response', "")
-        clean_json_string = raw_text.strip().replace("```json", "").replace("```", "")
-
-        if not clean_json_string:
-            return error_response
-
-        return json.loads(clean_json_string)
-
-    except json.JSONDecodeError:
-        logger.error(
-            f"Failed to decode JSON from Ollama AI: {clean_json_string}")
-        return error_response
+        return await provider.generate_action_async(user_request, product_context)
     except FileNotFoundError:
-        return {
-            "action": "user_message",
-            "payload": "Critical Error: Prompt configuration file not found."
-        }
+        return _prompt_missing_response()
     except Exception as e:
-        logger.exception(
-            f"Unexpected error while generating action with Ollama: {e}")
-        return error_response
+        logger.exception("Unexpected error while generating action with Ollama: %s", e)
+        return _error_response()
 
 
 def feedback(original_query: str, db_result) -> str | None:
@@ -78,29 +219,37 @@ def feedback(original_query: str, db_result) -> str | None:
     Gera uma resposta em linguagem natural com Ollama.
     """
     try:
-        prompt_template = _get_prompt(config.PROMPT_FEEDBACK_ANALYSIS_FILE)
-
-        # Cria o contexto que será injetado no prompt
-        context = (
-            f"The SQL query was: '{original_query}'.\n"
-            f"The database result was: '{str(db_result)}'."
-        )
-
-        # Injeta o contexto no placeholder do novo prompt
-        final_prompt = prompt_template.replace(
-            '{query_and_result_context}', context)
-
-        response = client.generate(
-            model=config.OLLAMA_MODEL,
-            prompt=final_prompt,  # Usa o prompt completo com os dados já inseridos
-            options={'temperature': 0.2},
-            stream=False
-        )
-        # Limpa a resposta para garantir que não venha com texto extra
-        summary = response.get(
-            'response', "Could not generate feedback.").strip()
-        return summary
+        return provider.generate_feedback(original_query, db_result)
+    except Exception as e:
+        logger.exception("Error generating AI feedback with Ollama: %s", e)
+        return "It was not possible to generate feedback for the result."
 
+
+async def feedback_async(original_query: str, db_result) -> str | None:
+    """Versão assíncrona de feedback, usada pelo runtime asyncio."""
+    try:
+        return await provider.generate_feedback_async(original_query, db_result)
     except Exception as e:
-        logger.exception(f"Error generating AI feedback with Ollama: {e}")
+        logger.exception("Error generating AI feedback with Ollama: %s", e)
         return "It was not possible to generate feedback for the result."
+
+
+def feedback_stream(original_query: str, db_result) -> Iterator[str]:
+    """
+    Versão em streaming de feedback: produz o texto à medida que é gerado.
+    """
+    try:
+        yield from provider.stream_feedback(original_query, db_result)
+    except Exception as e:
+        logger.exception("Error streaming AI feedback with Ollama: %s", e)
+        yield "It was not possible to generate feedback for the result."
+
+
+async def feedback_stream_async(original_query: str, db_result) -> AsyncIterator[str]:
+    """Versão assíncrona de feedback_stream, usada pelo runtime asyncio."""
+    try:
+        async for chunk in provider.stream_feedback_async(original_query, db_result):
+            yield chunk
+    except Exception as e:
+        logger.exception("Error streaming AI feedback with Ollama: %s", e)
+        yield "It was not possible to generate feedback for the result."
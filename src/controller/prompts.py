@@ -0,0 +1,156 @@
+"""
+Registro dos templates de prompt.
+
+Os arquivos são lidos e validados uma única vez e recarregados apenas quando
+o mtime muda (verificado no máximo a cada config.PROMPT_RELOAD_INTERVAL
+segundos). A renderização separa o template em duas partes: o prefixo, tudo o
+que vem antes da linha do primeiro placeholder, é invariável entre as
+chamadas; o restante recebe os valores variáveis. Manter o prefixo idêntico permite que o
+Ollama (e o cache implícito do Gemini) reaproveite o processamento da parte
+estática do prompt.
+
+Um template pode ter seções extras em arquivos próprios (ex.: as regras da
+ação "database_answer"). Elas entram no fim do prefixo, antes da última seção
+("### ...") dele, a que apresenta os dados variáveis; assim continuam na parte
+estática do prompt.
+"""
+import logging
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Iterable, List, Tuple
+
+import config
+
+logger = logging.getLogger(__name__)
+
+_PLACEHOLDER_RE = re.compile(r"\{(\w+)\}")
+
+
+class PromptValidationError(ValueError):
+    """O template não contém os placeholders obrigatórios."""
+
+
+@dataclass(frozen=True)
+class PromptTemplate:
+    name: str
+    text: str
+    mtime: float
+    placeholders: FrozenSet[str]
+    prefix: str  # A parte estática, antes da linha do primeiro placeholder
+
+    def render_split(self, **values: str) -> Tuple[str, str]:
+        """
+        Renderiza o template separando a parte estática da variável.
+
+        Returns:
+            Tuple[str, str]: O prefixo invariável e o restante já renderizado.
+        """
+        prefix = self.prefix
+        suffix = self.text[len(prefix):]
+        # str.replace em vez de str.format: os prompts contêm exemplos em JSON
+        for key, value in values.items():
+            suffix = suffix.replace("{" + key + "}", value)
+        return prefix, suffix
+
+    def render(self, **values: str) -> str:
+        return "".join(self.render_split(**values))
+
+
+class PromptRegistry:
+    """Mantém os templates carregados e os recarrega quando o arquivo muda."""
+
+    def __init__(self, reload_interval: float):
+        self.reload_interval = reload_interval
+        self._paths: Dict[str, str] = {}
+        self._sections: Dict[str, Tuple[str, ...]] = {}
+        self._required: Dict[str, FrozenSet[str]] = {}
+        self._templates: Dict[str, PromptTemplate] = {}
+        self._checked_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, path: str, required: Iterable[str] = (),
+                 sections: Iterable[str] = ()):
+        """
+        Registra um template; ele é carregado no primeiro uso.
+
+        Args:
+            sections (Iterable[str]): Arquivos com seções extras, inseridas
+                antes da última seção do prefixo.
+        """
+        with self._lock:
+            self._paths[name] = path
+            self._sections[name] = tuple(sections)
+            self._required[name] = frozenset(required)
+
+    def get(self, name: str) -> PromptTemplate:
+        """
+        Retorna o template, recarregando-o se o arquivo foi alterado.
+
+        Se a nova versão for inválida, a versão anterior continua em uso.
+
+        Raises:
+            FileNotFoundError: Se o arquivo nunca pôde ser carregado.
+            PromptValidationError: Se a primeira versão carregada for inválida.
+        """
+        with self._lock:
+            template = self._templates.get(name)
+            now = time.monotonic()
+            if template is not None and now - self._checked_at[name] < self.reload_interval:
+                return template
+            self._checked_at[name] = now
+
+            path = self._paths[name]
+            try:
+                # A versão do template é a do arquivo alterado mais recentemente
+                mtime = max(os.stat(p).st_mtime for p in (path,) + self._sections[name])
+                if template is not None and mtime == template.mtime:
+                    return template
+                template = self._load(name, path, mtime)
+            except FileNotFoundError as e:
+                logger.error("The prompt file '%s' could not be found.", e.filename)
+                if template is None:
+                    raise
+            except PromptValidationError as e:
+                logger.error("Invalid prompt template '%s': %s", path, e)
+                if template is None:
+                    raise
+            return template
+
+    def _load(self, name: str, path: str, mtime: float) -> PromptTemplate:
+        with open(path, 'r', encoding='utf-8') as f:
+            text = f.read().strip()
+        if self._sections[name]:
+            text = self._insert_sections(text, self._sections[name])
+        placeholders = frozenset(_PLACEHOLDER_RE.findall(text))
+        missing = self._required[name] - placeholders
+        if missing:
+            raise PromptValidationError(
+                f"missing placeholders: {', '.join(sorted(missing))}")
+        first = _PLACEHOLDER_RE.search(text)
+        prefix = text[:text.rfind("\n", 0, first.start()) + 1] if first else text
+        template = PromptTemplate(name, text, mtime, placeholders, prefix)
+        self._templates[name] = template
+        logger.info("Prompt template '%s' loaded from '%s'.", name, path)
+        return template
+
+    @staticmethod
+    def _insert_sections(text: str, paths: Iterable[str]) -> str:
+        sections: List[str] = []
+        for path in paths:
+            with open(path, 'r', encoding='utf-8') as f:
+                sections.append(f.read().strip() + "\n\n")
+        first = _PLACEHOLDER_RE.search(text)
+        end = first.start() if first else len(text)
+        heading = text.rfind("\n### ", 0, end) + 1
+        return text[:heading] + "".join(sections) + text[heading:]
+
+
+registry = PromptRegistry(config.PROMPT_RELOAD_INTERVAL)
+registry.register(
+    "generate_query", config.PROMPT_QUERY_GENERATION_FILE, required=("product_list",),
+    sections=(config.PROMPT_COMBINED_ANSWER_FILE,) if config.AI_COMBINED_ANSWER else ())
+registry.register(
+    "analyse_result", config.PROMPT_FEEDBACK_ANALYSIS_FILE, required=("query_and_result_context",))
@@ -0,0 +1,164 @@
+"""
+Formatação local de resultados simples, sem a segunda chamada ao LLM.
+
+Os formatos mais comuns de resultado (vazio, um único valor, uma única linha,
+uma lista curta de nomes ou de pares nome/quantidade) são descritos por
+templates em microssegundos. Somente os resultados que não se encaixam em
+nenhum formato conhecido seguem para o feedback() da IA.
+
+A ação "database_answer" traz o template da resposta escrito pela própria IA
+(fill_template), com placeholders [[coluna]], [[rows]] e [[count]].
+"""
+import logging
+import re
+from typing import Any, Dict, Optional
+
+from instrumentation import ANSWER_PATHS, record_answer_path
+from model.db_access import QueryResult
+
+logger = logging.getLogger(__name__)
+
+# Só a igualdade identifica um produto; um LIKE pode abranger vários
+_NAME_FILTER_RE = re.compile(r"\bname\s*=\s*'((?:[^']|'')*)'", re.IGNORECASE)
+_AGGREGATE_RE = re.compile(r"^(count|sum|avg|min|max|total)\s*\((.*)\)$", re.IGNORECASE)
+_TEMPLATE_PLACEHOLDER_RE = re.compile(r"\[\[\s*([^\[\]]+?)\s*\]\]")
+
+_AGGREGATE_LABELS = {
+    "count": "Number of {}",
+    "sum": "Total {}",
+    "total": "Total {}",
+    "avg": "Average {}",
+    "min": "Minimum {}",
+    "max": "Maximum {}",
+}
+
+def path_counts() -> Dict[str, int]:
+    """
+    Quantas respostas foram formatadas localmente ('fast_path'), pelo template
+    da IA ('template', ou 'template_fallback' quando ele não serviu) ou pelo
+    LLM ('llm'), conforme a métrica bot_answer_paths_total.
+    """
+    return {item["labels"]["path"]: int(item["value"]) for item in ANSWER_PATHS.snapshot()}
+
+
+def _label(column: str) -> str:
+    """Converte o nome de uma coluna em um rótulo legível ("sum(quantity)" -> "Total quantity")."""
+    match = _AGGREGATE_RE.match(column.strip())
+    if match:
+        function, argument = match.group(1).lower(), match.group(2).strip()
+        target = "products" if argument in ("*", "") else argument.replace("_", " ")
+        return _AGGREGATE_LABELS[function].format(target)
+    return column.replace("_", " ").capitalize()
+
+
+def _value(value: Any) -> str:
+    if value is None:
+        return "none"
+    if isinstance(value, float):
+        return f"{value:.2f}".rstrip("0").rstrip(".")
+    return str(value)
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _format(sql_query: str, result: QueryResult, max_rows: int) -> Optional[str]:
+    if result.total_rows == 0:
+        return "No matching products were found."
+
+    # Resultados truncados ou grandes demais ficam com o LLM
+    if result.truncated or result.total_rows > max_rows or not result.columns:
+        return None
+
+    columns = [column.lower() for column in result.columns]
+
+    if result.total_rows == 1:
+        row = result.rows[0]
+        if len(columns) == 1:
+            name_filters = _NAME_FILTER_RE.findall(sql_query)
+            if columns[0] == "quantity" and len(name_filters) == 1 and _is_number(row[0]):
+                product = name_filters[0].replace("''", "'")
+                return f"There are {_value(row[0])} units of {product} in stock."
+            return f"{_label(result.columns[0])}: {_value(row[0])}."
+        return ", ".join(
+            f"{_label(column)}: {_value(value)}"
+            for column, value in zip(result.columns, row)) + "."
+
+    if len(columns) == 1 and all(isinstance(row[0], str) for row in result.rows):
+        return ", ".join(row[0] for row in result.rows) + "."
+
+    if (len(columns) == 2
+            and all(isinstance(row[0], str) and _is_number(row[1]) for row in result.rows)):
+        lines = [f"{row[0]}: {_value(row[1])}" for row in result.rows]
+        return f"{_label(result.columns[1])} per product:\n" + "\n".join(lines)
+
+    return None
+
+
+def _row_text(row: tuple) -> str:
+    if len(row) == 1:
+        return _value(row[0])
+    return f"{_value(row[0])} ({', '.join(_value(value) for value in row[1:])})"
+
+
+def fill_template(template: str, result: QueryResult) -> Optional[str]:
+    """
+    Preenche o template da resposta gerado pela IA com o resultado da query.
+
+    Placeholders:
+        [[coluna]]: o valor da coluna, se o resultado tiver uma única linha.
+        [[rows]]: as linhas do resultado, separadas por vírgulas.
+        [[count]]: o número de linhas.
+
+    Returns:
+        str: A resposta pronta para o usuário.
+        None: Se algum placeholder não puder ser preenchido com este
+        resultado (coluna desconhecida, nenhuma ou várias linhas); a
+        resposta fica então com o feedback() da IA.
+    """
+    columns = {column.lower(): index for index, column in enumerate(result.columns)}
+
+    def replace(match: "re.Match[str]") -> str:
+        name = match.group(1).lower()
+        if name in columns:
+            if result.total_rows != 1:
+                raise LookupError(name)
+            return _value(result.rows[0][columns[name]])
+        if name == "rows":
+            if not result.rows:
+                raise LookupError(name)
+            text = ", ".join(_row_text(row) for row in result.rows)
+            if result.truncated:
+                text += f" and {result.total_rows - len(result.rows)} more"
+            return text
+        if name == "count":
+            return str(result.total_rows)
+        raise LookupError(name)
+
+    try:
+        text = _TEMPLATE_PLACEHOLDER_RE.sub(replace, template).strip()
+    except LookupError as e:
+        record_answer_path("template_fallback")
+        logger.info("Answer template placeholder '%s' does not fit the result.", e)
+        return None
+    record_answer_path("template")
+    return text
+
+
+def format_result(sql_query: str, result: QueryResult, max_rows: int) -> Optional[str]:
+    """
+    Tenta descrever o resultado da query sem chamar o LLM.
+
+    Args:
+        sql_query (str): A query executada (usada para identificar o produto).
+        result (QueryResult): O resultado retornado por query_stream.
+        max_rows (int): Número máximo de linhas formatadas localmente.
+
+    Returns:
+        str: A resposta pronta para o usuário.
+        None: Se o formato do resultado não for reconhecido.
+    """
+    text = _format(sql_query, result, max_rows)
+    record_answer_path("fast_path" if text is not None else "llm")
+    return text
@@ -0,0 +1,406 @@
+"""
+Roteador entre provedores de IA (Ollama, em um ou mais hosts, e Gemini).
+
+Cada backend tem uma janela móvel de latências e erros. As chamadas vão
+primeiro para o backend mais saudável e mais rápido; se ele não responder
+dentro do percentil config.ROUTER_HEDGE_PERCENTILE da sua latência recente,
+uma segunda requisição (hedge) é disparada no próximo backend e a primeira
+resposta válida vence. Erros e respostas inválidas levam ao próximo backend
+(failover).
+
+As funções deste módulo têm as mesmas assinaturas das de ai_ollama.py e
+ai_google.py, então o app pode usá-las diretamente.
+"""
+import asyncio
+import logging
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+import config
+from controller.action_cache import cached_action
+from controller.action_schema import normalize_action
+from controller.scheduler import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+ACTION_ERROR = {
+    "action": "user_message",
+    "payload": "Sorry, an error occurred while communicating with the AI. Please try again.",
+    "error": True
+}
+FEEDBACK_ERROR = "It was not possible to generate feedback for the result."
+
+
+class AllBackendsFailed(Exception):
+    """Nenhum backend retornou uma resposta válida."""
+
+
+def _percentile(ordered: List[float], percentile: float) -> Optional[float]:
+    if not ordered:
+        return None
+    index = max(0, math.ceil(len(ordered) * percentile / 100) - 1)
+    return ordered[index]
+
+
+class Backend:
+    """
+    Um provedor de IA e a sua janela de latências e erros recentes.
+
+    O tempo até o primeiro trecho dos streams fica em uma janela separada: ele
+    não é comparável à latência de uma chamada completa, usada no hedge.
+    """
+
+    def __init__(self, provider, window_size: int):
+        self.provider = provider
+        self.name = provider.name
+        self._samples: Deque[Tuple[float, bool]] = deque(maxlen=window_size)
+        self._first_chunk: Deque[float] = deque(maxlen=window_size)
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, ok: bool):
+        with self._lock:
+            self._samples.append((latency, ok))
+
+    def record_first_chunk(self, latency: float):
+        """Registra o tempo até o primeiro trecho de um stream bem-sucedido."""
+        with self._lock:
+            self._first_chunk.append(latency)
+
+    def error_rate(self) -> float:
+        with self._lock:
+            if not self._samples:
+                return 0.0
+            return sum(1 for _, ok in self._samples if not ok) / len(self._samples)
+
+    def latency_percentile(self, percentile: float) -> Optional[float]:
+        """Percentil das latências das chamadas bem-sucedidas, ou None sem amostras."""
+        with self._lock:
+            latencies = sorted(latency for latency, ok in self._samples if ok)
+        return _percentile(latencies, percentile)
+
+    def first_chunk_percentile(self, percentile: float) -> Optional[float]:
+        with self._lock:
+            latencies = sorted(self._first_chunk)
+        return _percentile(latencies, percentile)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "p50": self.latency_percentile(50),
+            "p95": self.latency_percentile(95),
+            "first_chunk_p50": self.first_chunk_percentile(50),
+            "error_rate": self.error_rate(),
+            "samples": len(self._samples),
+        }
+
+
+def _valid_action(action: Any) -> bool:
+    return isinstance(action, dict) and not action.get("error") \
+        and normalize_action(action) is not None
+
+
+def _valid_feedback(text: Any) -> bool:
+    return isinstance(text, str) and bool(text.strip())
+
+
+class ProviderRouter:
+    """
+    Escolhe o backend de cada chamada, com hedge de requisições lentas e
+    failover em erros.
+    """
+
+    def __init__(self, backends: List[Backend], hedge_percentile: float,
+                 hedge_min_delay: float, hedge_default_delay: float,
+                 error_rate_threshold: float):
+        if not backends:
+            raise ValueError("At least one AI backend must be configured.")
+        self.backends = backends
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_default_delay = hedge_default_delay
+        self.error_rate_threshold = error_rate_threshold
+        self._executor = ThreadPoolExecutor(
+            max_workers=4 * len(backends), thread_name_prefix="ai-router")
+
+    def ordered(self) -> List[Backend]:
+        """Backends saudáveis primeiro, do mais rápido para o mais lento."""
+        def key(backend: Backend):
+            unhealthy = backend.error_rate() > self.error_rate_threshold
+            p50 = backend.latency_percentile(50)
+            # Backends sem amostras mantêm a ordem configurada entre si
+            return (unhealthy, p50 if p50 is not None else 0.0)
+        return sorted(self.backends, key=key)
+
+    def hedge_delay(self, backend: Backend) -> float:
+        latency = backend.latency_percentile(self.hedge_percentile)
+        if latency is None:
+            return self.hedge_default_delay
+        return max(self.hedge_min_delay, latency)
+
+    # --- Chamadas síncronas ---
+
+    def _timed(self, backend: Backend, method: str, valid: Callable[[Any], bool],
+               *args) -> Any:
+        start = time.perf_counter()
+        try:
+            result = getattr(backend.provider, method)(*args)
+        except Exception:
+            backend.record(time.perf_counter() - start, ok=False)
+            raise
+        ok = valid(result)
+        backend.record(time.perf_counter() - start, ok=ok)
+        if not ok:
+            raise ValueError(f"Invalid response from {backend.name}: {result!r}")
+        return result
+
+    def call(self, method: str, valid: Callable[[Any], bool], *args) -> Any:
+        """
+        Executa `method` no melhor backend, com hedge e failover.
+
+        Raises:
+            AllBackendsFailed: Se nenhum backend retornar uma resposta válida.
+        """
+        queue = self.ordered()
+        running: Dict[Future, Backend] = {}
+
+        def launch():
+            backend = queue.pop(0)
+            running[self._executor.submit(self._timed, backend, method, valid, *args)] = backend
+            return backend
+
+        newest = launch()
+        while running:
+            timeout = self.hedge_delay(newest) if queue else None
+            done, _ = wait(list(running), timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                # O backend atual está lento: dispara o hedge no próximo
+                logger.info(
+                    "Hedging '%s': %s is slow, trying %s.", method, newest.name, queue[0].name)
+                newest = launch()
+                continue
+            for future in done:
+                backend = running.pop(future)
+                try:
+                    return future.result()
+                except Exception as e:
+                    logger.warning("Backend %s failed on '%s': %s", backend.name, method, e)
+            if not running and queue:
+                newest = launch()
+        raise AllBackendsFailed(f"No backend answered '{method}'.")
+
+    # --- Chamadas assíncronas ---
+
+    async def _timed_async(self, backend: Backend, method: str,
+                           valid: Callable[[Any], bool], *args) -> Any:
+        start = time.perf_counter()
+        try:
+            result = await getattr(backend.provider, method)(*args)
+        except Exception:
+            backend.record(time.perf_counter() - start, ok=False)
+            raise
+        ok = valid(result)
+        backend.record(time.perf_counter() - start, ok=ok)
+        if not ok:
+            raise ValueError(f"Invalid response from {backend.name}: {result!r}")
+        return result
+
+    async def call_async(self, method: str, valid: Callable[[Any], bool], *args) -> Any:
+        """Versão assíncrona de call."""
+        queue = self.ordered()
+        running: Dict[asyncio.Task, Backend] = {}
+
+        def launch():
+            backend = queue.pop(0)
+            task = asyncio.ensure_future(self._timed_async(backend, method, valid, *args))
+            running[task] = backend
+            return backend
+
+        newest = launch()
+        try:
+            while running:
+                timeout = self.hedge_delay(newest) if queue else None
+                done, _ = await asyncio.wait(
+                    list(running), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    logger.info(
+                        "Hedging '%s': %s is slow, trying %s.", method, newest.name, queue[0].name)
+                    newest = launch()
+                    continue
+                for task in done:
+                    backend = running.pop(task)
+                    try:
+                        return task.result()
+                    except Exception as e:
+                        logger.warning("Backend %s failed on '%s': %s", backend.name, method, e)
+                if not running and queue:
+                    newest = launch()
+        finally:
+            # As requisições perdedoras são canceladas
+            for task in running:
+                task.cancel()
+        raise AllBackendsFailed(f"No backend answered '{method}'.")
+
+    # --- Streaming: failover apenas antes do primeiro trecho ---
+
+    def stream(self, method: str, *args) -> Iterator[str]:
+        for backend in self.ordered():
+            start = time.perf_counter()
+            chunks = getattr(backend.provider, method)(*args)
+            try:
+                first = next(chunks, None)
+            except Exception as e:
+                # Falhas contam para a saúde do backend; a latência do stream, não
+                backend.record(time.perf_counter() - start, ok=False)
+                logger.warning("Backend %s failed on '%s': %s", backend.name, method, e)
+                continue
+            backend.record_first_chunk(time.perf_counter() - start)
+            if first is not None:
+                yield first
+            yield from chunks
+            return
+        raise AllBackendsFailed(f"No backend answered '{method}'.")
+
+    async def stream_async(self, method: str, *args) -> AsyncIterator[str]:
+        for backend in self.ordered():
+            start = time.perf_counter()
+            chunks = getattr(backend.provider, method)(*args)
+            try:
+                first = await chunks.__anext__()
+            except StopAsyncIteration:
+                first = None
+            except Exception as e:
+                backend.record(time.perf_counter() - start, ok=False)
+                logger.warning("Backend %s failed on '%s': %s", backend.name, method, e)
+                continue
+            backend.record_first_chunk(time.perf_counter() - start)
+            if first is not None:
+                yield first
+                async for chunk in chunks:
+                    yield chunk
+            return
+        raise AllBackendsFailed(f"No backend answered '{method}'.")
+
+    def warm_up(self):
+        for backend in self.backends:
+            if hasattr(backend.provider, "warm_up"):
+                try:
+                    backend.provider.warm_up()
+                except Exception as e:
+                    logger.warning("Could not warm up %s: %s", backend.name, e)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {backend.name: backend.stats() for backend in self.backends}
+
+
+def create_provider(kind: str, target: Optional[str]):
+    """Cria o provedor descrito em config.LLM_BACKENDS."""
+    if kind == "ollama":
+        from controller.ai_ollama import OllamaProvider
+        return OllamaProvider(target)
+    if kind == "google":
+        from controller.ai_google import GoogleProvider
+        return GoogleProvider(config.API_KEY)
+    raise ValueError(f"Unknown AI backend type: {kind}")
+
+
+router = ProviderRouter(
+    [Backend(create_provider(kind, target), config.ROUTER_WINDOW_SIZE)
+     for kind, target in config.LLM_BACKENDS],
+    hedge_percentile=config.ROUTER_HEDGE_PERCENTILE,
+    hedge_min_delay=config.ROUTER_HEDGE_MIN_DELAY,
+    hedge_default_delay=config.ROUTER_HEDGE_DEFAULT_DELAY,
+    error_rate_threshold=config.ROUTER_ERROR_RATE_THRESHOLD,
+)
+
+
+def warm_up():
+    """Pré-aquece os backends que suportam isso."""
+    router.warm_up()
+
+
+@cached_action
+def get_query_action(user_request: str, product_context: str) -> dict:
+    """Determina a ação da solicitação usando o melhor backend disponível."""
+    if not user_request:
+        return {"action": "user_message", "payload": ""}
+    try:
+        return router.call("generate_action", _valid_action, user_request, product_context)
+    except Exception as e:
+        logger.error("Could not generate the action: %s", e)
+        return dict(ACTION_ERROR)
+
+
+@cached_action
+async def get_query_action_async(user_request: str, product_context: str) -> dict:
+    """Versão assíncrona de get_query_action."""
+    if not user_request:
+        return {"action": "user_message", "payload": ""}
+    try:
+        return await router.call_async(
+            "generate_action_async", _valid_action, user_request, product_context)
+    except Exception as e:
+        logger.error("Could not generate the action: %s", e)
+        return dict(ACTION_ERROR)
+
+
+# Feedbacks idênticos em andamento (mesma query e mesmo resultado, vindos de
+# chats diferentes) são gerados uma única vez
+_feedback_flight = SingleFlight("feedback")
+
+
+def _feedback_key(original_query: str, db_result) -> Tuple[str, str]:
+    return original_query, str(db_result)
+
+
+def feedback(original_query: str, db_result) -> str | None:
+    """Gera a resposta final usando o melhor backend disponível."""
+    def generate() -> str:
+        try:
+            return router.call("generate_feedback", _valid_feedback, original_query, db_result)
+        except Exception as e:
+            logger.error("Could not generate feedback: %s", e)
+            return FEEDBACK_ERROR
+
+    return _feedback_flight.do(_feedback_key(original_query, db_result), generate)
+
+
+async def feedback_async(original_query: str, db_result) -> str | None:
+    """Versão assíncrona de feedback."""
+    async def generate() -> str:
+        try:
+            return await router.call_async(
+                "generate_feedback_async", _valid_feedback, original_query, db_result)
+        except Exception as e:
+            logger.error("Could not generate feedback: %s", e)
+            return FEEDBACK_ERROR
+
+    return await _feedback_flight.do_async(_feedback_key(original_query, db_result), generate)
+
+
+def feedback_stream(original_query: str, db_result) -> Iterator[str]:
+    """Versão em streaming de feedback, com failover antes do primeiro trecho."""
+    def generate() -> Iterator[str]:
+        try:
+            yield from router.stream("stream_feedback", original_query, db_result)
+        except Exception as e:
+            logger.error("Could not stream feedback: %s", e)
+            yield FEEDBACK_ERROR
+
+    return _feedback_flight.stream(_feedback_key(original_query, db_result), generate)
+
+
+def feedback_stream_async(original_query: str, db_result) -> AsyncIterator[str]:
+    """Versão assíncrona de feedback_stream (chamada de dentro do event loop)."""
+    async def generate() -> AsyncIterator[str]:
+        try:
+            async for chunk in router.stream_async(
+                    "stream_feedback_async", original_query, db_result):
+                yield chunk
+        except Exception as e:
+            logger.error("Could not stream feedback: %s", e)
+            yield FEEDBACK_ERROR
+
+    return _feedback_flight.stream_async(_feedback_key(original_query, db_result), generate)
@@ -0,0 +1,440 @@
+"""
+Escalonamento das solicitações dos usuários antes do pipeline da IA.
+
+Três comportamentos, usados pelos dois runtimes (app.py e app_async.py):
+
+  - Limite por chat (TokenBucket): cada chat tem um balde de fichas; sem
+    fichas, a mensagem é recusada sem chamar a IA.
+  - Substituição (RequestScheduler): uma mensagem nova de um chat, chegando
+    até config.SUPERSEDE_WINDOW segundos depois da anterior, torna a anterior
+    obsoleta. Se ela ainda não começou, é pulada; se está em andamento, é
+    interrompida no próximo ponto de verificação (check_superseded).
+  - Single-flight (SingleFlight): chamadas idênticas em andamento ao mesmo
+    tempo, vindas de chats diferentes, compartilham um único cálculo.
+
+A solicitação atual fica em uma ContextVar, então os pontos de verificação
+funcionam nas threads do app.py e nas tasks do app_async.py.
+"""
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import (Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, Iterator, List,
+                    Optional)
+
+from instrumentation import record_scheduler_event
+
+logger = logging.getLogger(__name__)
+
+# Tickets que nunca foram executados (ex.: atualização descartada) expiram
+_TICKET_TTL = 600
+
+
+class Superseded(Exception):
+    """A solicitação foi substituída por uma mensagem mais nova do mesmo chat."""
+
+
+class TokenBucket:
+    """
+    Balde de fichas: até `capacity` solicitações seguidas, repostas à razão
+    de `rate` fichas por segundo.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def try_acquire(self, now: Optional[float] = None) -> bool:
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def full(self, now: float) -> bool:
+        return self.tokens + (now - self.updated_at) * self.rate >= self.capacity
+
+
+@dataclass
+class Ticket:
+    """Uma mensagem de um chat, registrada ao chegar."""
+    chat_id: Hashable
+    message_id: Hashable
+    arrived_at: float
+    rate_limited: bool = False
+    # Avisar o usuário do limite só na primeira mensagem recusada em sequência
+    notify: bool = False
+    superseded: bool = False
+
+
+@dataclass
+class _ChatState:
+    bucket: TokenBucket
+    tickets: Dict[Hashable, Ticket] = field(default_factory=dict)
+    warned: bool = False
+    # A mensagem mais nova já vista (que pode já ter terminado)
+    newest_id: Optional[Hashable] = None
+    newest_at: float = 0.0
+
+
+_current_ticket: ContextVar[Optional[Ticket]] = ContextVar("current_ticket", default=None)
+
+
+class RequestScheduler:
+    """
+    Registra as mensagens de cada chat, aplica o limite de fichas e marca
+    as solicitações substituídas.
+
+    Args:
+        window (float): Segundos em que uma mensagem nova substitui a anterior;
+            0 desativa a substituição.
+        rate (float): Fichas repostas por segundo, por chat.
+        burst (float): Capacidade do balde de cada chat.
+    """
+
+    def __init__(self, window: float, rate: float, burst: float):
+        self.window = window
+        self.rate = rate
+        self.burst = burst
+        self._chats: Dict[Hashable, _ChatState] = {}
+        self._lock = threading.Lock()
+
+    def arrive(self, chat_id: Hashable, message_id: Hashable) -> Ticket:
+        """
+        Registra a chegada de uma mensagem. Chamadas repetidas para a mesma
+        mensagem retornam o mesmo ticket, então ela pode ser registrada assim
+        que chega (ex.: no servidor do webhook) e de novo no handler.
+
+        A ordem das mensagens é a do message_id, não a de chegada: com o
+        polling em várias threads, uma mensagem antiga pode chegar depois de
+        uma nova, e nesse caso é ela que fica substituída.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            chat = self._chats.get(chat_id)
+            if chat is None:
+                chat = self._chats[chat_id] = _ChatState(TokenBucket(self.rate, self.burst))
+            ticket = chat.tickets.get(message_id)
+            if ticket is not None:
+                return ticket
+
+            ticket = Ticket(chat_id, message_id, now)
+            if not chat.bucket.try_acquire(now):
+                ticket.rate_limited = True
+                ticket.notify = not chat.warned
+                chat.warned = True
+                record_scheduler_event("rate_limited")
+            else:
+                chat.warned = False
+                if self.window > 0:
+                    self._supersede(chat, ticket, now)
+            chat.tickets[message_id] = ticket
+            return ticket
+
+    def _supersede(self, chat: _ChatState, ticket: Ticket, now: float):
+        for other in chat.tickets.values():
+            if (other.message_id < ticket.message_id and not other.superseded
+                    and not other.rate_limited and now - other.arrived_at <= self.window):
+                other.superseded = True
+                record_scheduler_event("superseded")
+        if chat.newest_id is not None and chat.newest_id > ticket.message_id:
+            # Chegou atrasada: uma mensagem mais nova do chat já foi registrada
+            if now - chat.newest_at <= self.window:
+                ticket.superseded = True
+                record_scheduler_event("superseded")
+        else:
+            chat.newest_id, chat.newest_at = ticket.message_id, now
+
+    @contextmanager
+    def running(self, ticket: Ticket) -> Iterator[Ticket]:
+        """Torna `ticket` a solicitação atual do bloco e o descarta ao final."""
+        token = _current_ticket.set(ticket)
+        try:
+            yield ticket
+        finally:
+            _current_ticket.reset(token)
+            with self._lock:
+                chat = self._chats.get(ticket.chat_id)
+                if chat is not None:
+                    chat.tickets.pop(ticket.message_id, None)
+
+    def _prune(self, now: float):
+        for chat_id in list(self._chats):
+            chat = self._chats[chat_id]
+            for message_id in [m for m, t in chat.tickets.items()
+                               if now - t.arrived_at > _TICKET_TTL]:
+                del chat.tickets[message_id]
+            # Um chat sem tickets e com o balde cheio não guarda nenhum estado útil
+            if (not chat.tickets and chat.bucket.full(now)
+                    and now - chat.newest_at > self.window):
+                del self._chats[chat_id]
+
+
+def check_superseded():
+    """
+    Ponto de verificação do pipeline.
+
+    Raises:
+        Superseded: Se a solicitação atual foi substituída.
+    """
+    ticket = _current_ticket.get()
+    if ticket is not None and ticket.superseded:
+        raise Superseded(f"Message {ticket.message_id} of chat {ticket.chat_id} was superseded.")
+
+
+def guard_stream(chunks: Iterator[str]) -> Iterator[str]:
+    """Interrompe um stream de trechos quando a solicitação é substituída."""
+    for chunk in chunks:
+        check_superseded()
+        yield chunk
+
+
+async def guard_stream_async(chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+    async for chunk in chunks:
+        check_superseded()
+        yield chunk
+
+
+# --- Single-flight ---
+
+class _SharedStream:
+    """
+    Repassa os trechos de um único stream a vários leitores.
+
+    Quem precisa do próximo trecho e não encontra ninguém buscando busca-o
+    para todos; assim um leitor que desiste (ex.: substituído) não trava os
+    demais. Se o último leitor desiste antes do fim, o stream de origem é
+    fechado e deixa de ser compartilhado: ninguém mais recebe uma resposta
+    lida pela metade.
+    """
+
+    _NOTHING = object()
+
+    def __init__(self, source: Iterator[str], on_done: Callable[[], None]):
+        self._source = source
+        self._on_done = on_done
+        self._chunks: List[str] = []
+        self._done = False
+        self._error: Optional[BaseException] = None
+        self._pulling = False
+        self._readers = 0
+        self._changed = threading.Condition()
+
+    def attach(self) -> bool:
+        """
+        Registra um novo leitor, que deve ser lido com reader().
+
+        Returns:
+            bool: False se o stream já terminou ou foi abandonado.
+        """
+        with self._changed:
+            if self._done:
+                return False
+            self._readers += 1
+            return True
+
+    def reader(self) -> Iterator[str]:
+        index = 0
+        try:
+            while True:
+                chunk = self._NOTHING
+                with self._changed:
+                    while index >= len(self._chunks) and not self._done and self._pulling:
+                        self._changed.wait()
+                    if index < len(self._chunks):
+                        chunk = self._chunks[index]
+                        index += 1
+                    elif self._done:
+                        if self._error is not None:
+                            raise self._error
+                        return
+                    else:
+                        self._pulling = True
+                if chunk is not self._NOTHING:
+                    yield chunk
+                else:
+                    self._pull()
+        finally:
+            self._leave()
+
+    def _leave(self):
+        with self._changed:
+            self._readers -= 1
+            abandoned = self._readers == 0 and not self._done
+            if abandoned:
+                self._done = True
+                self._changed.notify_all()
+        if abandoned:
+            # Nenhum leitor está em _pull aqui: ele só sai com o trecho em mãos
+            close = getattr(self._source, "close", None)
+            if close is not None:
+                close()
+            self._on_done()
+
+    def _pull(self):
+        try:
+            chunk = next(self._source)
+        except BaseException as e:
+            with self._changed:
+                self._done = True
+                self._error = None if isinstance(e, StopIteration) else e
+                self._pulling = False
+                self._changed.notify_all()
+            self._on_done()
+            return
+        with self._changed:
+            self._chunks.append(chunk)
+            self._pulling = False
+            self._changed.notify_all()
+
+
+class _SharedAsyncStream:
+    """
+    Versão assíncrona de _SharedStream: uma task lê o stream para todos. Se o
+    último leitor desiste antes do fim, a task é cancelada e o stream de
+    origem, fechado.
+    """
+
+    def __init__(self, source: AsyncIterator[str], on_done: Callable[[], None]):
+        self._chunks: List[str] = []
+        self._done = False
+        self._error: Optional[BaseException] = None
+        self._readers = 0
+        self._changed = asyncio.Condition()
+        self._on_done = on_done
+        self._task = asyncio.ensure_future(self._pump(source))
+
+    def attach(self) -> bool:
+        """Registra um novo leitor; False se o stream já terminou ou foi abandonado."""
+        if self._done:
+            return False
+        self._readers += 1
+        return True
+
+    async def _pump(self, source: AsyncIterator[str]):
+        try:
+            async for chunk in source:
+                async with self._changed:
+                    self._chunks.append(chunk)
+                    self._changed.notify_all()
+        except asyncio.CancelledError:
+            # Todos os leitores desistiram: para de consumir o LLM
+            aclose = getattr(source, "aclose", None)
+            if aclose is not None:
+                await aclose()
+        except Exception as e:
+            self._error = e
+        finally:
+            self._on_done()
+            async with self._changed:
+                self._done = True
+                self._changed.notify_all()
+
+    async def reader(self) -> AsyncIterator[str]:
+        index = 0
+        try:
+            while True:
+                async with self._changed:
+                    await self._changed.wait_for(lambda: index < len(self._chunks) or self._done)
+                    if index >= len(self._chunks):
+                        if self._error is not None:
+                            raise self._error
+                        return
+                    chunk = self._chunks[index]
+                index += 1
+                yield chunk
+        finally:
+            self._leave()
+
+    def _leave(self):
+        self._readers -= 1
+        if self._readers == 0 and not self._done:
+            self._done = True
+            self._task.cancel()
+
+
+class SingleFlight:
+    """
+    Compartilha chamadas idênticas em andamento: enquanto a primeira chamada
+    de uma chave não termina, as demais aguardam o resultado dela em vez de
+    repetir o cálculo. Nada é guardado depois que a chamada termina.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, Future] = {}
+        self._async_calls: Dict[Hashable, asyncio.Future] = {}
+        self._streams: Dict[Hashable, Any] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, function: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Future()
+        if not leader:
+            self._shared()
+            return call.result()
+
+        try:
+            result = function()
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    async def do_async(self, key: Hashable, function: Callable[[], Awaitable[Any]]) -> Any:
+        call = self._async_calls.get(key)
+        if call is not None:
+            self._shared()
+        else:
+            call = self._async_calls[key] = asyncio.ensure_future(function())
+            call.add_done_callback(lambda _: self._async_calls.pop(key, None))
+        # shield: cancelar quem espera não cancela o cálculo dos demais
+        return await asyncio.shield(call)
+
+    def stream(self, key: Hashable, function: Callable[[], Iterator[str]]) -> Iterator[str]:
+        with self._lock:
+            shared = self._streams.get(key)
+            if shared is not None and shared.attach():
+                self._shared()
+            else:
+                shared = self._streams[key] = _SharedStream(
+                    iter(function()), lambda: self._end_stream(key, shared))
+                shared.attach()
+        return shared.reader()
+
+    def stream_async(self, key: Hashable,
+                     function: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        shared = self._streams.get(key)
+        if shared is not None and shared.attach():
+            self._shared()
+        else:
+            shared = self._streams[key] = _SharedAsyncStream(
+                function(), lambda: self._end_stream(key, shared))
+            shared.attach()
+        return shared.reader()
+
+    def _end_stream(self, key: Hashable, shared: Any):
+        with self._lock:
+            # A chave pode já apontar para um stream novo da mesma chamada
+            if self._streams.get(key) is shared:
+                del self._streams[key]
+
+    def _shared(self):
+        record_scheduler_event(f"shared_{self.name}")
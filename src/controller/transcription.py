@@ -0,0 +1,276 @@
+"""
+Serviço de transcrição de mensagens de voz com um pool de workers.
+
+Cada worker é uma thread com o seu próprio WhisperModel (o CTranslate2 libera
+o GIL durante a inferência), então várias mensagens de voz são transcritas em
+paralelo sem disputar uma única instância do modelo. A fila é limitada: quando
+todos os workers estão ocupados o usuário é informado da sua posição e, quando
+a fila está cheia, a mensagem é rejeitada.
+
+O áudio baixado do Telegram é decodificado em memória (PyAV), sem passar por
+arquivos temporários, e notas longas podem usar o BatchedInferencePipeline
+do faster-whisper, que decodifica vários trechos do áudio em lote.
+
+O faster-whisper só é importado e os modelos só são carregados em start(),
+que retorna imediatamente: a carga acontece em uma thread própria e as
+mensagens que chegarem antes aguardam na fila. Se a carga falhar, as
+mensagens recebem o erro e uma nova tentativa é feita na primeira mensagem
+depois de `load_retry` segundos.
+"""
+import io
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from faster_whisper import BatchedInferencePipeline, WhisperModel
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """A fila de transcrição atingiu o limite configurado."""
+
+
+@dataclass
+class TranscriptionResult:
+    text: str
+    queued_seconds: float
+    transcribe_seconds: float
+    batched: bool = False
+
+
+@dataclass
+class _Job:
+    audio: Any
+    duration: float
+    future: Future
+    enqueued_at: float
+
+
+class TranscriptionService:
+    """
+    Pool de workers de transcrição com fila limitada.
+
+    Args:
+        model_size (str): Tamanho do modelo faster-whisper (ex.: "small").
+        workers (int): Número de workers, cada um com o seu modelo.
+        cpu_threads (int): Threads do CTranslate2 usadas por cada modelo.
+        queue_size (int): Mensagens que podem aguardar além das em processamento.
+        language (str, optional): Idioma do áudio; None para detecção automática.
+        beam_size (int): Tamanho do beam search na decodificação.
+        batch_size (int): Tamanho do lote do BatchedInferencePipeline.
+        batched_min_duration (float, optional): Duração mínima, em segundos,
+            para usar a transcrição em lote; None desativa o modo em lote.
+        load_retry (float): Segundos após uma falha na carga dos modelos até
+            que start() tente carregá-los de novo.
+    """
+
+    def __init__(self, model_size: str, workers: int, cpu_threads: int, queue_size: int,
+                 language: Optional[str] = None, beam_size: int = 5, batch_size: int = 8,
+                 batched_min_duration: Optional[float] = None, load_retry: float = 60):
+        self.model_size = model_size
+        self.workers = workers
+        self.cpu_threads = cpu_threads
+        self.queue_size = queue_size
+        self.language = language
+        self.beam_size = beam_size
+        self.batch_size = batch_size
+        self.batched_min_duration = batched_min_duration
+        self.load_retry = load_retry
+        self._jobs: "queue.Queue[Optional[_Job]]" = queue.Queue()
+        self._threads: List[threading.Thread] = []
+        self._loader: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+        self._load_error: Optional[BaseException] = None
+        self._failed_at = 0.0
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def start(self):
+        """
+        Inicia, em segundo plano, a carga dos modelos (um por worker) e as
+        threads dos workers. Chamadas repetidas não têm efeito, exceto depois
+        de uma falha na carga: passados `load_retry` segundos, a carga é
+        tentada de novo.
+        """
+        with self._lock:
+            if self._load_error is not None:
+                if time.monotonic() - self._failed_at < self.load_retry:
+                    return
+                logger.info("Retrying to load the Whisper model '%s'.", self.model_size)
+                # Nesta ordem: `ready` nunca vê o evento antigo sem o erro
+                self._ready.clear()
+                self._load_error = None
+                self._loader = None
+            if self._loader is not None:
+                return
+            self._loader = threading.Thread(
+                target=self._load, name="transcription-loader", daemon=True)
+            self._loader.start()
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """
+        Aguarda a carga dos modelos.
+
+        Returns:
+            bool: False se o tempo acabar antes.
+
+        Raises:
+            Exception: O erro da carga, se algum modelo não pôde ser carregado.
+        """
+        finished = self._ready.wait(timeout)
+        if self._load_error is not None:
+            raise self._load_error
+        return finished
+
+    @property
+    def ready(self) -> bool:
+        """True quando os modelos estão carregados e os workers atendendo."""
+        return self._ready.is_set() and self._load_error is None
+
+    def _load(self):
+        started_at = time.perf_counter()
+        try:
+            from faster_whisper import WhisperModel
+
+            models = [
+                # 'int8' é crucial para otimizar velocidade e RAM na CPU
+                WhisperModel(self.model_size, device="cpu", compute_type="int8",
+                             cpu_threads=self.cpu_threads)
+                for _ in range(self.workers)
+            ]
+        except Exception as e:
+            logger.exception("Could not load the Whisper model '%s': %s", self.model_size, e)
+            with self._lock:
+                self._load_error = e
+                self._failed_at = time.monotonic()
+            # Ninguém vai atender as mensagens que já estavam na fila
+            while True:
+                try:
+                    job = self._jobs.get_nowait()
+                except queue.Empty:
+                    break
+                if job is not None:
+                    job.future.set_exception(e)
+                    with self._lock:
+                        self._pending -= 1
+            self._ready.set()
+            return
+
+        for number, model in enumerate(models):
+            thread = threading.Thread(
+                target=self._run, args=(model,),
+                name=f"transcription-{number}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        self._ready.set()
+        logger.info(
+            "Transcription service started with %s workers (%s CPU threads each) in %.2fs.",
+            self.workers, self.cpu_threads, time.perf_counter() - started_at)
+
+    def stop(self):
+        """Encerra os workers após as transcrições já enfileiradas."""
+        if self._loader is not None:
+            self._loader.join()
+        for _ in self._threads:
+            self._jobs.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads.clear()
+        self._loader = None
+        self._ready.clear()
+        self._load_error = None
+
+    @property
+    def depth(self) -> int:
+        """Número de mensagens em processamento ou aguardando na fila."""
+        with self._lock:
+            return self._pending
+
+    def submit(self, audio: bytes, duration: float = 0) -> Tuple[Future, int]:
+        """
+        Enfileira um áudio para transcrição, iniciando a carga dos modelos
+        se ela ainda não começou.
+
+        Args:
+            audio (bytes): O conteúdo do arquivo de áudio (ex.: OGG do Telegram).
+            duration (float): Duração informada pelo Telegram, em segundos.
+
+        Returns:
+            Tuple[Future, int]: O Future com o TranscriptionResult e a posição
+            na fila (0 se um worker está livre e a transcrição começa já).
+
+        Raises:
+            QueueFullError: Se a fila estiver cheia.
+            Exception: O erro da última carga, se os modelos não puderam ser
+                carregados e a próxima tentativa ainda não começou.
+        """
+        self.start()
+        future: Future = Future()
+        with self._lock:
+            if self._load_error is not None:
+                raise self._load_error
+            if self._pending >= self.workers + self.queue_size:
+                raise QueueFullError(
+                    f"Transcription queue is full ({self._pending} pending).")
+            position = max(0, self._pending - self.workers + 1)
+            self._pending += 1
+            # Dentro do lock: uma falha na carga não deixa o job sem resposta
+            self._jobs.put(_Job(audio, duration, future, time.perf_counter()))
+        return future, position
+
+    def _transcribe(self, model: "WhisperModel", pipeline: Optional["BatchedInferencePipeline"],
+                    job: _Job) -> Tuple[str, bool]:
+        from faster_whisper import decode_audio
+
+        # Decodifica direto da memória para um array de 16 kHz
+        audio = decode_audio(io.BytesIO(job.audio), sampling_rate=16000)
+        if pipeline is not None and job.duration >= self.batched_min_duration:
+            segments, _ = pipeline.transcribe(
+                audio, language=self.language, beam_size=self.beam_size,
+                batch_size=self.batch_size, vad_filter=True)
+            batched = True
+        else:
+            segments, _ = model.transcribe(
+                audio, language=self.language, beam_size=self.beam_size,
+                vad_filter=True)
+            batched = False
+        return " ".join([segment.text for segment in segments]).strip(), batched
+
+    def _run(self, model: "WhisperModel"):
+        pipeline = None
+        if self.batched_min_duration is not None:
+            from faster_whisper import BatchedInferencePipeline
+
+            pipeline = BatchedInferencePipeline(model=model)
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            try:
+                if not job.future.set_running_or_notify_cancel():
+                    continue
+                started_at = time.perf_counter()
+                text, batched = self._transcribe(model, pipeline, job)
+                result = TranscriptionResult(
+                    text=text,
+                    queued_seconds=started_at - job.enqueued_at,
+                    transcribe_seconds=time.perf_counter() - started_at,
+                    batched=batched,
+                )
+                logger.info(
+                    "Transcription of %ss of audio finished in %.2fs (waited %.2fs in queue, "
+                    "batched=%s).",
+                    job.duration, result.transcribe_seconds, result.queued_seconds, batched)
+                job.future.set_result(result)
+            except Exception as e:
+                logger.exception("Transcription failed: %s", e)
+                job.future.set_exception(e)
+            finally:
+                with self._lock:
+                    self._pending -= 1
@@ -0,0 +1,272 @@
+"""
+Recebimento das atualizações do Telegram por webhook, alternativa ao polling.
+
+Um servidor HTTP local recebe os POSTs do Telegram, confere o cabeçalho
+X-Telegram-Bot-Api-Secret-Token e enfileira a atualização em um pool de
+workers limitado (ChatDispatcher). As atualizações de um mesmo chat são
+processadas uma de cada vez, na ordem de chegada; chats diferentes avançam em
+paralelo. Com a fila cheia o servidor responde 503 e o Telegram reenvia a
+atualização mais tarde.
+
+O bot deve ser criado com `threaded=False`, para que os handlers rodem no
+worker do dispatcher e a ordem por chat seja respeitada.
+"""
+import hmac
+import json
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Deque, Dict, Hashable, List, Optional
+
+from instrumentation import record_stage
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+MAX_BODY_BYTES = 1024 * 1024
+
+# Atualizações cujo chat está em `<tipo>.chat.id`
+_CHAT_UPDATES = ("message", "edited_message", "channel_post", "edited_channel_post",
+                 "business_message", "edited_business_message")
+# Atualizações sem chat, ordenadas pelo usuário que as gerou (`<tipo>.from.id`)
+_USER_UPDATES = ("inline_query", "chosen_inline_result", "shipping_query",
+                 "pre_checkout_query", "my_chat_member", "chat_member", "chat_join_request")
+
+
+def chat_key(update: Dict[str, Any]) -> Hashable:
+    """
+    Chave de ordenação de uma atualização: o chat (ou o usuário) de origem.
+    Atualizações sem origem conhecida usam o próprio update_id.
+    """
+    key = None
+    for kind in _CHAT_UPDATES:
+        if kind in update:
+            key = (update[kind].get("chat") or {}).get("id")
+    callback = update.get("callback_query")
+    if callback is not None:
+        key = ((callback.get("message") or {}).get("chat") or {}).get("id")
+        if key is None:
+            key = (callback.get("from") or {}).get("id")
+    for kind in _USER_UPDATES:
+        if kind in update:
+            key = (update[kind].get("from") or {}).get("id")
+    return key if key is not None else ("update", update.get("update_id"))
+
+
+@dataclass
+class _Pending:
+    item: Any
+    enqueued_at: float
+
+
+class ChatDispatcher:
+    """
+    Pool de workers limitado que preserva a ordem das tarefas de cada chat.
+
+    Cada chat com tarefas pendentes tem uma fila própria e é atendido por no
+    máximo um worker por vez; depois de cada tarefa o chat volta para o fim da
+    fila de chats prontos, então um chat muito ativo não monopoliza os workers.
+
+    Args:
+        handler (Callable): Função chamada com cada tarefa.
+        workers (int): Número de threads.
+        queue_size (int): Tarefas aguardando (somando todos os chats) antes de
+            recusar novas.
+    """
+
+    def __init__(self, handler: Callable[[Any], None], workers: int, queue_size: int):
+        self.handler = handler
+        self.workers = workers
+        self.queue_size = queue_size
+        self._chats: Dict[Hashable, Deque[_Pending]] = {}
+        self._ready: "queue.Queue[Optional[Hashable]]" = queue.Queue()
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._drained = threading.Condition(self._lock)
+        self._threads: List[threading.Thread] = []
+
+    def start(self):
+        for number in range(self.workers):
+            thread = threading.Thread(
+                target=self._run, name=f"webhook-worker-{number}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """Encerra os workers após as tarefas já enfileiradas."""
+        # Um chat volta para a fila depois de cada tarefa: espera esvaziar
+        # antes de enviar os sinais de parada
+        with self._drained:
+            while self._pending and self._threads:
+                self._drained.wait()
+        for _ in self._threads:
+            self._ready.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads.clear()
+
+    @property
+    def depth(self) -> int:
+        """Tarefas aguardando ou em processamento."""
+        with self._lock:
+            return self._pending
+
+    def submit(self, key: Hashable, item: Any,
+               on_accept: Optional[Callable[[Any], None]] = None) -> bool:
+        """
+        Enfileira uma tarefa do chat `key`.
+
+        Args:
+            on_accept (Callable, optional): Chamada com a tarefa depois que ela
+                tem lugar garantido na fila e antes de um worker recebê-la.
+                Não é chamada para tarefas recusadas.
+
+        Returns:
+            bool: False se a fila estiver cheia.
+        """
+        with self._lock:
+            if self._pending >= self.queue_size:
+                return False
+            self._pending += 1
+        if on_accept is not None:
+            try:
+                on_accept(item)
+            except Exception as e:
+                logger.exception("Webhook on_accept hook failed: %s", e)
+        with self._lock:
+            chat = self._chats.get(key)
+            if chat is None:
+                # Chat sem tarefas: entra na fila de prontos
+                chat = self._chats[key] = deque()
+                self._ready.put(key)
+            chat.append(_Pending(item, time.perf_counter()))
+        return True
+
+    def _run(self):
+        while True:
+            key = self._ready.get()
+            if key is None:
+                return
+            with self._lock:
+                pending = self._chats[key].popleft()
+            record_stage("webhook.queue", time.perf_counter() - pending.enqueued_at)
+            try:
+                self.handler(pending.item)
+            except Exception as e:
+                logger.exception("Webhook update handler failed: %s", e)
+            finally:
+                with self._lock:
+                    self._pending -= 1
+                    if self._chats[key]:
+                        self._ready.put(key)
+                    else:
+                        del self._chats[key]
+                    if not self._pending:
+                        self._drained.notify_all()
+
+
+class WebhookServer(ThreadingHTTPServer):
+    """
+    Servidor HTTP que recebe as atualizações do Telegram em `path`.
+
+    Args:
+        address (tuple): Endereço (host, porta) do servidor.
+        path (str): Caminho do webhook (ex.: "/telegram").
+        secret (str): Valor esperado no cabeçalho X-Telegram-Bot-Api-Secret-Token.
+        dispatcher (ChatDispatcher): Pool que processa as atualizações (dicts).
+        on_update (Callable, optional): Chamada com cada atualização aceita
+            na fila, na thread do servidor, antes de um worker recebê-la. Uma
+            atualização recusada com 503 não passa por ela.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, path: str, secret: str, dispatcher: ChatDispatcher,
+                 on_update: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self.webhook_path = path
+        self.secret = secret.encode("utf-8")
+        self.dispatcher = dispatcher
+        self.on_update = on_update
+        super().__init__(address, _WebhookHandler)
+
+
+class _WebhookHandler(BaseHTTPRequestHandler):
+    server: WebhookServer
+
+    def do_POST(self):
+        if self.path.split("?", 1)[0] != self.server.webhook_path:
+            self._reply(404)
+            return
+        secret = self.headers.get(SECRET_HEADER, "").encode("utf-8")
+        if not hmac.compare_digest(secret, self.server.secret):
+            logger.warning(
+                "Webhook request from %s with an invalid secret.", self.client_address[0])
+            self._reply(403)
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = 0
+        if length <= 0 or length > MAX_BODY_BYTES:
+            self._reply(413 if length > MAX_BODY_BYTES else 400)
+            return
+        try:
+            update = json.loads(self.rfile.read(length))
+        except ValueError:
+            self._reply(400)
+            return
+        if not isinstance(update, dict) or "update_id" not in update:
+            self._reply(400)
+            return
+
+        if not self.server.dispatcher.submit(chat_key(update), update, self.server.on_update):
+            logger.warning("Webhook queue is full, update %s will be retried.", update['update_id'])
+            self._reply(503)
+            return
+        self._reply(200)
+
+    def _reply(self, status: int):
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        logger.debug("Webhook request: " + format, *args)
+
+
+def serve_webhook(bot, host: str, port: int, path: str, secret: str,
+                  workers: int, queue_size: int,
+                  on_update: Optional[Callable[[Dict[str, Any]], None]] = None):
+    """
+    Recebe as atualizações por webhook até o processo ser interrompido.
+
+    Args:
+        bot (telebot.TeleBot): O bot, criado com `threaded=False`.
+        host (str): Endereço local do servidor.
+        port (int): Porta local do servidor.
+        path (str): Caminho do webhook.
+        secret (str): Token secreto registrado no set_webhook.
+        workers (int): Threads que processam as atualizações.
+        queue_size (int): Atualizações aguardando antes de responder 503.
+        on_update (Callable, optional): Chamada com cada atualização aceita na
+            fila, antes de ela ser processada.
+    """
+    from telebot.types import Update
+
+    def process(update: Dict[str, Any]):
+        bot.process_new_updates([Update.de_json(update)])
+
+    dispatcher = ChatDispatcher(process, workers, queue_size)
+    dispatcher.start()
+    server = WebhookServer((host, port), path, secret, dispatcher, on_update)
+    logger.info("Webhook listening on http://%s:%s%s", host, server.server_port, path)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        dispatcher.stop()
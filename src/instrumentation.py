@@ -0,0 +1,374 @@
+"""
+Instrumentação leve do bot: spans de tempo por etapa e histogramas.
+
+Cada interação é um trace (`trace`) com spans (`span`) para as etapas do
+pipeline (contexto, ação da IA, query, feedback, transcrição...). As durações,
+os tokens e o tamanho dos prompts das chamadas à IA e o número de linhas dos
+resultados são acumulados em histogramas, expostos em formato Prometheus por
+um servidor HTTP local (start_metrics_server) e, opcionalmente, gravados em
+JSON ao encerrar (dump_metrics).
+
+O trace atual fica em uma ContextVar, então os spans funcionam tanto nas
+threads do app.py quanto nas tasks do app_async.py.
+"""
+import functools
+import inspect
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+CHAR_BUCKETS = (256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536)
+ROW_BUCKETS = (0, 1, 5, 10, 50, 100, 1000, 10000, 100000, 1000000)
+
+_INF = 'le="+Inf"'
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_bound(bound: float) -> str:
+    return repr(float(bound))
+
+
+class Counter:
+    """Contador monotônico com rótulos."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def expose(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.label_names, key)} {value}" for key, value in values]
+
+    def snapshot(self) -> List[dict]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [{"labels": dict(zip(self.label_names, key)), "value": value}
+                for key, value in values]
+
+
+@dataclass
+class _Series:
+    buckets: List[int]
+    total: float = 0.0
+    count: int = 0
+
+
+class Histogram:
+    """Histograma com buckets fixos e rótulos, no modelo do Prometheus."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float],
+                 label_names: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.bounds = tuple(sorted(buckets))
+        self.label_names = tuple(label_names)
+        self._series: Dict[Tuple[str, ...], _Series] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        index = bisect_left(self.bounds, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _Series([0] * (len(self.bounds) + 1))
+            series.buckets[index] += 1
+            series.total += value
+            series.count += 1
+
+    def _copy(self) -> List[Tuple[Tuple[str, ...], List[int], float, int]]:
+        with self._lock:
+            return [(key, list(s.buckets), s.total, s.count)
+                    for key, s in sorted(self._series.items())]
+
+    def expose(self) -> List[str]:
+        lines = []
+        for key, buckets, total, count in self._copy():
+            cumulative = 0
+            for bound, bucket in zip(self.bounds, buckets):
+                cumulative += bucket
+                le = f'le="{_format_bound(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, key, le)} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(self.label_names, key, _INF)} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {count}")
+        return lines
+
+    def snapshot(self) -> List[dict]:
+        return [{
+            "labels": dict(zip(self.label_names, key)),
+            "count": count,
+            "sum": total,
+            "buckets": {_format_bound(bound): bucket for bound, bucket in zip(self.bounds, buckets)},
+            "overflow": buckets[-1],
+        } for key, buckets, total, count in self._copy()]
+
+
+class MetricsRegistry:
+    """Conjunto das métricas expostas pelo endpoint e pelo dump em JSON."""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric '{metric.name}' is already registered.")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, label_names: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, label_names))
+
+    def histogram(self, name: str, help: str, buckets: Sequence[float],
+                  label_names: Sequence[str] = ()) -> Histogram:
+        return self._register(Histogram(name, help, buckets, label_names))
+
+    def expose(self) -> str:
+        """Todas as métricas no formato de texto do Prometheus (0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.expose())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: {"type": metric.kind, "help": metric.help,
+                              "series": metric.snapshot()} for metric in metrics}
+
+
+metrics = MetricsRegistry()
+
+STAGE_SECONDS = metrics.histogram(
+    "bot_stage_seconds", "Duração de cada etapa do processamento de uma mensagem.",
+    LATENCY_BUCKETS, ("stage",))
+STAGE_ERRORS = metrics.counter(
+    "bot_stage_errors_total", "Etapas que terminaram com exceção.", ("stage",))
+LLM_PROMPT_CHARS = metrics.histogram(
+    "bot_llm_prompt_chars", "Tamanho, em caracteres, dos prompts enviados à IA.",
+    CHAR_BUCKETS, ("provider", "operation"))
+LLM_TOKENS = metrics.histogram(
+    "bot_llm_tokens", "Tokens por chamada à IA, conforme informado pelo provedor.",
+    TOKEN_BUCKETS, ("provider", "operation", "kind"))
+QUERY_REJECTIONS = metrics.counter(
+    "bot_query_rejections_total", "Queries recusadas ou interrompidas pelo limite de custo.",
+    ("code",))
+QUERY_CACHE = metrics.counter(
+    "bot_query_cache_total", "Consultas ao cache de resultados das queries.", ("result",))
+ACTION_CACHE = metrics.counter(
+    "bot_action_cache_total",
+    "Acertos, falhas e descartes (por tamanho ou expiração) do cache de ações da IA.",
+    ("result",))
+ANSWER_PATHS = metrics.counter(
+    "bot_answer_paths_total",
+    "Respostas formatadas localmente, pelo template da IA ou pela segunda chamada ao LLM.",
+    ("path",))
+SCHEDULER_EVENTS = metrics.counter(
+    "bot_scheduler_events_total",
+    "Solicitações limitadas, substituídas ou compartilhadas pelo escalonador.", ("event",))
+LOG_RECORDS_DROPPED = metrics.counter(
+    "bot_log_records_dropped_total", "Registros de log descartados com a fila do logging cheia.")
+QUERY_ROWS = metrics.histogram(
+    "bot_query_result_rows", "Linhas retornadas pelas queries geradas pela IA.",
+    ROW_BUCKETS)
+
+
+# --- Traces e spans ---
+
+@dataclass
+class Trace:
+    name: str
+    started_at: float
+    spans: List[Tuple[str, float]] = field(default_factory=list)
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+
+
+def _record(stage: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    current = _current_trace.get()
+    if current is not None:
+        current.spans.append((stage, seconds))
+
+
+@contextmanager
+def trace(name: str) -> Iterator[Trace]:
+    """
+    Abre um trace para uma interação; ao final, a duração total é registrada
+    como a etapa `name` e o detalhamento dos spans vai para o log. Um trace
+    aberto dentro de outro também aparece como span do trace externo.
+    """
+    parent = _current_trace.get()
+    current = Trace(name, time.perf_counter())
+    token = _current_trace.set(current)
+    try:
+        yield current
+    except Exception:
+        STAGE_ERRORS.inc(stage=name)
+        raise
+    finally:
+        _current_trace.reset(token)
+        total = time.perf_counter() - current.started_at
+        STAGE_SECONDS.observe(total, stage=name)
+        if parent is not None:
+            parent.spans.append((name, total))
+        breakdown = ", ".join(f"{stage}={seconds * 1000:.0f}ms" for stage, seconds in current.spans)
+        logger.info("Trace %s: %.0fms (%s)", name, total * 1000, breakdown)
+
+
+def traced(name: str) -> Callable:
+    """Decorador que executa a função (síncrona ou coroutine) dentro de um trace."""
+    def decorator(function: Callable) -> Callable:
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                with trace(name):
+                    return await function(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with trace(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """Mede uma etapa e a associa ao trace atual, se houver."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        # Importado aqui: o scheduler importa este módulo
+        from controller.scheduler import Superseded
+        # Uma solicitação substituída não é um erro da etapa
+        if not isinstance(e, Superseded):
+            STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        _record(stage, time.perf_counter() - start)
+
+
+def record_stage(stage: str, seconds: float):
+    """Registra uma duração medida em outro lugar (ex.: a fila da transcrição)."""
+    _record(stage, seconds)
+
+
+def record_llm_call(provider: str, operation: str, prompt_chars: int,
+                    prompt_tokens: Optional[int] = None,
+                    completion_tokens: Optional[int] = None):
+    """Registra o tamanho do prompt e os tokens de uma chamada à IA."""
+    LLM_PROMPT_CHARS.observe(prompt_chars, provider=provider, operation=operation)
+    if prompt_tokens is not None:
+        LLM_TOKENS.observe(prompt_tokens, provider=provider, operation=operation, kind="prompt")
+    if completion_tokens is not None:
+        LLM_TOKENS.observe(completion_tokens, provider=provider, operation=operation,
+                           kind="completion")
+
+
+def record_query_rows(rows: int):
+    QUERY_ROWS.observe(rows)
+
+
+def record_query_rejection(code: str):
+    QUERY_REJECTIONS.inc(code=code)
+
+
+def record_query_cache(result: str):
+    QUERY_CACHE.inc(result=result)
+
+
+def record_action_cache(result: str):
+    ACTION_CACHE.inc(result=result)
+
+
+def record_answer_path(path: str):
+    ANSWER_PATHS.inc(path=path)
+
+
+def record_scheduler_event(event: str):
+    SCHEDULER_EVENTS.inc(event=event)
+
+
+def record_log_dropped():
+    LOG_RECORDS_DROPPED.inc()
+
+
+# --- Exposição ---
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.expose().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("Metrics request: " + format, *args)
+
+
+def start_metrics_server(host: str, port: int) -> ThreadingHTTPServer:
+    """Serve /metrics em uma thread em segundo plano."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info("Metrics endpoint listening on http://%s:%s/metrics", host, server.server_port)
+    return server
+
+
+def dump_metrics(path: str):
+    """Grava um snapshot de todas as métricas em JSON."""
+    try:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(metrics.snapshot(), f, indent=2)
+        logger.info("Metrics written to %s", path)
+    except OSError as e:
+        logger.error("Could not write the metrics to %s: %s", path, e)
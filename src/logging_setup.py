@@ -0,0 +1,148 @@
+"""
+Configuração do logging da aplicação.
+
+Os registros saem das threads do bot por uma fila (QueueHandler) e são
+gravados no arquivo e no console por uma thread própria (QueueListener), de
+modo que uma escrita lenta em disco não atrasa as mensagens. A fila é
+limitada (config.LOG_QUEUE_SIZE): com ela cheia, os registros novos são
+descartados e contados na métrica bot_log_records_dropped_total.
+
+As mensagens usam argumentos no estilo %, formatados apenas quando o nível
+está ativo. Conteúdos grandes (resultados, contextos, respostas da IA) entram
+com preview(), que limita o texto a config.LOG_PREVIEW_CHARS. Eventos de DEBUG
+muito frequentes podem ser amostrados por logger (config.LOG_DEBUG_SAMPLING).
+"""
+import atexit
+import functools
+import logging
+import logging.handlers
+import queue
+import random
+import reprlib
+from typing import Any, Optional
+
+import config
+from instrumentation import record_log_dropped
+
+
+class _PreviewRepr(reprlib.Repr):
+    """reprlib que também resume dataclasses (ex.: QueryResult) campo a campo."""
+
+    def repr_instance(self, obj: Any, level: int) -> str:
+        if hasattr(obj, "__dataclass_fields__") and level > 0:
+            fields = ", ".join(f"{name}={self.repr1(getattr(obj, name), level - 1)}"
+                               for name in obj.__dataclass_fields__)
+            return f"{type(obj).__name__}({fields})"
+        return super().repr_instance(obj, level)
+
+
+@functools.lru_cache(maxsize=8)
+def _repr_for(limit: int) -> _PreviewRepr:
+    """
+    Um _PreviewRepr por limite. As instâncias nunca são alteradas depois de
+    criadas, então podem ser usadas por várias threads ao mesmo tempo.
+    """
+    instance = _PreviewRepr()
+    instance.maxlevel = 4
+    instance.maxlist = instance.maxtuple = instance.maxset = instance.maxdict = 10
+    # Cada valor interno recebe uma parte do limite total
+    instance.maxstring = instance.maxother = max(20, limit // 4)
+    return instance
+
+
+class Preview:
+    """
+    Texto de `value` limitado a `limit` caracteres. Só é gerado se o registro
+    for formatado, então não custa nada com o nível desativado.
+    """
+
+    __slots__ = ("value", "limit")
+
+    def __init__(self, value: Any, limit: Optional[int] = None):
+        self.value = value
+        self.limit = limit
+
+    def __str__(self) -> str:
+        limit = self.limit or config.LOG_PREVIEW_CHARS
+        if isinstance(self.value, str):
+            text = self.value
+        else:
+            text = _repr_for(limit).repr(self.value)
+        if len(text) > limit:
+            text = f"{text[:limit]}… (+{len(text) - limit} chars)"
+        return text
+
+    __repr__ = __str__
+
+
+def preview(value: Any, limit: Optional[int] = None) -> Preview:
+    """Argumento de log com tamanho limitado, para conteúdos que podem ser grandes."""
+    return Preview(value, limit)
+
+
+class SamplingFilter(logging.Filter):
+    """Deixa passar apenas a fração `rate` dos registros de DEBUG de um logger."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno > logging.DEBUG or random.random() < self.rate
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler que nunca bloqueia: com a fila cheia, o registro é descartado."""
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            record_log_dropped()
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def setup_logging():
+    """
+    Configura o logging a partir do config.py. Chamadas repetidas não têm
+    efeito.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    formatter = logging.Formatter(config.LOG_FORMAT, datefmt=config.LOG_DATEFMT)
+    handlers = []
+    if config.LOG_FILE:
+        handlers.append(logging.FileHandler(config.LOG_FILE, encoding='utf-8'))
+    if config.LOG_CONSOLE:
+        handlers.append(logging.StreamHandler())
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    records: "queue.Queue[logging.LogRecord]" = queue.Queue(config.LOG_QUEUE_SIZE)
+    root = logging.getLogger()
+    root.setLevel(config.LOG_LEVEL)
+    root.addHandler(_DroppingQueueHandler(records))
+    for name, level in config.LOG_LEVELS.items():
+        logging.getLogger(name).setLevel(level)
+    for name, rate in config.LOG_DEBUG_SAMPLING.items():
+        logging.getLogger(name).addFilter(SamplingFilter(rate))
+
+    _listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Grava os registros que ainda estão na fila e encerra a thread do logging."""
+    global _listener
+    if _listener is not None:
+        try:
+            _listener.stop()
+        except queue.Full:
+            # Sem espaço para o sinal de parada: a thread (daemon) termina com o processo
+            pass
+        _listener = None
@@ -0,0 +1,101 @@
+"""
+Snapshot em memória do catálogo de produtos.
+
+O catálogo é lido do banco uma única vez e reconstruído apenas quando o banco
+é alterado (detectado com PRAGMA data_version), tirando a varredura da tabela
+e a montagem do contexto do caminho de cada mensagem.
+"""
+import hashlib
+import logging
+import threading
+from typing import List, Optional
+
+from model.db_access import db_version, query_run
+from model.product_index import ProductIndex
+
+logger = logging.getLogger(__name__)
+
+
+class ProductContext(str):
+    """Lista de produtos do prompt, com a versão do catálogo de onde ela veio."""
+
+    def __new__(cls, text: str, version: str):
+        context = super().__new__(cls, text)
+        context.version = version
+        return context
+
+
+class CatalogSnapshot:
+    """
+    Nomes dos produtos, índice de busca e um token de versão do catálogo.
+
+    O atributo `version` muda apenas quando a lista de nomes muda (alterações
+    de quantidade não o afetam). O catálogo completo devolvido por context()
+    é um ProductContext com essa versão, usada como chave pelo cache de ações
+    (controller/action_cache.py) sem recalcular o hash a cada mensagem.
+    """
+
+    def __init__(self, db_name: str):
+        self.db_name = db_name
+        self.version = ""
+        self._state = (ProductIndex([]), ProductContext("", ""))
+        self._data_version: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @property
+    def names(self) -> List[str]:
+        return self._state[0].names
+
+    def refresh(self) -> bool:
+        """
+        Reconstrói o snapshot se o banco foi alterado desde a última leitura.
+
+        Returns:
+            bool: True se o snapshot foi reconstruído.
+
+        Raises:
+            RuntimeError: Se a lista de produtos não puder ser lida.
+        """
+        current = db_version(self.db_name)
+        if current == self._data_version:
+            return False
+
+        with self._lock:
+            if current == self._data_version:
+                return False
+
+            # Query interna: lê o catálogo inteiro, fora do limite de custo
+            result = query_run(
+                self.db_name, "SELECT name FROM products ORDER BY id;", guarded=False)
+            if not isinstance(result, list):
+                raise RuntimeError(f"Could not read the product catalog: {result}")
+
+            # Filtra itens vazios ou malformados com mais segurança
+            names = [row[0] for row in result if row and isinstance(row[0], str)]
+            if names != self.names:
+                version = hashlib.sha1("\n".join(names).encode("utf-8")).hexdigest()[:16]
+                # Substituição atômica: leitores nunca veem um estado parcial
+                self._state = (ProductIndex(names), ProductContext(", ".join(names), version))
+                self.version = version
+                logger.info("Catalog snapshot rebuilt: %s products, version %s.",
+                            len(names), self.version)
+            self._data_version = current
+            return True
+
+    def context(self, user_request: str, top_k: int) -> str:
+        """
+        Monta a lista de produtos para o prompt.
+
+        Catálogos com até top_k produtos são injetados por completo (a string
+        já fica pronta no snapshot); catálogos maiores passam pela busca.
+
+        Returns:
+            str: Os nomes separados por vírgula (um ProductContext, se for o
+            catálogo completo), ou uma string vazia se nenhum produto
+            corresponder à solicitação.
+        """
+        self.refresh()
+        index, full_context = self._state
+        if len(index) <= top_k:
+            return full_context
+        return ", ".join(index.search(user_request, top_k))
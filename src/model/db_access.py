@@ -1,10 +1,147 @@
 import logging
+import math
+import pathlib
+import re
 import sqlite3
-from typing import List, Any, Tuple
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Any, Optional, Tuple
+
+import config
+from instrumentation import record_query_cache, record_query_rejection
+from logging_setup import preview
+from model.query_log import QueryLog
+from model.result_cache import ResultCache, is_deterministic
 
 # Configura um logger específico para este módulo
 logger = logging.getLogger(__name__)
 
+# Conexões dedicadas ao monitoramento de alterações, uma por banco de dados
+_version_connections: Dict[str, sqlite3.Connection] = {}
+_version_lock = threading.Lock()
+
+# Pools de conexões de leitura, um por banco de dados
+_pools: Dict[str, "ConnectionPool"] = {}
+_pools_lock = threading.Lock()
+
+# Registro das queries executadas, usado pelo consultor de índices
+query_log = QueryLog(
+    config.QUERY_LOG_FILE, config.QUERY_LOG_MAX_ENTRIES, config.QUERY_LOG_QUEUE_SIZE)
+
+# Resultados das queries de leitura, invalidados pelo data_version do banco
+result_cache = ResultCache(config.QUERY_CACHE_MAX_BYTES, config.QUERY_CACHE_MAX_ENTRY_BYTES)
+
+
+def open_readonly(db_name: str) -> sqlite3.Connection:
+    """
+    Abre uma conexão somente leitura ajustada para consultas.
+
+    A conexão usa o modo URI `mode=ro` e `PRAGMA query_only`, de modo que
+    nenhuma escrita é possível mesmo que uma query passe pela validação.
+    O cache de prepared statements do sqlite3 (`cached_statements`) é
+    reaproveitado enquanto a conexão viver.
+
+    Args:
+        db_name (str): Nome do arquivo do banco de dados.
+
+    Returns:
+        sqlite3.Connection: A conexão aberta.
+    """
+    uri = f"{pathlib.Path(db_name).resolve().as_uri()}?mode=ro"
+    conn = sqlite3.connect(
+        uri, uri=True, check_same_thread=False,
+        cached_statements=config.DB_STATEMENT_CACHE_SIZE)
+    conn.execute("PRAGMA query_only = ON;")
+    conn.execute(f"PRAGMA mmap_size = {int(config.DB_MMAP_SIZE)};")
+    conn.execute(f"PRAGMA cache_size = {int(config.DB_CACHE_SIZE)};")
+    return conn
+
+
+class ConnectionPool:
+    """
+    Pool thread-safe de conexões somente leitura para um banco de dados.
+
+    As conexões são criadas sob demanda até o limite `size` e reutilizadas
+    entre as chamadas, evitando o custo de abrir o arquivo e reler o schema
+    a cada query. Quando todas estão em uso, a chamada aguarda uma ser
+    devolvida.
+    """
+
+    def __init__(self, db_name: str, size: int):
+        self.db_name = db_name
+        self.size = size
+        self._idle: List[sqlite3.Connection] = []
+        self._created = 0
+        self._closed = False
+        self._available = threading.Condition()
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Empresta uma conexão do pool durante o bloco `with`."""
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+
+    def _acquire(self) -> sqlite3.Connection:
+        with self._available:
+            while True:
+                if self._closed:
+                    raise sqlite3.ProgrammingError("The connection pool is closed.")
+                if self._idle:
+                    return self._idle.pop()
+                if self._created < self.size:
+                    self._created += 1
+                    break
+                self._available.wait()
+
+        try:
+            return open_readonly(self.db_name)
+        except sqlite3.Error:
+            with self._available:
+                self._created -= 1
+                self._available.notify()
+            raise
+
+    def _release(self, conn: sqlite3.Connection):
+        with self._available:
+            if self._closed:
+                conn.close()
+                return
+            self._idle.append(conn)
+            self._available.notify()
+
+    def close(self):
+        """Fecha as conexões ociosas; as emprestadas são fechadas ao voltar."""
+        with self._available:
+            self._closed = True
+            for conn in self._idle:
+                conn.close()
+            self._idle.clear()
+            self._available.notify_all()
+
+
+def get_pool(db_name: str) -> ConnectionPool:
+    """Retorna o pool de conexões do banco, criando-o no primeiro uso."""
+    with _pools_lock:
+        pool = _pools.get(db_name)
+        if pool is None:
+            pool = ConnectionPool(db_name, config.DB_POOL_SIZE)
+            _pools[db_name] = pool
+        return pool
+
+
+def close_pools():
+    """Fecha todos os pools de conexões abertos."""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
 
 def open_schema(file_schema: str) -> str:
     """
@@ -22,11 +159,10 @@ def open_schema(file_schema: str) -> str:
     try:
         with open(file_schema, 'r', encoding='utf-8') as file:
             schema = file.read()
-            logger.debug(f"Schema '{file_schema}' was read successfully.")
+            logger.debug("Schema '%s' was read successfully.", file_schema)
             return schema
     except FileNotFoundError as e:
-        logger.error(
-            f"Schema file not found in '{file_schema}': {e}")
+        logger.error("Schema file not found in '%s': %s", file_schema, e)
         raise
 
 
@@ -42,17 +178,240 @@ def init_db(db_name: str, schema: str):
         raise ValueError("The schema content cannot be empty.")
     try:
         with sqlite3.connect(db_name) as conn:
+            # WAL permite que os leitores do bot não bloqueiem escritas
+            conn.execute("PRAGMA journal_mode = WAL;")
             conn.executescript(schema)
             conn.commit()
-            logger.info(
-                f"Database '{db_name}' initialized successfully.")
+            logger.info("Database '%s' initialized successfully.", db_name)
     except sqlite3.Error as e:
-        logger.exception(
-            f"SQLite error when initializing the database '{db_name}': {e}")
+        logger.exception("SQLite error when initializing the database '%s': %s", db_name, e)
+        raise
+
+
+def _is_allowed(query: str) -> bool:
+    """
+    Somente operações de leitura são permitidas. Outras operações (UPDATE,
+    INSERT) devem ter funções específicas se necessárias.
+    """
+    return query.strip().lower().startswith(config.ALLOWED_QUERY_STARTERS)
+
+
+# --- Limite de custo das queries ---
+
+# Códigos de erro das queries recusadas (QueryError.code)
+NOT_PERMITTED = "not_permitted"
+SQL_ERROR = "sql_error"
+CARTESIAN_PRODUCT = "cartesian_product"
+FULL_SCAN = "full_scan"
+BUDGET_EXCEEDED = "budget_exceeded"
+TIMEOUT = "timeout"
+TOO_MANY_ROWS = "too_many_rows"
+
+_SCAN_RE = re.compile(r"^SCAN (?!CONSTANT ROW)(\S+)")
+_TABLE_RE = re.compile(r"(?:\bFROM|\bJOIN|,)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?", re.IGNORECASE)
+_LIMIT_RE = re.compile(r"\bLIMIT\s+\d+", re.IGNORECASE)
+_NOT_ALIASES = frozenset((
+    "where", "join", "inner", "left", "right", "full", "cross", "natural", "on", "using",
+    "group", "order", "limit", "having", "union", "except", "intersect", "window", "from"))
+
+
+class QueryError(str):
+    """
+    Mensagem de erro de uma query, com um código estável em `code`.
+
+    É uma str para que os chamadores que tratam o retorno de erro de
+    query_run/query_stream como texto continuem funcionando.
+    """
+    code: str
+
+    def __new__(cls, code: str, message: str):
+        error = super().__new__(cls, message)
+        error.code = code
+        return error
+
+
+class _QueryRejected(Exception):
+    def __init__(self, code: str, message: str):
+        super().__init__(message)
+        self.error = QueryError(code, message)
+
+
+def _aliases(query: str) -> Dict[str, str]:
+    """Mapeia os aliases do FROM/JOIN para os nomes das tabelas."""
+    aliases = {}
+    for table, alias in _TABLE_RE.findall(query):
+        if alias and alias.lower() not in _NOT_ALIASES:
+            aliases[alias.lower()] = table
+    return aliases
+
+
+def _table_rows(conn: sqlite3.Connection, name: str) -> Optional[int]:
+    """Estimativa barata do número de linhas (maior rowid); None se não for uma tabela."""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ? COLLATE NOCASE;",
+        (name,)).fetchone()
+    if not exists:
+        return None
+    quoted = name.replace('"', '""')
+    try:
+        return conn.execute(f'SELECT max(rowid) FROM "{quoted}";').fetchone()[0] or 0
+    except sqlite3.Error:
+        # Tabelas WITHOUT ROWID não têm estimativa
+        return None
+
+
+def _check_plan(conn: sqlite3.Connection, query: str, plan: List[Tuple[Any, ...]]):
+    """
+    Recusa, pelo EXPLAIN QUERY PLAN, produtos cartesianos e varreduras
+    completas de tabelas grandes, antes de executar a query.
+    """
+    aliases = _aliases(query)
+    # Uma varredura com LIMIT e sem ordenação para cedo; o orçamento de
+    # instruções cobre os casos em que não para
+    stops_early = bool(_LIMIT_RE.search(query)) and not any(
+        detail.startswith("USE TEMP B-TREE") for *_, detail in plan)
+
+    # Varreduras completas agrupadas pelo nível do plano (o mesmo laço de join)
+    scans: Dict[int, List[Tuple[str, Optional[int]]]] = defaultdict(list)
+    for _, parent, _, detail in plan:
+        match = _SCAN_RE.match(detail)
+        if match:
+            name = match.group(1)
+            scans[parent].append((name, _table_rows(conn, aliases.get(name.lower(), name))))
+
+    for level in scans.values():
+        sizes = [rows for _, rows in level if rows is not None]
+        if len(level) > 1 and sizes:
+            combinations = math.prod(sizes)
+            if combinations > config.QUERY_CARTESIAN_MAX_ROWS:
+                names = ", ".join(name for name, _ in level)
+                raise _QueryRejected(
+                    CARTESIAN_PRODUCT,
+                    f"The query combines every row of {names} (about {combinations} "
+                    "combinations). Join the tables on an indexed column.")
+        for name, rows in level:
+            if not stops_early and rows is not None and rows > config.QUERY_FULL_SCAN_MAX_ROWS:
+                raise _QueryRejected(
+                    FULL_SCAN,
+                    f"The query reads all {rows} rows of {name}. "
+                    "Filter it by an indexed column or use a LIMIT.")
+
+
+class _ExecutionBudget:
+    """Progress handler que interrompe a query ao estourar o orçamento ou o tempo."""
+
+    def __init__(self, max_steps: int, timeout: float, interval: int):
+        self.max_calls = max(1, max_steps // interval)
+        self.deadline = time.monotonic() + timeout
+        self.calls = 0
+        self.exceeded: Optional[str] = None
+
+    def __call__(self) -> int:
+        self.calls += 1
+        if self.calls > self.max_calls:
+            self.exceeded = BUDGET_EXCEEDED
+            return 1
+        if time.monotonic() > self.deadline:
+            self.exceeded = TIMEOUT
+            return 1
+        return 0
+
+
+@dataclass
+class _Execution:
+    """O que é registrado no query_log sobre uma execução."""
+    plan: List[Tuple[Any, ...]] = field(default_factory=list)
+    rows: Optional[int] = None
+    error_code: Optional[str] = None
+
+
+@contextmanager
+def _guarded(conn: sqlite3.Connection, query: str, enabled: bool,
+             execution: _Execution, explain: bool) -> Iterator[None]:
+    """
+    Executa o bloco com o limite de custo: inspeção do plano, orçamento de
+    instruções da VM e tempo máximo (via set_progress_handler, que interrompe
+    a query do mesmo modo que conn.interrupt()).
+
+    Raises:
+        _QueryRejected: Se a query for recusada ou interrompida.
+    """
+    if enabled or explain:
+        execution.plan = conn.execute(f"EXPLAIN QUERY PLAN {query}").fetchall()
+    if not enabled:
+        yield
+        return
+
+    _check_plan(conn, query, execution.plan)
+    budget = _ExecutionBudget(
+        config.QUERY_MAX_VM_STEPS, config.QUERY_TIMEOUT, config.QUERY_PROGRESS_STEPS)
+    conn.set_progress_handler(budget, config.QUERY_PROGRESS_STEPS)
+    try:
+        yield
+    except sqlite3.OperationalError as e:
+        if budget.exceeded == TIMEOUT:
+            raise _QueryRejected(
+                TIMEOUT,
+                f"The query was interrupted after {config.QUERY_TIMEOUT:g}s. "
+                "Narrow it down with a WHERE clause or a LIMIT.") from e
+        if budget.exceeded == BUDGET_EXCEEDED:
+            raise _QueryRejected(
+                BUDGET_EXCEEDED,
+                "The query was interrupted because it is too expensive. "
+                "Narrow it down with a WHERE clause or a LIMIT.") from e
         raise
+    finally:
+        # As conexões voltam para o pool sem o handler
+        conn.set_progress_handler(None, 0)
+
+
+def _too_many_rows(limit: int) -> _QueryRejected:
+    return _QueryRejected(
+        TOO_MANY_ROWS,
+        f"The query returns more than {limit} rows. Use a LIMIT or a more specific filter.")
 
 
-def query_run(db_name: str, query: str) -> List[Tuple[Any, ...]] | str:
+def _rejected(query: str, error: QueryError) -> QueryError:
+    logger.warning("Query rejected (%s): '%s': %s", error.code, preview(query), error)
+    record_query_rejection(error.code)
+    return error
+
+
+def _log_execution(db_name: str, query: str, started_at: float, execution: _Execution):
+    query_log.record(
+        str(pathlib.Path(db_name).resolve()), query, time.perf_counter() - started_at,
+        execution.rows, [row[-1] for row in execution.plan], execution.error_code)
+
+
+def _cache_version(db_name: str, query: str) -> Optional[int]:
+    """
+    Versão do banco para o cache de resultados; None desativa o cache nesta
+    chamada, inclusive para queries não determinísticas. É lida ANTES da
+    execução: se uma escrita acontecer no meio, o resultado fica marcado com
+    a versão antiga e é descartado na próxima leitura, nunca o contrário.
+    """
+    if not config.QUERY_CACHE_ENABLED:
+        return None
+    if not is_deterministic(query):
+        record_query_cache("skipped")
+        return None
+    try:
+        return db_version(db_name)
+    except sqlite3.Error as e:
+        logger.warning("Query cache disabled for '%s': %s", db_name, e)
+        return None
+
+
+def _cache_lookup(key: Tuple[Any, ...], version: Optional[int]) -> Optional[Any]:
+    if version is None:
+        return None
+    cached = result_cache.get(key, version)
+    record_query_cache("hit" if cached is not None else "miss")
+    return cached
+
+
+def query_run(db_name: str, query: str,
+              guarded: bool = True) -> List[Tuple[Any, ...]] | QueryError:
     """
     Executa uma query de LEITURA (SELECT) de forma segura.
     Retorna os resultados como uma lista de tuplas ou uma mensagem de erro.
@@ -60,26 +419,205 @@ def query_run(db_name: str, query: str) -> List[Tuple[Any, ...]] | str:
     Args:
         db_name (str): Nome do arquivo do banco de dados.
         query (str): A query SQL a ser executada.
+        guarded (bool): Aplica o limite de custo (config.QUERY_*) e usa o
+            cache de resultados. Apenas as queries internas da aplicação
+            devem desativá-lo.
 
     Returns:
         List[Tuple[Any, ...]]: Uma lista de tuplas com os resultados
         da consulta.
-        str: Uma mensagem de erro se a query falhar ou não for permitida.
+        QueryError: Uma mensagem de erro (str) com o código em `code` se a
+        query falhar, não for permitida ou exceder os limites.
     """
 
-    # Outras operações (UPDATE, INSERT) devem ter funções específicas
-    # se necessárias.
-    if not query.strip().lower().startswith("select"):
-        logger.warning(f"Attempt to execute query not allowed: {query}")
-        return "Operation not permitted."
+    if not _is_allowed(query):
+        return _rejected(query, QueryError(NOT_PERMITTED, "Operation not permitted."))
 
+    enabled = guarded and config.QUERY_GUARD_ENABLED
+    version = _cache_version(db_name, query) if guarded else None
+    key = ResultCache.make_key(db_name, query, "run", enabled)
+    cached = _cache_lookup(key, version)
+    if cached is not None:
+        logger.debug("Query result served from the cache: '%s'", query)
+        return list(cached)
+
+    logged = guarded and config.QUERY_LOG_ENABLED
+    execution = _Execution()
+    started_at = time.perf_counter()
     try:
-        with sqlite3.connect(db_name) as conn:
+        with get_pool(db_name).connection() as conn:
+            with _guarded(conn, query, enabled, execution, explain=logged):
+                cursor = conn.cursor()
+                cursor.execute(query)
+                if enabled:
+                    limit = config.QUERY_MAX_OUTPUT_ROWS
+                    result = cursor.fetchmany(limit + 1)
+                    if len(result) > limit:
+                        raise _too_many_rows(limit)
+                else:
+                    result = cursor.fetchall()
+            execution.rows = len(result)
+            logger.debug("Query executed successfully. Result: %s", preview(result))
+            if version is not None:
+                result_cache.put(key, version, tuple(result))
+            return result
+    except _QueryRejected as e:
+        execution.error_code = e.error.code
+        return _rejected(query, e.error)
+    except sqlite3.Error as e:
+        execution.error_code = SQL_ERROR
+        logger.error("Error executing the query. '%s': %s", preview(query), e)
+        return QueryError(SQL_ERROR, f"There is a syntax error in your request: {e}")
+    finally:
+        if logged:
+            _log_execution(db_name, query, started_at, execution)
+
+
+@dataclass
+class ColumnStats:
+    """Estatísticas de uma coluna numérica, acumuladas linha a linha."""
+    count: int = 0
+    minimum: Optional[float] = None
+    maximum: Optional[float] = None
+    total: float = 0
+
+    def add(self, value: Any):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return
+        self.count += 1
+        self.total += value
+        self.minimum = value if self.minimum is None else min(self.minimum, value)
+        self.maximum = value if self.maximum is None else max(self.maximum, value)
+
+    @property
+    def average(self) -> Optional[float]:
+        return self.total / self.count if self.count else None
+
+
+@dataclass
+class QueryResult:
+    """
+    Resultado limitado de uma query.
+
+    `rows` contém no máximo `max_rows` linhas, mas `total_rows` e `stats`
+    consideram todas as linhas que a query produziu.
+    """
+    columns: List[str]
+    rows: List[Tuple[Any, ...]]
+    total_rows: int
+    stats: Dict[str, ColumnStats] = field(default_factory=dict)
+
+    @property
+    def truncated(self) -> bool:
+        return self.total_rows > len(self.rows)
+
+
+def query_stream(db_name: str, query: str,
+                 max_rows: Optional[int] = None) -> QueryResult | QueryError:
+    """
+    Executa uma query de LEITURA guardando apenas as primeiras linhas.
+
+    As linhas excedentes são lidas em lotes com fetchmany e descartadas após
+    atualizar a contagem e as estatísticas das colunas numéricas, de modo que
+    a memória usada não depende do tamanho do resultado.
+
+    Args:
+        db_name (str): Nome do arquivo do banco de dados.
+        query (str): A query SQL a ser executada.
+        max_rows (int, optional): Número máximo de linhas mantidas.
+            Padrão: config.QUERY_MAX_ROWS.
+
+    Resultados repetidos vêm do cache (model/result_cache.py) e são
+    compartilhados: quem os recebe não deve alterá-los. Como a chave usa a
+    forma canônica da query, o nome de uma coluna calculada (ex.:
+    `price*quantity` ou `COUNT(*)`) é o da primeira execução.
+
+    Returns:
+        QueryResult: As linhas mantidas, o total real de linhas e as
+        estatísticas das colunas.
+        QueryError: Uma mensagem de erro (str) com o código em `code` se a
+        query falhar, não for permitida ou exceder os limites.
+    """
+    if max_rows is None:
+        max_rows = config.QUERY_MAX_ROWS
+
+    if not _is_allowed(query):
+        return _rejected(query, QueryError(NOT_PERMITTED, "Operation not permitted."))
+
+    enabled = config.QUERY_GUARD_ENABLED
+    version = _cache_version(db_name, query)
+    key = ResultCache.make_key(db_name, query, "stream", max_rows, enabled)
+    cached = _cache_lookup(key, version)
+    if cached is not None:
+        logger.debug("Query result served from the cache: '%s'", query)
+        return cached
+
+    limit = config.QUERY_MAX_OUTPUT_ROWS if enabled else None
+    execution = _Execution()
+    started_at = time.perf_counter()
+    try:
+        with get_pool(db_name).connection() as conn, \
+                _guarded(conn, query, enabled, execution, explain=config.QUERY_LOG_ENABLED):
             cursor = conn.cursor()
             cursor.execute(query)
-            result = cursor.fetchall()
-            logger.debug(f"Query executed successfully. Result: {result}")
+            columns = [column[0] for column in cursor.description or ()]
+            stats = {name: ColumnStats() for name in columns}
+
+            rows = cursor.fetchmany(max_rows) if max_rows > 0 else []
+            total_rows = 0
+            batch = rows or cursor.fetchmany(config.QUERY_FETCH_BATCH)
+            while batch:
+                total_rows += len(batch)
+                if limit is not None and total_rows > limit:
+                    raise _too_many_rows(limit)
+                for row in batch:
+                    for name, value in zip(columns, row):
+                        stats[name].add(value)
+                batch = cursor.fetchmany(config.QUERY_FETCH_BATCH)
+
+            result = QueryResult(
+                columns=columns,
+                rows=rows,
+                total_rows=total_rows,
+                stats={name: s for name, s in stats.items() if s.count},
+            )
+            execution.rows = total_rows
+            logger.debug("Query executed successfully. %s rows, %s kept.", total_rows, len(rows))
+            if version is not None:
+                result_cache.put(key, version, result)
             return result
+    except _QueryRejected as e:
+        execution.error_code = e.error.code
+        return _rejected(query, e.error)
     except sqlite3.Error as e:
-        logger.error(f"Error executing the query. '{query}': {e}")
-        return f"There is a syntax error in your request: {e}"
+        execution.error_code = SQL_ERROR
+        logger.error("Error executing the query. '%s': %s", preview(query), e)
+        return QueryError(SQL_ERROR, f"There is a syntax error in your request: {e}")
+    finally:
+        if config.QUERY_LOG_ENABLED:
+            _log_execution(db_name, query, started_at, execution)
+
+
+def db_version(db_name: str) -> int:
+    """
+    Retorna um contador que aumenta sempre que o banco de dados é alterado.
+
+    Usa PRAGMA data_version em uma conexão dedicada que nunca escreve, de
+    modo que qualquer commit feito por outra conexão (ou processo) é
+    detectado. O valor só é comparável dentro do mesmo processo.
+
+    Args:
+        db_name (str): Nome do arquivo do banco de dados.
+
+    Returns:
+        int: O valor atual de data_version.
+
+    Raises:
+        sqlite3.Error: Se não for possível consultar o banco.
+    """
+    with _version_lock:
+        conn = _version_connections.get(db_name)
+        if conn is None:
+            conn = open_readonly(db_name)
+            _version_connections[db_name] = conn
+        return conn.execute("PRAGMA data_version;").fetchone()[0]
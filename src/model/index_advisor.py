@@ -0,0 +1,332 @@
+"""
+Consultor de índices a partir do registro de queries (model/query_log.py).
+
+Agrupa as queries registradas pelo formato, seleciona as que varreram a
+tabela inteira ou ordenaram em uma B-tree temporária e extrai os predicados e
+as chaves de ordenação (ex.: `quantity < ?`, `lower(name) LIKE ?`,
+`ORDER BY quantity`). Para cada formato propõe um índice (igualdades, depois
+um intervalo, depois a ordenação), inclusive índices de expressão, e o testa
+dentro de uma transação: compara o plano e o tempo das queries antes e depois
+e só mantém o índice (com --apply) se o plano melhorar com ele.
+
+Uso (a partir da pasta src):
+    python -m model.index_advisor [--db products.db] [--log query_log.db] [--apply]
+"""
+import argparse
+import re
+import sqlite3
+import statistics
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import config
+from model.query_log import QueryLogEntry, read_entries
+
+_FROM_RE = re.compile(r"\bfrom\s+(\w+)(?:\s+(?:as\s+)?(\w+))?", re.IGNORECASE)
+_WHERE_RE = re.compile(
+    r"\bwhere\s+(.+?)(?=\bgroup\s+by\b|\border\s+by\b|\blimit\b|$)", re.IGNORECASE | re.DOTALL)
+_ORDER_RE = re.compile(r"\border\s+by\s+(.+?)(?=\blimit\b|$)", re.IGNORECASE | re.DOTALL)
+_TERM_RE = re.compile(
+    r"^\(?\s*(?:(?:\w+\.)?(\w+)|(lower|upper)\s*\(\s*(?:\w+\.)?(\w+)\s*\))\s*"
+    r"(==|=|<=|>=|<>|!=|<|>|(?:not\s+like|like|glob|in|between|is\s+not|is)(?!\w))",
+    re.IGNORECASE)
+_ORDER_KEY_RE = re.compile(
+    r"^(?:(?:\w+\.)?(\w+)|(lower|upper)\s*\(\s*(?:\w+\.)?(\w+)\s*\))(?:\s+(asc|desc))?$",
+    re.IGNORECASE)
+_UNSUPPORTED_RE = re.compile(r"\b(join|union|except|intersect)\b|\bfrom\s+\w+\s*,", re.IGNORECASE)
+
+_LIKE_FUNCTION_RE = re.compile(r"\b(?:lower|upper)\s*\(\s*((?:\w+\.)?\w+)\s*\)(\s+like\b)", re.IGNORECASE)
+
+_EQUALITY_OPERATORS = {"=", "==", "in", "is"}
+_RANGE_OPERATORS = {"<", ">", "<=", ">=", "between", "like", "glob"}
+
+
+@dataclass
+class QueryShape:
+    """Um formato de query (fingerprint) e as suas execuções registradas."""
+    fingerprint: str
+    table: str
+    samples: List[QueryLogEntry] = field(default_factory=list)
+
+    @property
+    def count(self) -> int:
+        return len(self.samples)
+
+    @property
+    def total_ms(self) -> float:
+        return sum(entry.duration_ms for entry in self.samples)
+
+
+@dataclass
+class IndexCandidate:
+    table: str
+    keys: Tuple[str, ...]  # Colunas ou expressões, na ordem do índice
+    shapes: List[QueryShape] = field(default_factory=list)
+
+    @property
+    def name(self) -> str:
+        parts = [re.sub(r"\W+", "_", key.lower()).strip("_") for key in self.keys]
+        return f"idx_{self.table}_{'_'.join(parts)}"
+
+    @property
+    def sql(self) -> str:
+        return f'CREATE INDEX IF NOT EXISTS {self.name} ON "{self.table}" ({", ".join(self.keys)});'
+
+
+@dataclass
+class Measurement:
+    plan: List[str]
+    median_ms: Optional[float]  # None se a query excedeu o tempo limite
+
+
+def _split_and(clause: str) -> Optional[List[str]]:
+    """Divide o WHERE nos ANDs de nível superior; None se houver OR."""
+    if re.search(r"\bor\b", clause, re.IGNORECASE):
+        return None
+    # BETWEEN x AND y usa um AND que não separa termos
+    clause = re.sub(r"\bbetween\s+(\S+)\s+and\b", r"between \1 __and__", clause, flags=re.IGNORECASE)
+    return [term.replace("__and__", "and").strip() for term in re.split(r"\band\b", clause, flags=re.IGNORECASE)]
+
+
+def _key(column: str, function: Optional[str], operator: str = "") -> str:
+    if operator == "like":
+        # O LIKE já ignora maiúsculas e só usa índices com collation NOCASE;
+        # lower(name) LIKE ? não usa nenhum índice (ver _case_insensitive_rewrite)
+        return f"{column} COLLATE NOCASE"
+    if function:
+        return f"{function.lower()}({column})"
+    return column
+
+
+def candidate_keys(shape: QueryShape, columns: Sequence[str]) -> Optional[Tuple[str, ...]]:
+    """
+    Chaves do índice para um formato de query: igualdades, depois um
+    intervalo e, se não houver intervalo, as chaves do ORDER BY.
+    """
+    known = {column.lower() for column in columns}
+    query = shape.fingerprint
+    equalities: List[str] = []
+    ranges: List[str] = []
+
+    where = _WHERE_RE.search(query)
+    if where:
+        terms = _split_and(where.group(1))
+        if terms is None:
+            return None
+        for term in terms:
+            match = _TERM_RE.match(term)
+            if not match:
+                continue
+            column = (match.group(1) or match.group(3)).lower()
+            function = match.group(2)
+            operator = re.sub(r"\s+", " ", match.group(4).lower())
+            if column not in known:
+                continue
+            if operator in _EQUALITY_OPERATORS:
+                equalities.append(_key(column, function))
+            elif operator in _RANGE_OPERATORS:
+                ranges.append(_key(column, function, operator))
+
+    order_keys: List[str] = []
+    order = _ORDER_RE.search(query)
+    if order:
+        for item in order.group(1).split(","):
+            match = _ORDER_KEY_RE.match(item.strip())
+            if not match:
+                order_keys = []
+                break
+            column = (match.group(1) or match.group(3)).lower()
+            if column not in known:
+                order_keys = []
+                break
+            key = _key(column, match.group(2))
+            if match.group(4) and match.group(4).lower() == "desc":
+                key += " DESC"
+            order_keys.append(key)
+
+    keys = list(dict.fromkeys(equalities))
+    if ranges:
+        keys.append(ranges[0])
+    else:
+        keys.extend(key for key in order_keys if key not in keys)
+    return tuple(keys) or None
+
+
+def load_shapes(entries: Sequence[QueryLogEntry]) -> List[QueryShape]:
+    """Agrupa as entradas por formato, apenas queries de uma única tabela."""
+    shapes: Dict[str, QueryShape] = {}
+    for entry in entries:
+        if entry.error_code == "sql_error" or _UNSUPPORTED_RE.search(entry.fingerprint):
+            continue
+        shape = shapes.get(entry.fingerprint)
+        if shape is None:
+            match = _FROM_RE.search(entry.fingerprint)
+            if not match:
+                continue
+            shape = shapes[entry.fingerprint] = QueryShape(entry.fingerprint, match.group(1))
+        shape.samples.append(entry)
+    return sorted(shapes.values(), key=lambda shape: shape.total_ms, reverse=True)
+
+
+def needs_index(shape: QueryShape) -> bool:
+    """O formato varreu a tabela inteira ou ordenou em uma B-tree temporária."""
+    plan = shape.samples[-1].plan.splitlines()
+    return any(re.match(r"SCAN \w+$", line) or line.startswith("USE TEMP B-TREE FOR ORDER BY")
+               or re.match(r"SCAN \w+ USING COVERING INDEX", line) for line in plan)
+
+
+def propose(conn: sqlite3.Connection, shapes: Sequence[QueryShape],
+            min_queries: int) -> List[IndexCandidate]:
+    candidates: Dict[Tuple[str, Tuple[str, ...]], IndexCandidate] = {}
+    for shape in shapes:
+        if shape.count < min_queries or not needs_index(shape):
+            continue
+        columns = [row[1] for row in conn.execute(f'PRAGMA table_info("{shape.table}");')]
+        if not columns:
+            continue
+        keys = candidate_keys(shape, columns)
+        if keys is None:
+            continue
+        candidate = candidates.setdefault(
+            (shape.table, keys), IndexCandidate(shape.table, keys))
+        candidate.shapes.append(shape)
+    return list(candidates.values())
+
+
+def measure(conn: sqlite3.Connection, query: str, repeat: int, timeout: float) -> Measurement:
+    plan = [row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}")]
+    timings = []
+    for _ in range(repeat):
+        deadline = time.monotonic() + timeout
+        conn.set_progress_handler(lambda: int(time.monotonic() > deadline), 1000)
+        start = time.perf_counter()
+        try:
+            conn.execute(query).fetchall()
+        except sqlite3.OperationalError:
+            return Measurement(plan, None)
+        finally:
+            conn.set_progress_handler(None, 0)
+        timings.append((time.perf_counter() - start) * 1000)
+    return Measurement(plan, statistics.median(timings))
+
+
+def _improves(index: str, before: List[str], after: List[str]) -> bool:
+    """
+    O índice é útil se o plano passa a buscar por ele (SEARCH) ou se ele
+    elimina a ordenação em B-tree temporária; uma varredura completa do
+    índice não conta.
+    """
+    uses = [line for line in after if re.search(rf"\bINDEX {re.escape(index)}\b", line)]
+    if any(line.startswith("SEARCH") for line in uses):
+        return True
+    sorted_before = any(line.startswith("USE TEMP B-TREE FOR ORDER BY") for line in before)
+    sorted_after = any(line.startswith("USE TEMP B-TREE FOR ORDER BY") for line in after)
+    return bool(uses) and sorted_before and not sorted_after
+
+
+def _case_insensitive_rewrite(query: str) -> Optional[str]:
+    """`lower(name) LIKE ?` reescrito como `name LIKE ?` (equivalente, e indexável)."""
+    rewritten = _LIKE_FUNCTION_RE.sub(r"\1\2", query)
+    return rewritten if rewritten != query else None
+
+
+def _format_ms(value: Optional[float], timeout: float) -> str:
+    return f"> {timeout * 1000:.0f} ms" if value is None else f"{value:.2f} ms"
+
+
+def evaluate(conn: sqlite3.Connection, candidate: IndexCandidate, apply: bool,
+             repeat: int, timeout: float) -> bool:
+    """
+    Cria o índice em uma transação, compara plano e tempo antes e depois e
+    confirma a criação apenas com `apply` e se o índice melhorar o plano.
+    """
+    queries = [shape.samples[-1].query for shape in candidate.shapes]
+    before = [measure(conn, query, repeat, timeout) for query in queries]
+
+    conn.execute("BEGIN;")
+    start = time.perf_counter()
+    conn.execute(candidate.sql)
+    build_ms = (time.perf_counter() - start) * 1000
+    after = [measure(conn, query, repeat, timeout) for query in queries]
+    used = any(_improves(candidate.name, old.plan, new.plan) for old, new in zip(before, after))
+    rewrites = {}
+    if not used:
+        for query, old in zip(queries, before):
+            rewritten = _case_insensitive_rewrite(query)
+            if rewritten:
+                measurement = measure(conn, rewritten, repeat, timeout)
+                if _improves(candidate.name, old.plan, measurement.plan):
+                    rewrites[query] = (rewritten, measurement)
+
+    if apply and used:
+        conn.execute("COMMIT;")
+        status = "CREATED"
+    else:
+        conn.execute("ROLLBACK;")
+        status = "PROPOSED" if used else (
+            "PROPOSED (needs a query rewrite)" if rewrites else "NOT USED (discarded)")
+
+    total = sum(shape.count for shape in candidate.shapes)
+    print(f"\n{status}: {candidate.sql}")
+    print(f"  {total} logged queries in {len(candidate.shapes)} shape(s); built in {build_ms:.0f} ms")
+    for query, old, new in zip(queries, before, after):
+        print(f"  query: {query}")
+        print(f"    before: {_format_ms(old.median_ms, timeout):>12}  {' | '.join(old.plan)}")
+        print(f"    after:  {_format_ms(new.median_ms, timeout):>12}  {' | '.join(new.plan)}")
+        if query in rewrites:
+            rewritten, measurement = rewrites[query]
+            print(f"    hint: the index would be used by the equivalent '{rewritten}' "
+                  f"({_format_ms(measurement.median_ms, timeout)}); "
+                  "adjust the query prompt to generate it.")
+    return used
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m model.index_advisor",
+        description="Sugere (e, com --apply, cria) índices a partir do registro de queries.")
+    parser.add_argument("--db", default=config.DB_NAME, help="Banco de dados analisado")
+    parser.add_argument("--log", default=config.QUERY_LOG_FILE, help="Arquivo do registro de queries")
+    parser.add_argument("--apply", action="store_true",
+                        help="Cria os índices que o SQLite passa a usar")
+    parser.add_argument("--min-queries", type=int, default=config.INDEX_ADVISOR_MIN_QUERIES,
+                        help="Execuções de um formato antes de considerá-lo")
+    parser.add_argument("--repeat", type=int, default=5, help="Execuções por medição de tempo")
+    parser.add_argument("--timeout", type=float, default=config.QUERY_TIMEOUT,
+                        help="Tempo máximo de cada execução medida, em segundos")
+    args = parser.parse_args(argv)
+
+    try:
+        entries = list(read_entries(args.log, str(Path(args.db).resolve())))
+    except FileNotFoundError:
+        print(f"No query log yet: '{args.log}' does not exist. It is created once the bot "
+              "runs queries with QUERY_LOG_ENABLED.")
+        return 0
+    except sqlite3.Error as e:
+        print(f"Could not read the query log '{args.log}': {e}", file=sys.stderr)
+        return 1
+
+    shapes = load_shapes(entries)
+    print(f"{len(entries)} logged queries, {len(shapes)} query shapes.")
+    # isolation_level=None: as transações são controladas explicitamente
+    conn = sqlite3.connect(args.db, isolation_level=None)
+    try:
+        candidates = propose(conn, shapes, args.min_queries)
+        if not candidates:
+            print("No index to propose: the logged queries already use indexes.")
+            return 0
+        used = sum(evaluate(conn, candidate, args.apply, args.repeat, args.timeout)
+                   for candidate in candidates)
+        if args.apply and used:
+            conn.execute("PRAGMA optimize;")
+        print(f"\n{used} of {len(candidates)} candidate index(es) improve the query plans.")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+"""
+Índice de n-gramas em memória para os nomes dos produtos.
+
+Permite injetar no prompt apenas os produtos relevantes para a solicitação do
+usuário, em vez do catálogo inteiro. A busca é tolerante a plurais e pequenos
+erros de digitação ("apples" encontra "Apple", "banan" encontra "Banana").
+"""
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Set, Tuple
+
+_TOKEN_RE = re.compile(r"\w+")
+
+# Palavras comuns nas perguntas que não ajudam a identificar produtos
+_STOPWORDS = frozenset({
+    "a", "an", "the", "of", "in", "on", "for", "to", "and", "or", "is", "are",
+    "do", "does", "you", "we", "have", "has", "how", "many", "much", "what",
+    "which", "there", "stock", "quantity", "quantities", "product", "products",
+    "item", "items", "any", "all", "left", "me", "show", "list", "tell",
+    "os", "as", "um", "uma", "de", "da", "dos", "das", "tem",
+    "temos", "quantos", "quantas", "qual", "quais", "produto", "produtos",
+    "estoque", "quantidade",
+})
+
+
+def _normalize(text: str) -> str:
+    """Remove acentos e converte para minúsculas."""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def _tokens(text: str) -> List[str]:
+    return _TOKEN_RE.findall(_normalize(text))
+
+
+def _trigrams(token: str) -> Set[str]:
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _similarity(a: Set[str], b: Set[str]) -> float:
+    """Coeficiente de Dice entre dois conjuntos de trigramas."""
+    if not a or not b:
+        return 0.0
+    return 2 * len(a & b) / (len(a) + len(b))
+
+
+class ProductIndex:
+    """
+    Índice invertido de trigramas sobre os nomes dos produtos.
+
+    Cada palavra do nome do produto é indexada separadamente, para que
+    "orange" encontre "Orange Juice".
+    """
+
+    def __init__(self, names: Iterable[str]):
+        self.names: List[str] = list(dict.fromkeys(names))
+        self._name_grams: List[List[Set[str]]] = []
+        self._postings: Dict[str, Set[int]] = defaultdict(set)
+
+        for product_id, name in enumerate(self.names):
+            token_grams = [_trigrams(token) for token in _tokens(name)]
+            self._name_grams.append(token_grams)
+            for grams in token_grams:
+                for gram in grams:
+                    self._postings[gram].add(product_id)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def search(self, query: str, k: int, min_score: float = 0.4) -> List[str]:
+        """
+        Retorna até k nomes de produtos mais parecidos com a consulta.
+
+        Args:
+            query (str): A solicitação do usuário em linguagem natural.
+            k (int): Número máximo de produtos retornados.
+            min_score (float): Similaridade mínima para um produto ser considerado.
+
+        Returns:
+            List[str]: Os nomes encontrados, do mais para o menos relevante.
+        """
+        query_grams = [
+            _trigrams(token) for token in _tokens(query)
+            if token not in _STOPWORDS and len(token) > 1
+        ]
+        if not query_grams or k <= 0:
+            return []
+
+        scores: Dict[int, float] = defaultdict(float)
+        for grams in query_grams:
+            shared: Counter = Counter()
+            for gram in grams:
+                shared.update(self._postings.get(gram, ()))
+            for product_id, count in shared.items():
+                # Limite superior da similaridade: descarta candidatos sem avaliá-los
+                if 2 * count / (len(grams) + count) < min_score:
+                    continue
+                best = max(
+                    _similarity(grams, name_grams)
+                    for name_grams in self._name_grams[product_id])
+                if best >= min_score:
+                    scores[product_id] += best
+
+        ranked: List[Tuple[float, str]] = sorted(
+            ((-score, self.names[product_id]) for product_id, score in scores.items()))
+        return [name for _, name in ranked[:k]]
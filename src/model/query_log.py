@@ -0,0 +1,168 @@
+"""
+Registro das queries executadas (texto, formato, duração, linhas e plano).
+
+As entradas são gravadas em um banco SQLite próprio (config.QUERY_LOG_FILE)
+por uma thread em segundo plano, fora do caminho das mensagens; se a fila
+encher, as entradas excedentes são descartadas. O registro alimenta o
+consultor de índices (model/index_advisor.py).
+"""
+import logging
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_SPACE_RE = re.compile(r"\s+")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS query_log (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at REAL NOT NULL,
+    db_name TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    query TEXT NOT NULL,
+    duration_ms REAL NOT NULL,
+    rows INTEGER,
+    plan TEXT NOT NULL,
+    error_code TEXT
+);
+CREATE INDEX IF NOT EXISTS query_log_fingerprint ON query_log (db_name, fingerprint);
+"""
+
+
+def fingerprint(query: str) -> str:
+    """Formato da query: literais trocados por '?', espaços e maiúsculas normalizados."""
+    shape = _STRING_RE.sub("?", query)
+    shape = _NUMBER_RE.sub("?", shape)
+    return _SPACE_RE.sub(" ", shape).strip().rstrip(";").strip().lower()
+
+
+@dataclass
+class QueryLogEntry:
+    created_at: float
+    db_name: str
+    fingerprint: str
+    query: str
+    duration_ms: float
+    rows: Optional[int]
+    plan: str
+    error_code: Optional[str]
+
+
+class QueryLog:
+    """
+    Grava as queries executadas em segundo plano.
+
+    Args:
+        path (str): Arquivo SQLite do registro.
+        max_entries (int): Entradas mantidas; as mais antigas são apagadas.
+        queue_size (int): Entradas aguardando gravação antes de descartar novas.
+    """
+
+    def __init__(self, path: str, max_entries: int, queue_size: int):
+        self.path = path
+        self.max_entries = max_entries
+        self._queue: "queue.Queue[Optional[QueryLogEntry]]" = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def record(self, db_name: str, query: str, duration: float, rows: Optional[int],
+               plan: List[str], error_code: Optional[str] = None):
+        """Enfileira uma entrada; nunca bloqueia quem executou a query."""
+        self._start()
+        entry = QueryLogEntry(
+            created_at=time.time(), db_name=db_name, fingerprint=fingerprint(query),
+            query=query.strip(), duration_ms=duration * 1000, rows=rows,
+            plan="\n".join(plan), error_code=error_code)
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def _start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="query-log", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        conn = sqlite3.connect(self.path)
+        conn.executescript(_SCHEMA)
+        written = 0
+        while True:
+            entry = self._queue.get()
+            batch = [entry]
+            # Agrupa o que já estiver na fila em uma única transação
+            while entry is not None and not self._queue.empty():
+                entry = self._queue.get_nowait()
+                batch.append(entry)
+            entries = [e for e in batch if e is not None]
+            try:
+                with conn:
+                    conn.executemany(
+                        "INSERT INTO query_log (created_at, db_name, fingerprint, query, "
+                        "duration_ms, rows, plan, error_code) VALUES (?, ?, ?, ?, ?, ?, ?, ?);",
+                        [(e.created_at, e.db_name, e.fingerprint, e.query, e.duration_ms,
+                          e.rows, e.plan, e.error_code) for e in entries])
+                    written += len(entries)
+                    if written >= 1000:
+                        written = 0
+                        conn.execute(
+                            "DELETE FROM query_log WHERE id <= "
+                            "(SELECT MAX(id) FROM query_log) - ?;", (self.max_entries,))
+            except sqlite3.Error as e:
+                logger.error("Could not write to the query log '%s': %s", self.path, e)
+            for _ in batch:
+                self._queue.task_done()
+            if len(entries) < len(batch):
+                conn.close()
+                return
+
+    def flush(self):
+        """Aguarda a gravação das entradas já enfileiradas."""
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+
+def read_entries(path: str, db_name: Optional[str] = None) -> Iterator[QueryLogEntry]:
+    """
+    Lê as entradas do registro (todas ou as de um banco de dados).
+
+    Raises:
+        FileNotFoundError: Se o registro ainda não existe (nenhuma query foi
+            registrada). O arquivo é aberto somente para leitura e nunca é
+            criado aqui.
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+    conn = sqlite3.connect(f"{Path(path).absolute().as_uri()}?mode=ro", uri=True)
+    try:
+        sql = ("SELECT created_at, db_name, fingerprint, query, duration_ms, rows, plan, "
+               "error_code FROM query_log")
+        params = ()
+        if db_name is not None:
+            sql += " WHERE db_name = ?"
+            params = (db_name,)
+        for row in conn.execute(sql + " ORDER BY id;", params):
+            yield QueryLogEntry(*row)
+    finally:
+        conn.close()
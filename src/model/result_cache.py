@@ -0,0 +1,179 @@
+"""
+Cache dos resultados das queries de leitura (query_run e query_stream).
+
+A mesma query gerada pela IA (ex.: `SELECT quantity FROM products WHERE
+name = 'Apple';`) chega muitas vezes, de usuários diferentes. A chave usa a
+forma canônica da query e cada entrada guarda o PRAGMA data_version do banco
+no momento da execução: qualquer escrita no banco invalida as entradas
+antigas na próxima leitura. O tamanho total é limitado em bytes, com
+descarte LRU. Queries com resultado variável (random(), date('now'),
+CURRENT_TIMESTAMP...) não são guardadas.
+"""
+import re
+import sys
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+# Literais de texto e identificadores entre aspas são mantidos como estão
+_TOKEN_RE = re.compile(
+    r"""'(?:[^']|'')*'|"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\]|--[^\n]*|/\*.*?(?:\*/|$)"""
+    r"""|\s+|0[xX][0-9a-fA-F]+|(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?|[A-Za-z_]\w*"""
+    r"""|->>|->|<=|>=|<>|==|!=|\|\||<<|>>|.""",
+    re.DOTALL)
+_OPERATORS = {"==": "=", "!=": "<>"}
+_NAME_RE = re.compile(r"[A-Za-z_]\w*")
+# Funções e valores que mudam a cada execução; as funções de data só mudam com 'now'
+_VOLATILE = frozenset((
+    "random", "randomblob", "changes", "total_changes", "last_insert_rowid",
+    "current_date", "current_time", "current_timestamp"))
+
+
+def canonical_query(query: str) -> str:
+    """
+    Forma canônica da query para a chave do cache.
+
+    A query é quebrada em tokens (literais, números, nomes e operadores),
+    os comentários e o `;` final saem, palavras-chave, funções e nomes sem
+    aspas vão para minúsculas (o SQLite não diferencia `COUNT(*)` de
+    `count(*)` nem `Products` de `products`), `==` e `!=` viram `=` e `<>` e
+    os tokens são unidos por um único espaço. Literais e identificadores
+    entre aspas não mudam: 'Apple' e 'apple' podem trazer linhas diferentes
+    e 5 e 5.0 trazem tipos diferentes.
+    """
+    tokens = []
+    for token in _TOKEN_RE.findall(query):
+        if token.isspace() or token.startswith(("--", "/*")):
+            continue
+        if _NAME_RE.fullmatch(token):
+            token = token.lower()
+        tokens.append(_OPERATORS.get(token, token))
+    while tokens and tokens[-1] == ";":
+        tokens.pop()
+    return " ".join(tokens)
+
+
+def is_deterministic(query: str) -> bool:
+    """
+    Indica se a query sempre traz o mesmo resultado enquanto o banco não
+    muda. Falso se ela usa funções como random() ou changes(), os valores
+    CURRENT_DATE/CURRENT_TIME/CURRENT_TIMESTAMP ou o texto 'now' (date('now'),
+    datetime('now', '-1 day')...).
+    """
+    for token in _TOKEN_RE.findall(query):
+        if token.lower() in _VOLATILE or token.lower() == "'now'":
+            return False
+    return True
+
+
+def estimate_size(value: Any, limit: Optional[int] = None) -> int:
+    """
+    Estimativa do tamanho em memória de um resultado (listas, tuplas,
+    dataclasses e valores escalares). Para de contar ao passar de `limit`.
+    """
+    total = 0
+    stack = [value]
+    while stack:
+        item = stack.pop()
+        total += sys.getsizeof(item)
+        if limit is not None and total > limit:
+            break
+        if isinstance(item, (list, tuple)):
+            stack.extend(item)
+        elif isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif hasattr(item, "__dataclass_fields__"):
+            stack.extend(vars(item).values())
+    return total
+
+
+@dataclass
+class _Entry:
+    version: int
+    value: Any
+    size: int
+
+
+class ResultCache:
+    """
+    Cache LRU de resultados limitado pelo total de bytes.
+
+    Args:
+        max_bytes (int): Tamanho total estimado das entradas em cache.
+        max_entry_bytes (int): Resultados maiores que isso não são guardados.
+    """
+
+    def __init__(self, max_bytes: int, max_entry_bytes: int):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = min(max_entry_bytes, max_bytes)
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(db_name: str, query: str, *variant: Hashable) -> Tuple[Hashable, ...]:
+        return (db_name, canonical_query(query), *variant)
+
+    def get(self, key: Hashable, version: int) -> Optional[Any]:
+        """Retorna o resultado em cache se ele foi lido na versão atual do banco."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.version != version:
+                self._remove(key)
+                self.invalidations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.value
+
+    def put(self, key: Hashable, version: int, value: Any) -> bool:
+        """
+        Armazena um resultado, descartando os menos usados até caber.
+
+        O resultado é compartilhado entre as leituras seguintes e não deve
+        ser alterado por quem o recebe.
+
+        Returns:
+            bool: False se o resultado for grande demais para o cache.
+        """
+        size = estimate_size(value, self.max_entry_bytes)
+        if size > self.max_entry_bytes:
+            return False
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = _Entry(version, value, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores de acertos, falhas e ocupação do cache."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+                "bytes": self.size,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+    def _remove(self, key: Hashable):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry.size
@@ -0,0 +1,70 @@
+"""
+Resumo compacto de resultados de query para o prompt de feedback da IA.
+
+Em vez de `str(db_result)`, o feedback() recebe as colunas, o total real de
+linhas, estatísticas das colunas numéricas e as primeiras linhas que couberem
+em um orçamento de tokens. O tamanho do prompt fica limitado qualquer que seja
+o tamanho do resultado.
+"""
+from typing import Any
+
+from model.db_access import QueryResult
+
+# Aproximação usada para converter o orçamento de tokens em caracteres
+CHARS_PER_TOKEN = 4
+_MAX_CELL_CHARS = 60
+
+
+def _format_value(value: Any) -> str:
+    if isinstance(value, float):
+        text = f"{value:.4g}"
+    elif isinstance(value, bytes):
+        text = f"<{len(value)} bytes>"
+    else:
+        text = str(value)
+    if len(text) > _MAX_CELL_CHARS:
+        text = text[:_MAX_CELL_CHARS - 3] + "..."
+    return text
+
+
+def digest_result(result: QueryResult, token_budget: int, max_rows: int) -> str:
+    """
+    Gera um resumo do resultado dentro do orçamento de tokens.
+
+    Args:
+        result (QueryResult): O resultado retornado por query_stream.
+        token_budget (int): Número aproximado de tokens disponíveis.
+        max_rows (int): Número máximo de linhas exibidas.
+
+    Returns:
+        str: O resumo em texto.
+    """
+    if result.total_rows == 0:
+        return "The query returned no rows."
+
+    budget = token_budget * CHARS_PER_TOKEN
+    lines = [f"Columns: {', '.join(result.columns)}",
+             f"Total rows: {result.total_rows}"]
+
+    for name, stats in result.stats.items():
+        # Estatísticas de uma única linha não acrescentam nada às próprias linhas
+        if result.total_rows > 1:
+            lines.append(
+                f"Column '{name}': min={_format_value(stats.minimum)}, "
+                f"max={_format_value(stats.maximum)}, "
+                f"avg={_format_value(stats.average)}, sum={_format_value(stats.total)}")
+
+    lines.append(" | ".join(result.columns))
+    used = sum(len(line) + 1 for line in lines)
+    shown = 0
+    for row in result.rows[:max_rows]:
+        line = " | ".join(_format_value(value) for value in row)
+        if shown and used + len(line) + 1 > budget:
+            break
+        lines.append(line)
+        used += len(line) + 1
+        shown += 1
+
+    if shown < result.total_rows:
+        lines.append(f"... {result.total_rows - shown} more rows not shown.")
+    return "\n".join(lines)
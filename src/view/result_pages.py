@@ -0,0 +1,233 @@
+"""
+Exibição paginada dos resultados do comando /sql.
+
+O resultado é renderizado como uma tabela de colunas alinhadas, uma página por
+mensagem. Os botões do teclado inline (◀️ ▶️ e CSV) são respondidos a partir
+de um cache por chat (ResultPageCache), sem executar a query de novo: trocar
+de página só edita a mensagem. As entradas expiram (config.SQL_PAGE_CACHE_TTL)
+e o cache tem limite de memória e de entradas por chat.
+"""
+import csv
+import html
+import io
+import logging
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from telebot.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+import config
+from model.db_access import QueryResult
+from model.result_cache import estimate_size
+from view.streaming import TELEGRAM_MAX_LENGTH
+
+logger = logging.getLogger(__name__)
+
+# callback_data dos botões: "sqlpage:<token>:<página>" ou "sqlpage:<token>:csv"
+CALLBACK_PREFIX = "sqlpage:"
+CSV_ACTION = "csv"
+
+
+def _cell(value: Any, max_width: int) -> str:
+    if value is None:
+        text = "NULL"
+    elif isinstance(value, float):
+        text = f"{value:.6g}"
+    elif isinstance(value, bytes):
+        text = f"<{len(value)} bytes>"
+    else:
+        text = " ".join(str(value).split())
+    if len(text) > max_width:
+        text = text[:max_width - 1] + "…"
+    return text
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def format_table(columns: Sequence[str], rows: Sequence[Tuple[Any, ...]], max_width: int) -> str:
+    """
+    Tabela em texto com as colunas alinhadas, para exibição em fonte monoespaçada.
+    Números são alinhados à direita; células longas são cortadas em `max_width`.
+    """
+    header = [_cell(column, max_width) for column in columns]
+    cells = [[_cell(value, max_width) for value in row] for row in rows]
+    widths = [max([len(header[i])] + [len(row[i]) for row in cells])
+              for i in range(len(header))]
+
+    lines = [" │ ".join(name.ljust(width) for name, width in zip(header, widths)).rstrip(),
+             "─┼─".join("─" * width for width in widths)]
+    for row, values in zip(cells, rows):
+        lines.append(" │ ".join(
+            text.rjust(width) if _is_number(value) else text.ljust(width)
+            for text, value, width in zip(row, values, widths)).rstrip())
+    return "\n".join(lines)
+
+
+def result_csv(result: QueryResult) -> bytes:
+    """As linhas mantidas do resultado em CSV (UTF-8 com BOM, para abrir no Excel)."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(result.columns)
+    writer.writerows(result.rows)
+    return buffer.getvalue().encode("utf-8-sig")
+
+
+def page_count(result: QueryResult, page_rows: int) -> int:
+    return max(1, -(-len(result.rows) // page_rows))
+
+
+def render_page(result: QueryResult, page: int, page_rows: int, max_width: int) -> str:
+    """Uma página do resultado em HTML (parse_mode='HTML'), dentro do limite do Telegram."""
+    pages = page_count(result, page_rows)
+    first = page * page_rows
+    rows = result.rows[first:first + page_rows]
+
+    footer = f"Linhas {first + 1}–{first + len(rows)} de {result.total_rows}"
+    if pages > 1:
+        footer += f" · página {page + 1}/{pages}"
+    if result.truncated:
+        footer += (f"\nApenas as primeiras {len(result.rows)} linhas estão disponíveis; "
+                   "refine a query com WHERE ou LIMIT para ver as demais.")
+
+    table = format_table(result.columns, rows, max_width)
+    # Margem para as tags <pre>, o rodapé e o escape do HTML
+    budget = TELEGRAM_MAX_LENGTH - len(footer) - 32
+    escaped = html.escape(table)
+    if len(escaped) > budget:
+        lines = table.split("\n")
+        while lines and len(html.escape("\n".join(lines))) + 2 > budget:
+            lines.pop()
+        escaped = html.escape("\n".join(lines + ["…"]))
+    return f"<pre>{escaped}</pre>\n{html.escape(footer)}"
+
+
+def page_keyboard(token: Optional[str], page: int, pages: int) -> Optional[InlineKeyboardMarkup]:
+    """Botões de navegação e de download; None se o resultado cabe em uma página."""
+    if token is None or pages <= 1:
+        return None
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton("◀️", callback_data=f"{CALLBACK_PREFIX}{token}:{page - 1}"))
+    if page < pages - 1:
+        buttons.append(InlineKeyboardButton("▶️", callback_data=f"{CALLBACK_PREFIX}{token}:{page + 1}"))
+    buttons.append(InlineKeyboardButton("📄 CSV", callback_data=f"{CALLBACK_PREFIX}{token}:{CSV_ACTION}"))
+    markup = InlineKeyboardMarkup()
+    markup.row(*buttons)
+    return markup
+
+
+def parse_callback(data: Optional[str]) -> Optional[Tuple[str, str]]:
+    """Retorna (token, ação) de um callback_data destes botões, ou None."""
+    if not data or not data.startswith(CALLBACK_PREFIX):
+        return None
+    token, _, action = data[len(CALLBACK_PREFIX):].partition(":")
+    if not token or not (action == CSV_ACTION or action.isdigit()):
+        return None
+    return token, action
+
+
+@dataclass
+class PagedResult:
+    """Um resultado guardado para a navegação entre páginas."""
+    chat_id: int
+    query: str
+    result: QueryResult
+    created_at: float
+    size: int
+
+
+class ResultPageCache:
+    """
+    Cache LRU com expiração (TTL) dos resultados navegáveis do /sql.
+
+    Args:
+        ttl (float): Segundos que um resultado continua navegável.
+        max_bytes (int): Tamanho total estimado dos resultados guardados.
+        per_chat (int): Resultados guardados por chat; os mais antigos
+            perdem a navegação primeiro.
+    """
+
+    def __init__(self, ttl: float, max_bytes: int, per_chat: int):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.per_chat = per_chat
+        self.size = 0
+        self._entries: "OrderedDict[str, PagedResult]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, chat_id: int, query: str, result: QueryResult) -> Optional[str]:
+        """
+        Guarda o resultado e retorna o token usado nos botões, ou None se ele
+        não couber no cache.
+        """
+        size = estimate_size(result, self.max_bytes)
+        if size > self.max_bytes:
+            logger.info("Result of '%s' is too large to be paginated (%s bytes).", query, size)
+            return None
+        token = secrets.token_urlsafe(6)
+        with self._lock:
+            self._expire(time.monotonic())
+            chat_tokens = [t for t, entry in self._entries.items() if entry.chat_id == chat_id]
+            for old_token in chat_tokens[:max(0, len(chat_tokens) - self.per_chat + 1)]:
+                self._remove(old_token)
+            while self._entries and self.size + size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+            self._entries[token] = PagedResult(chat_id, query, result, time.monotonic(), size)
+            self.size += size
+        return token
+
+    def get(self, chat_id: int, token: str) -> Optional[PagedResult]:
+        """O resultado do token, se ainda estiver no cache e pertencer ao chat."""
+        with self._lock:
+            self._expire(time.monotonic())
+            entry = self._entries.get(token)
+            if entry is None or entry.chat_id != chat_id:
+                return None
+            self._entries.move_to_end(token)
+            return entry
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self.size}
+
+    def _expire(self, now: float):
+        expired: List[str] = [token for token, entry in self._entries.items()
+                              if now - entry.created_at > self.ttl]
+        for token in expired:
+            self._remove(token)
+
+    def _remove(self, token: str):
+        entry = self._entries.pop(token, None)
+        if entry is not None:
+            self.size -= entry.size
+
+
+result_pages = ResultPageCache(
+    config.SQL_PAGE_CACHE_TTL, config.SQL_PAGE_CACHE_MAX_BYTES, config.SQL_PAGE_CACHE_PER_CHAT)
+
+
+def first_page(chat_id: int, query: str,
+               result: QueryResult) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+    """
+    Texto e botões da primeira página de um resultado do /sql. Resultados com
+    mais de uma página são guardados no cache para a navegação.
+    """
+    pages = page_count(result, config.SQL_PAGE_ROWS)
+    token = result_pages.put(chat_id, query, result) if pages > 1 else None
+    text = render_page(result, 0, config.SQL_PAGE_ROWS, config.SQL_CELL_MAX_WIDTH)
+    return text, page_keyboard(token, 0, pages)
+
+
+def turn_page(entry: PagedResult, token: str,
+              page: int) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+    """Texto e botões de outra página de um resultado guardado."""
+    pages = page_count(entry.result, config.SQL_PAGE_ROWS)
+    page = min(max(page, 0), pages - 1)
+    text = render_page(entry.result, page, config.SQL_PAGE_ROWS, config.SQL_CELL_MAX_WIDTH)
+    return text, page_keyboard(token, page, pages)
@@ -0,0 +1,160 @@
+"""
+Exibição progressiva de respostas da IA no Telegram.
+
+Os trechos gerados pelo LLM são acumulados e uma única mensagem é editada à
+medida que chegam. As edições são agrupadas e limitadas no tempo
+(config.STREAM_EDIT_INTERVAL) para não atingir os limites de
+edit_message_text do Telegram.
+
+Se a solicitação é substituída no meio do stream (Superseded), a mensagem
+recebe uma última edição sem o cursor, com o aviso de que foi interrompida.
+"""
+import logging
+import time
+from typing import TYPE_CHECKING, AsyncIterable, Iterable, Union
+
+from telebot.apihelper import ApiTelegramException
+
+if TYPE_CHECKING:
+    from telebot.asyncio_helper import ApiTelegramException as AsyncApiTelegramException
+
+import config
+from controller.scheduler import Superseded
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_MAX_LENGTH = 4096
+CURSOR = " ▌"
+SUPERSEDED_NOTE = "[interrupted: a newer message replaced this request]"
+
+
+class EditThrottle:
+    """Decide quando o texto acumulado merece uma nova edição da mensagem."""
+
+    def __init__(self, min_interval: float, min_chars: int):
+        self.min_interval = min_interval
+        self.min_chars = min_chars
+        self.shown = ""
+        self._next_edit = 0.0
+
+    def should_edit(self, text: str) -> bool:
+        # O primeiro trecho aparece imediatamente; os seguintes são agrupados
+        grown = len(text) - len(self.shown)
+        return (
+            time.monotonic() >= self._next_edit
+            and (grown >= self.min_chars or (not self.shown and grown > 0))
+        )
+
+    def edited(self, text: str):
+        self.shown = text
+        self._next_edit = time.monotonic() + self.min_interval
+
+    def back_off(self, error: Union[ApiTelegramException, "AsyncApiTelegramException"]):
+        """Respeita o retry_after informado pelo Telegram em respostas 429."""
+        retry_after = 0
+        if error.error_code == 429:
+            retry_after = (error.result_json or {}).get("parameters", {}).get("retry_after", 0)
+        self._next_edit = time.monotonic() + max(self.min_interval, retry_after)
+
+
+def _render(prefix: str, text: str, cursor: str = "") -> str:
+    limit = TELEGRAM_MAX_LENGTH - len(prefix) - len(cursor)
+    if len(text) > limit:
+        text = text[:limit - 1] + "…"
+    return f"{prefix}{text}{cursor}"
+
+
+def _superseded_text(text: str) -> str:
+    text = text.strip()
+    return f"{text} … {SUPERSEDED_NOTE}" if text else SUPERSEDED_NOTE
+
+
+def _is_not_modified(error: Union[ApiTelegramException, "AsyncApiTelegramException"]) -> bool:
+    return "message is not modified" in str(error.description)
+
+
+def stream_to_message(bot, chat_id: int, chunks: Iterable[str],
+                      placeholder: str, prefix: str = "AI: ") -> str:
+    """
+    Envia `placeholder` e o substitui progressivamente pelos trechos gerados.
+
+    Args:
+        bot (telebot.TeleBot): O bot usado para enviar e editar a mensagem.
+        chat_id (int): O chat de destino.
+        chunks (Iterable[str]): Os trechos de texto gerados pelo LLM.
+        placeholder (str): Texto exibido até o primeiro trecho chegar.
+        prefix (str): Prefixo da resposta final.
+
+    Returns:
+        str: O texto completo gerado.
+    """
+    message = bot.send_message(chat_id, placeholder)
+    throttle = EditThrottle(config.STREAM_EDIT_INTERVAL, config.STREAM_EDIT_MIN_CHARS)
+    text = ""
+
+    def edit(content: str) -> bool:
+        try:
+            bot.edit_message_text(content, chat_id, message.message_id)
+            return True
+        except ApiTelegramException as e:
+            if _is_not_modified(e):
+                return True
+            logger.warning("Could not edit the streamed message: %s", e)
+            throttle.back_off(e)
+            return False
+
+    try:
+        for chunk in chunks:
+            text += chunk
+            if text.strip() and throttle.should_edit(text):
+                if edit(_render(prefix, text, CURSOR)):
+                    throttle.edited(text)
+    except Superseded:
+        # Sem esta edição, a mensagem ficaria com o texto parcial e o cursor
+        edit(_render(prefix, _superseded_text(text)))
+        raise
+
+    text = text.strip() or "It was not possible to generate feedback for the result."
+    # A edição final sempre acontece, sem o cursor
+    if not edit(_render(prefix, text)):
+        bot.send_message(chat_id, _render(prefix, text))
+    return text
+
+
+async def stream_to_message_async(bot, chat_id: int, chunks: AsyncIterable[str],
+                                  placeholder: str, prefix: str = "AI: ") -> str:
+    """Versão assíncrona de stream_to_message, para o AsyncTeleBot."""
+    # Importado aqui: o asyncio_helper carrega o aiohttp, inútil no app.py
+    from telebot.asyncio_helper import ApiTelegramException as AsyncApiTelegramException
+
+    message = await bot.send_message(chat_id, placeholder)
+    throttle = EditThrottle(config.STREAM_EDIT_INTERVAL, config.STREAM_EDIT_MIN_CHARS)
+    text = ""
+
+    async def edit(content: str) -> bool:
+        try:
+            await bot.edit_message_text(content, chat_id, message.message_id)
+            return True
+        except AsyncApiTelegramException as e:
+            if _is_not_modified(e):
+                return True
+            logger.warning("Could not edit the streamed message: %s", e)
+            throttle.back_off(e)
+            return False
+
+    try:
+        async for chunk in chunks:
+            text += chunk
+            if text.strip() and throttle.should_edit(text):
+                if await edit(_render(prefix, text, CURSOR)):
+                    throttle.edited(text)
+    except Superseded:
+        await edit(_render(prefix, _superseded_text(text)))
+        raise
+
+    text = text.strip() or "It was not possible to generate feedback for the result."
+    # A edição final sempre acontece, sem o cursor
+    if not await edit(_render(prefix, text)):
+        await bot.send_message(chat_id, _render(prefix, text))
+    return text
+
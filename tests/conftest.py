@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Os módulos do projeto são importados a partir de src/, como em app.py
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "src"))
@@ -0,0 +1,64 @@
+from controller.action_cache import ActionCache
+from instrumentation import ACTION_CACHE
+
+ACTION = {"action": "database_query", "payload": "SELECT 1;"}
+
+
+def cache_counts():
+    return {item["labels"]["result"]: item["value"] for item in ACTION_CACHE.snapshot()}
+
+
+def test_hits_misses_and_evictions_are_counted():
+    before = cache_counts()
+    cache = ActionCache(max_size=1, ttl=60)
+
+    assert cache.get("How many apples?", "v1") is None
+    cache.put("How many apples?", "v1", ACTION)
+    assert cache.get("how many apples", "v1") == ACTION
+    cache.put("How many pears?", "v1", ACTION)
+
+    after = cache_counts()
+    for result, expected in (("miss", 1), ("hit", 1), ("eviction", 1)):
+        assert after.get(result, 0) - before.get(result, 0) == expected
+    assert cache.stats()["size"] == 1
+
+
+def test_entries_are_persisted_by_the_writer(tmp_path):
+    path = str(tmp_path / "action_cache.db")
+    cache = ActionCache(max_size=10, ttl=60, persist_file=path)
+    cache.put("How many apples?", "v1", ACTION)
+    cache.put("How many pears?", "v1", ACTION)
+    cache.put("How many pears?", "v2", ACTION)
+    cache.close()
+
+    reloaded = ActionCache(max_size=10, ttl=60, persist_file=path)
+    assert reloaded.get("how many apples", "v1") == ACTION
+    assert reloaded.stats()["size"] == 3
+
+    reloaded.clear()
+    reloaded.close()
+    assert ActionCache(max_size=10, ttl=60, persist_file=path).stats()["size"] == 0
+
+
+def test_full_catalog_context_uses_the_snapshot_version(tmp_path):
+    import sqlite3
+
+    from controller.action_cache import catalog_version
+    from model.catalog import CatalogSnapshot
+
+    path = str(tmp_path / "products.db")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE products (id INTEGER PRIMARY KEY, name TEXT);")
+        conn.executemany("INSERT INTO products (name) VALUES (?);", [("Apple",), ("Pear",)])
+    snapshot = CatalogSnapshot(path)
+
+    context = snapshot.context("how many apples?", top_k=10)
+    assert context == "Apple, Pear"
+    assert catalog_version(context) == snapshot.version != ""
+    # Contextos sem versão (busca, fallback) continuam identificados pelo conteúdo
+    assert catalog_version("Apple, Pear") != snapshot.version
+
+    version = snapshot.version
+    with sqlite3.connect(path) as conn:
+        conn.execute("INSERT INTO products (name) VALUES ('Plum');")
+    assert catalog_version(snapshot.context("how many apples?", top_k=10)) != version
@@ -0,0 +1,167 @@
+import sqlite3
+import threading
+
+import pytest
+
+import config
+from model import db_access
+from model.db_access import (BUDGET_EXCEEDED, CARTESIAN_PRODUCT, FULL_SCAN, TIMEOUT,
+                             TOO_MANY_ROWS, ConnectionPool, QueryError, QueryResult,
+                             _ExecutionBudget, query_run, query_stream)
+
+
+@pytest.fixture(autouse=True)
+def isolated(monkeypatch):
+    # Sem cache nem registro: cada teste vê a execução real da query
+    monkeypatch.setattr(config, "QUERY_CACHE_ENABLED", False)
+    monkeypatch.setattr(config, "QUERY_LOG_ENABLED", False)
+    yield
+    db_access.close_pools()
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = str(tmp_path / "shop.db")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT, price REAL);")
+        conn.execute("CREATE TABLE tags (id INTEGER PRIMARY KEY, tag TEXT);")
+        conn.executemany("INSERT INTO items (name, price) VALUES (?, ?);",
+                         [(f"item {i}", i) for i in range(1, 1235)])
+        conn.executemany("INSERT INTO tags (tag) VALUES (?);", [(f"tag {i}",) for i in range(50)])
+    return path
+
+
+# --- ConnectionPool ---
+
+def test_pool_reuses_connections(db):
+    pool = ConnectionPool(db, size=2)
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        assert second is first
+    assert pool._created == 1
+    pool.close()
+
+
+def test_pool_connections_are_read_only(db):
+    pool = ConnectionPool(db, size=1)
+    with pool.connection() as conn:
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("DELETE FROM items;")
+    pool.close()
+
+
+def test_pool_waits_for_a_connection_to_be_returned(db):
+    pool = ConnectionPool(db, size=1)
+    acquired = threading.Event()
+    borrowed = []
+
+    def borrow():
+        with pool.connection() as conn:
+            borrowed.append(conn)
+            acquired.set()
+
+    with pool.connection() as conn:
+        thread = threading.Thread(target=borrow)
+        thread.start()
+        assert not acquired.wait(0.1)
+    thread.join(5)
+    assert borrowed == [conn]
+    pool.close()
+
+
+def test_pool_gives_back_the_slot_when_opening_fails(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "missing.db"), size=1)
+    for _ in range(2):
+        with pytest.raises(sqlite3.OperationalError):
+            with pool.connection():
+                pass
+    assert pool._created == 0
+
+
+def test_closed_pool_refuses_connections_and_closes_borrowed_ones(db):
+    pool = ConnectionPool(db, size=1)
+    with pool.connection() as conn:
+        pool.close()
+    with pytest.raises(sqlite3.ProgrammingError):
+        conn.execute("SELECT 1;")
+    with pytest.raises(sqlite3.ProgrammingError):
+        with pool.connection():
+            pass
+
+
+# --- _check_plan e _ExecutionBudget ---
+
+def test_full_scan_of_a_large_table_is_rejected(db, monkeypatch):
+    monkeypatch.setattr(config, "QUERY_FULL_SCAN_MAX_ROWS", 1000)
+    result = query_run(db, "SELECT name FROM items WHERE price > 3;")
+    assert isinstance(result, QueryError) and result.code == FULL_SCAN
+    # Com LIMIT e sem ordenação a varredura para cedo
+    assert len(query_run(db, "SELECT name FROM items WHERE price > 3 LIMIT 5;")) == 5
+    # A busca pela chave primária não varre a tabela
+    assert query_run(db, "SELECT name FROM items WHERE id = 7;") == [("item 7",)]
+
+
+def test_cartesian_product_is_rejected(db, monkeypatch):
+    monkeypatch.setattr(config, "QUERY_CARTESIAN_MAX_ROWS", 10_000)
+    result = query_run(db, "SELECT i.name, t.tag FROM items i, tags t;")
+    assert isinstance(result, QueryError) and result.code == CARTESIAN_PRODUCT
+    assert "combinations" in result
+
+
+def test_unguarded_queries_skip_the_plan_check(db, monkeypatch):
+    monkeypatch.setattr(config, "QUERY_FULL_SCAN_MAX_ROWS", 10)
+    assert len(query_run(db, "SELECT name FROM items;", guarded=False)) == 1234
+
+
+def test_execution_budget_counts_progress_calls():
+    budget = _ExecutionBudget(max_steps=3000, timeout=60, interval=1000)
+    assert [budget() for _ in range(3)] == [0, 0, 0]
+    assert budget() == 1 and budget.exceeded == BUDGET_EXCEEDED
+
+
+def test_execution_budget_stops_at_the_deadline():
+    budget = _ExecutionBudget(max_steps=10**9, timeout=-1, interval=1000)
+    assert budget() == 1 and budget.exceeded == TIMEOUT
+
+
+def test_expensive_query_is_interrupted(db, monkeypatch):
+    monkeypatch.setattr(config, "QUERY_MAX_VM_STEPS", 100_000)
+    result = query_run(db, "SELECT count(*) FROM items i JOIN tags t ON i.price > t.id;")
+    assert isinstance(result, QueryError) and result.code == BUDGET_EXCEEDED
+    # A conexão volta para o pool sem o progress handler
+    assert query_run(db, "SELECT count(*) FROM tags;") == [(50,)]
+
+
+# --- Paginação do query_stream ---
+
+def test_query_stream_keeps_the_first_rows_and_counts_the_rest(db, monkeypatch):
+    monkeypatch.setattr(config, "QUERY_FETCH_BATCH", 100)
+    result = query_stream(db, "SELECT id, price FROM items LIMIT 5000;", max_rows=10)
+    assert isinstance(result, QueryResult)
+    assert result.columns == ["id", "price"]
+    assert result.rows == [(i, float(i)) for i in range(1, 11)]
+    assert (result.total_rows, result.truncated) == (1234, True)
+    price = result.stats["price"]
+    assert (price.count, price.minimum, price.maximum) == (1234, 1, 1234)
+    assert price.average == pytest.approx(1235 / 2)
+
+
+def test_query_stream_without_kept_rows(db, monkeypatch):
+    monkeypatch.setattr(config, "QUERY_FETCH_BATCH", 7)
+    result = query_stream(db, "SELECT name FROM items LIMIT 5000;", max_rows=0)
+    assert (result.rows, result.total_rows) == ([], 1234)
+    # Colunas sem números não têm estatísticas
+    assert result.stats == {}
+
+
+def test_query_stream_small_result_is_not_truncated(db):
+    result = query_stream(db, "SELECT tag FROM tags WHERE id <= 3;", max_rows=10)
+    assert (len(result.rows), result.total_rows, result.truncated) == (3, 3, False)
+
+
+def test_query_stream_rejects_too_many_rows(db, monkeypatch):
+    monkeypatch.setattr(config, "QUERY_MAX_OUTPUT_ROWS", 1000)
+    monkeypatch.setattr(config, "QUERY_FETCH_BATCH", 100)
+    result = query_stream(db, "SELECT id FROM items LIMIT 5000;", max_rows=10)
+    assert isinstance(result, QueryError) and result.code == TOO_MANY_ROWS
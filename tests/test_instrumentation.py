@@ -0,0 +1,36 @@
+import pytest
+
+from controller.scheduler import Superseded
+from instrumentation import ANSWER_PATHS, STAGE_ERRORS, span
+
+
+def stage_errors(stage):
+    return sum(item["value"] for item in STAGE_ERRORS.snapshot()
+               if item["labels"]["stage"] == stage)
+
+
+def test_span_counts_stage_errors():
+    with pytest.raises(ValueError):
+        with span("test.failing"):
+            raise ValueError("boom")
+    assert stage_errors("test.failing") == 1
+
+
+def test_span_does_not_count_superseded_requests():
+    with pytest.raises(Superseded):
+        with span("test.superseded"):
+            raise Superseded("newer message")
+    assert stage_errors("test.superseded") == 0
+
+
+def test_answer_paths_are_exported_as_a_metric():
+    from controller.result_formatter import format_result, path_counts
+    from model.db_access import QueryResult
+
+    before = path_counts()
+    format_result("SELECT COUNT(*) FROM products;", QueryResult(["COUNT(*)"], [(3,)], 1), 20)
+    format_result("SELECT a, b, c FROM t;", QueryResult(["a", "b", "c"], [], 0), 20)
+    after = path_counts()
+    changed = {path: after[path] - before.get(path, 0) for path in after}
+    assert sum(changed.values()) == 2
+    assert after == {item["labels"]["path"]: item["value"] for item in ANSWER_PATHS.snapshot()}
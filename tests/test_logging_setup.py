@@ -0,0 +1,29 @@
+import threading
+
+from logging_setup import preview
+
+
+def test_preview_limits_do_not_leak_between_calls():
+    value = ["x" * 200, ("y" * 200,)]
+    expected = str(preview(value, 400))
+    str(preview(value, 40))
+    assert str(preview(value, 400)) == expected
+    assert "x" * 40 in expected
+
+
+def test_preview_is_consistent_across_threads():
+    value = {"rows": ["z" * 500] * 3}
+    expected = {limit: str(preview(value, limit)) for limit in (80, 2000)}
+    mismatches = []
+
+    def render(limit):
+        for _ in range(500):
+            if str(preview(value, limit)) != expected[limit]:
+                mismatches.append(limit)
+
+    threads = [threading.Thread(target=render, args=(limit,)) for limit in (80, 2000) * 4]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not mismatches
@@ -0,0 +1,46 @@
+import os
+
+import config
+from controller.prompts import PromptRegistry
+
+
+def render_query_prompt(combined_answer):
+    registry = PromptRegistry(reload_interval=0)
+    sections = (config.PROMPT_COMBINED_ANSWER_FILE,) if combined_answer else ()
+    registry.register("generate_query", config.PROMPT_QUERY_GENERATION_FILE,
+                      required=("product_list",), sections=sections)
+    return registry.get("generate_query").render_split(product_list="Apple, Mouse")
+
+
+def test_query_prompt_without_combined_answer():
+    prefix, rest = render_query_prompt(combined_answer=False)
+    with open(config.PROMPT_QUERY_GENERATION_FILE, encoding="utf-8") as f:
+        assert prefix + rest == f.read().strip().replace("{product_list}", "Apple, Mouse")
+    assert "database_answer" not in prefix
+
+
+def test_query_prompt_with_combined_answer():
+    prefix, rest = render_query_prompt(combined_answer=True)
+
+    # A seção entra na parte estática, antes da lista de produtos
+    assert '"database_answer"' in prefix
+    assert prefix.index("### COMBINED ANSWER") < prefix.index("### AVAILABLE PRODUCTS")
+    assert rest == "Available products: Apple, Mouse"
+    # O prompt base não limita as ações ou as chaves a um número fixo
+    assert "two keys" not in prefix
+    assert "two values" not in prefix
+
+
+def test_prompt_is_reloaded_when_a_section_changes(tmp_path):
+    base = tmp_path / "base.prompt"
+    section = tmp_path / "section.prompt"
+    base.write_text("Intro\n\n### DATA\nItems: {product_list}", encoding="utf-8")
+    section.write_text("### EXTRA\nfirst", encoding="utf-8")
+    registry = PromptRegistry(reload_interval=0)
+    registry.register("test", str(base), required=("product_list",), sections=(str(section),))
+    assert "first" in registry.get("test").prefix
+
+    section.write_text("### EXTRA\nsecond", encoding="utf-8")
+    mtime = base.stat().st_mtime + 10
+    os.utime(section, (mtime, mtime))
+    assert "second" in registry.get("test").prefix
@@ -0,0 +1,67 @@
+import sqlite3
+
+import pytest
+
+from model import db_access
+from model.result_cache import ResultCache, canonical_query, is_deterministic
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = str(tmp_path / "products.db")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE products (name TEXT, quantity INTEGER);")
+        conn.executemany("INSERT INTO products VALUES (?, ?);", [("Apple", 3), ("Pear", 5)])
+    db_access.result_cache.clear()
+    yield path
+    db_access.result_cache.clear()
+
+
+def test_canonical_query_ignores_function_and_name_case():
+    assert canonical_query("SELECT COUNT(*) FROM Products;") == \
+        canonical_query("select count(*) from products")
+    assert canonical_query("SELECT Quantity FROM products WHERE Name == 'Apple'") == \
+        canonical_query("SELECT quantity FROM PRODUCTS WHERE name = 'Apple';")
+
+
+def test_canonical_query_keeps_literals_and_quoted_names():
+    assert canonical_query("SELECT 1 FROM t WHERE name = 'Apple'") != \
+        canonical_query("SELECT 1 FROM t WHERE name = 'apple'")
+    assert canonical_query('SELECT "Name" FROM t') != canonical_query('SELECT "name" FROM t')
+
+
+@pytest.mark.parametrize("query", [
+    "SELECT name FROM products ORDER BY random() LIMIT 1;",
+    "SELECT date('now');",
+    "SELECT * FROM orders WHERE created_at > datetime('NOW', '-1 day');",
+    "SELECT CURRENT_TIMESTAMP;",
+    "SELECT current_date;",
+])
+def test_non_deterministic_queries(query):
+    assert not is_deterministic(query)
+
+
+def test_deterministic_queries():
+    assert is_deterministic("SELECT date('2024-01-01', '+1 day');")
+    assert is_deterministic("SELECT name FROM products WHERE name = 'nowhere';")
+
+
+def test_query_stream_shares_entries_across_case(db):
+    first = db_access.query_stream(db, "SELECT COUNT(*) FROM products;")
+    second = db_access.query_stream(db, "select count(*) from PRODUCTS")
+    assert second is first
+    assert db_access.result_cache.stats()["entries"] == 1
+
+
+def test_query_stream_does_not_cache_non_deterministic_queries(db):
+    for query in ("SELECT name FROM products ORDER BY random() LIMIT 1;",
+                  "SELECT date('now');", "SELECT CURRENT_TIMESTAMP;"):
+        first = db_access.query_stream(db, query)
+        second = db_access.query_stream(db, query)
+        assert second is not first
+    assert db_access.result_cache.stats()["entries"] == 0
+
+
+def test_make_key_uses_the_canonical_query():
+    assert ResultCache.make_key("db", "SELECT COUNT(*) FROM t", "stream") == \
+        ResultCache.make_key("db", "select count(*) from t;", "stream")
@@ -0,0 +1,113 @@
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+from controller.router import AllBackendsFailed, Backend, ProviderRouter
+
+STUB_OLLAMA = os.path.join(os.path.dirname(__file__), os.pardir, "bench", "stub_ollama.py")
+
+
+def make_router(*providers, hedge_delay=0.1):
+    return ProviderRouter(
+        [Backend(provider, window_size=50) for provider in providers],
+        hedge_percentile=95, hedge_min_delay=hedge_delay, hedge_default_delay=hedge_delay,
+        error_rate_threshold=0.5)
+
+
+def valid_action(action):
+    return isinstance(action, dict) and not action.get("error")
+
+
+# --- Stub do Ollama (bench/stub_ollama.py) ---
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def stub_ollama():
+    pytest.importorskip("ollama")
+    processes = []
+
+    def start(*options):
+        port = _free_port()
+        process = subprocess.Popen(
+            [sys.executable, STUB_OLLAMA, "--port", str(port), "--chunk-interval", "0", *options],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        processes.append(process)
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.05)
+        from controller.ai_ollama import OllamaProvider
+        return OllamaProvider(f"http://127.0.0.1:{port}")
+
+    yield start
+    for process in processes:
+        process.terminate()
+        process.wait()
+
+
+def test_slow_stub_is_hedged_on_the_next_one(stub_ollama):
+    slow = stub_ollama("--latency", "2")
+    fast = stub_ollama("--latency", "0.01")
+    router = make_router(slow, fast)
+
+    start = time.perf_counter()
+    action = router.call("generate_action", valid_action, "how many mice?", "Mouse")
+
+    assert action["action"] == "database_query"
+    assert time.perf_counter() - start < 1.5
+    assert router.stats()[fast.name]["samples"] == 1
+
+
+def test_failing_stub_fails_over_to_the_next_one(stub_ollama):
+    failing = stub_ollama("--error-rate", "1", "--latency", "0")
+    healthy = stub_ollama("--latency", "0")
+    router = make_router(failing, healthy, hedge_delay=5)
+
+    action = router.call("generate_action", valid_action, "how many mice?", "Mouse")
+    assert action["action"] == "database_query"
+    assert router.stats()[failing.name]["error_rate"] == 1.0
+
+    text = "".join(router.stream("stream_feedback", "SELECT 1;", "42"))
+    assert "Mouse" in text
+    # O backend com erros fica por último
+    assert [backend.name for backend in router.ordered()] == [healthy.name, failing.name]
+
+
+def test_all_stubs_failing_raises(stub_ollama):
+    router = make_router(stub_ollama("--error-rate", "1", "--latency", "0"))
+    with pytest.raises(AllBackendsFailed):
+        router.call("generate_action", valid_action, "how many mice?", "Mouse")
+
+
+# --- Janelas de latência ---
+
+class StreamingProvider:
+    name = "streaming"
+
+    def stream_feedback(self, query, result):
+        time.sleep(0.05)
+        yield "ok"
+
+
+def test_stream_first_chunk_is_kept_out_of_the_hedge_window():
+    router = make_router(StreamingProvider())
+    assert list(router.stream("stream_feedback", "SELECT 1;", "1")) == ["ok"]
+
+    stats = router.stats()["streaming"]
+    assert stats["samples"] == 0
+    assert stats["p95"] is None
+    assert stats["first_chunk_p50"] >= 0.05
@@ -0,0 +1,111 @@
+import asyncio
+
+from controller.scheduler import RequestScheduler, SingleFlight
+
+
+def _counting_source(closed):
+    def source():
+        try:
+            for i in range(5):
+                yield str(i)
+        finally:
+            closed.append(True)
+    return source
+
+
+def test_stream_reader_leaving_early_closes_source():
+    flight, closed = SingleFlight("test"), []
+    reader = flight.stream("key", _counting_source(closed))
+    assert next(reader) == "0"
+    reader.close()
+
+    assert closed == [True]
+    assert flight._streams == {}
+    # Uma chamada posterior com a mesma chave recebe o stream completo
+    assert list(flight.stream("key", _counting_source(closed))) == ["0", "1", "2", "3", "4"]
+
+
+def test_stream_keeps_serving_the_remaining_readers():
+    flight, closed = SingleFlight("test"), []
+    first = flight.stream("key", _counting_source(closed))
+    second = flight.stream("key", _counting_source(closed))
+    assert next(first) == "0"
+    first.close()
+
+    assert closed == []
+    assert list(second) == ["0", "1", "2", "3", "4"]
+    assert closed == [True]
+    assert flight._streams == {}
+
+
+def test_newer_message_supersedes_older_one():
+    scheduler = RequestScheduler(window=5, rate=10, burst=10)
+    older = scheduler.arrive(1, 10)
+    newer = scheduler.arrive(1, 11)
+
+    assert older.superseded
+    assert not newer.superseded
+
+
+def test_older_message_arriving_late_is_superseded():
+    scheduler = RequestScheduler(window=5, rate=10, burst=10)
+    newer = scheduler.arrive(1, 11)
+    older = scheduler.arrive(1, 10)
+
+    assert older.superseded
+    assert not newer.superseded
+
+
+def test_older_message_arriving_after_newer_one_finished_is_superseded():
+    scheduler = RequestScheduler(window=5, rate=10, burst=10)
+    with scheduler.running(scheduler.arrive(1, 11)):
+        pass
+    assert scheduler.arrive(1, 10).superseded
+
+
+def test_messages_of_other_chats_are_independent():
+    scheduler = RequestScheduler(window=5, rate=10, burst=10)
+    first = scheduler.arrive(1, 10)
+    scheduler.arrive(2, 11)
+    assert not first.superseded
+
+
+def _counting_async_source(closed):
+    async def source():
+        try:
+            for i in range(5):
+                await asyncio.sleep(0.02)
+                yield str(i)
+        finally:
+            closed.append(True)
+    return source
+
+
+def test_async_stream_reader_leaving_early_closes_source():
+    async def scenario():
+        flight, closed = SingleFlight("test"), []
+        reader = flight.stream_async("key", _counting_async_source(closed))
+        assert await reader.__anext__() == "0"
+        await reader.aclose()
+        await asyncio.sleep(0.01)
+
+        assert closed == [True]
+        assert flight._streams == {}
+        chunks = [chunk async for chunk in flight.stream_async("key", _counting_async_source(closed))]
+        assert chunks == ["0", "1", "2", "3", "4"]
+
+    asyncio.run(scenario())
+
+
+def test_async_stream_keeps_serving_the_remaining_readers():
+    async def scenario():
+        flight, closed = SingleFlight("test"), []
+        first = flight.stream_async("key", _counting_async_source(closed))
+        second = flight.stream_async("key", _counting_async_source(closed))
+        assert await first.__anext__() == "0"
+        await first.aclose()
+
+        assert [chunk async for chunk in second] == ["0", "1", "2", "3", "4"]
+        assert closed == [True]
+
+    asyncio.run(scenario())
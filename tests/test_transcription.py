@@ -0,0 +1,93 @@
+import sys
+import threading
+import time
+import types
+from concurrent.futures import Future
+
+import pytest
+
+from controller.transcription import TranscriptionService
+
+
+class FakeWhisper:
+    """faster_whisper falso: a carga espera `release` e falha enquanto `fail` estiver ativo."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.fail = False
+        self.loads = 0
+        fake = self
+
+        class WhisperModel:
+            def __init__(self, *args, **kwargs):
+                fake.loads += 1
+                fake.release.wait(5)
+                if fake.fail:
+                    raise RuntimeError("model download failed")
+
+            def transcribe(self, audio, **kwargs):
+                return [types.SimpleNamespace(text=audio.decode())], None
+
+        self.module = types.SimpleNamespace(
+            WhisperModel=WhisperModel, decode_audio=lambda data, sampling_rate: data.read())
+
+
+@pytest.fixture
+def whisper(monkeypatch):
+    fake = FakeWhisper()
+    monkeypatch.setitem(sys.modules, "faster_whisper", fake.module)
+    yield fake
+    fake.release.set()
+
+
+def make_service(**kwargs):
+    return TranscriptionService("tiny", workers=1, cpu_threads=1, queue_size=4, **kwargs)
+
+
+def test_loading_status_until_the_model_is_ready(whisper):
+    app = pytest.importorskip("app")
+    service = make_service()
+
+    future, position = service.submit(b"hello")
+    assert (position, service.ready) == (0, False)
+    assert app.transcription_status(position, loading=not service.ready).startswith(
+        "⏳ Carregando")
+
+    whisper.release.set()
+    assert future.result(timeout=5).text == "hello"
+    assert service.wait_ready(5) and service.ready
+    service.stop()
+
+
+def test_queued_jobs_fail_with_the_load_error(whisper):
+    whisper.fail = True
+    service = make_service()
+    jobs = [service.submit(b"hello")[0] for _ in range(3)]
+
+    whisper.release.set()
+    for job in jobs:
+        with pytest.raises(RuntimeError, match="model download failed"):
+            job.result(timeout=5)
+    assert service.depth == 0
+    assert not service.ready
+    # Antes do intervalo de nova tentativa, o erro é devolvido na hora
+    with pytest.raises(RuntimeError, match="model download failed"):
+        service.submit(b"hello")
+    assert whisper.loads == 1
+
+
+def test_load_is_retried_after_the_backoff(whisper):
+    whisper.fail = True
+    whisper.release.set()
+    service = make_service(load_retry=0.1)
+    with pytest.raises(RuntimeError):
+        service.submit(b"hello")[0].result(timeout=5)
+
+    whisper.fail = False
+    time.sleep(0.15)
+    future, _ = service.submit(b"again")
+    assert isinstance(future, Future)
+    assert future.result(timeout=5).text == "again"
+    assert whisper.loads == 2
+    assert service.wait_ready(5) and service.ready
+    service.stop()
@@ -0,0 +1,104 @@
+import json
+import os
+import threading
+import urllib.error
+import urllib.request
+from collections import defaultdict
+
+import pytest
+
+from controller.webhook import SECRET_HEADER, ChatDispatcher, WebhookServer, chat_key
+
+SAMPLE_UPDATES = os.path.join(
+    os.path.dirname(__file__), os.pardir, "bench", "updates", "sample_updates.json")
+SECRET = "test-secret"
+
+
+class FakeBot:
+    """Registra as atualizações processadas por chat; pode segurar os workers."""
+
+    def __init__(self):
+        self.processed = defaultdict(list)
+        self.release = threading.Event()
+        self.release.set()
+        self._lock = threading.Lock()
+
+    def process(self, update):
+        self.release.wait(5)
+        with self._lock:
+            self.processed[chat_key(update)].append(update["update_id"])
+
+
+@pytest.fixture
+def webhook():
+    servers = []
+
+    def start(bot, workers=4, queue_size=100, on_update=None):
+        dispatcher = ChatDispatcher(bot.process, workers, queue_size)
+        dispatcher.start()
+        server = WebhookServer(("127.0.0.1", 0), "/telegram", SECRET, dispatcher, on_update)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server, f"http://127.0.0.1:{server.server_port}/telegram"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+        server.dispatcher.stop()
+
+
+def post(url, update, secret=SECRET):
+    request = urllib.request.Request(
+        url, data=json.dumps(update).encode("utf-8"), method="POST",
+        headers={"Content-Type": "application/json", SECRET_HEADER: secret})
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def sample_updates(repeat=1):
+    with open(SAMPLE_UPDATES, encoding="utf-8") as f:
+        recorded = json.load(f)
+    return [dict(update, update_id=number)
+            for number, update in enumerate(recorded * repeat)]
+
+
+def test_updates_of_each_chat_are_processed_in_order(webhook):
+    bot = FakeBot()
+    server, url = webhook(bot)
+    updates = sample_updates(repeat=10)
+
+    assert [post(url, update) for update in updates] == [200] * len(updates)
+    server.dispatcher.stop()
+
+    expected = defaultdict(list)
+    for update in updates:
+        expected[chat_key(update)].append(update["update_id"])
+    assert dict(bot.processed) == dict(expected)
+
+
+def test_invalid_secret_is_refused(webhook):
+    bot, accepted = FakeBot(), []
+    server, url = webhook(bot, on_update=accepted.append)
+    update = sample_updates()[0]
+
+    assert post(url, update, secret="wrong") == 403
+    server.dispatcher.stop()
+    assert accepted == []
+    assert not bot.processed
+
+
+def test_full_queue_answers_503_without_registering_the_update(webhook):
+    bot, accepted = FakeBot(), []
+    bot.release.clear()
+    server, url = webhook(bot, workers=1, queue_size=2, on_update=accepted.append)
+    updates = sample_updates()[:3]
+
+    statuses = [post(url, update) for update in updates]
+    bot.release.set()
+
+    assert statuses == [200, 200, 503]
+    assert [update["update_id"] for update in accepted] == [0, 1]